@@ -13,7 +13,7 @@ https://docs.djangoproject.com/en/2.2/ref/settings/
 import os
 import datetime
 import cloudinary
-from decouple import config
+from decouple import config, Csv
 
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
@@ -46,13 +46,16 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'airtechapi.middleware.ServerTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'airtechapi.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'airtechapi.middleware.ReplicaRoutingMiddleware',
 ]
 
 ROOT_URLCONF = 'airtech.urls'
@@ -86,10 +89,82 @@ DATABASES = {
         'USER': config('USER'),
         'PASSWORD': config('PASSWORD'),
         'HOST': config('HOST'),
-        'PORT': config('PORT', cast=int)
+        'PORT': config('PORT', cast=int),
+        'CONN_MAX_AGE': config('CONN_MAX_AGE', default=0, cast=int)
     }
 }
 
+# Read replicas
+# DATABASE_REPLICA_HOSTS lists replicas of the default database as
+# host[:port] entries; they become the aliases replica_0, replica_1, ...
+# Safe requests to catalog views read from them in turn, except for
+# clients that wrote in the last REPLICA_PIN_SECONDS. Connection reuse
+# is set per alias with <ALIAS>_CONN_MAX_AGE, e.g. REPLICA_0_CONN_MAX_AGE,
+# and defaults to CONN_MAX_AGE.
+
+DATABASE_REPLICAS = []
+for index, replica_host in enumerate(config('DATABASE_REPLICA_HOSTS', default='', cast=Csv())):
+    alias = 'replica_{}'.format(index)
+    host, _, port = replica_host.partition(':')
+    DATABASES[alias] = dict(
+        DATABASES['default'],
+        HOST=host,
+        PORT=int(port) if port else DATABASES['default']['PORT'],
+        CONN_MAX_AGE=config(alias.upper() + '_CONN_MAX_AGE', default=DATABASES['default']['CONN_MAX_AGE'], cast=int),
+        TEST={'MIRROR': 'default'}
+    )
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['airtechapi.routers.ReplicaRouter']
+REPLICA_PIN_SECONDS = config('REPLICA_PIN_SECONDS', default=5, cast=int)
+
+
+# Cache
+# https://docs.djangoproject.com/en/2.2/topics/cache/
+# The catalog cache holds rendered flight payloads. Any django.core.cache
+# backend works, e.g. FileBasedCache with a directory as the location or a
+# Redis-backed cache for a cache shared between servers.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'catalog': {
+        'BACKEND': config('CATALOG_CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CATALOG_CACHE_LOCATION', default='airtech-catalog'),
+        'TIMEOUT': config('CATALOG_CACHE_TIMEOUT', default=300, cast=int),
+    }
+}
+
+
+# Response compression
+# Responses of at least COMPRESSION_MIN_SIZE bytes with one of the
+# COMPRESSION_CONTENT_TYPES are sent with brotli or gzip, as the client
+# accepts.
+
+COMPRESSION_MIN_SIZE = config('COMPRESSION_MIN_SIZE', default=1024, cast=int)
+COMPRESSION_CONTENT_TYPES = config(
+    'COMPRESSION_CONTENT_TYPES',
+    default='application/json,application/vnd.airtech.columnar+json,application/msgpack,text/html',
+    cast=Csv()
+)
+COMPRESSION_GZIP_LEVEL = config('COMPRESSION_GZIP_LEVEL', default=6, cast=int)
+COMPRESSION_BROTLI_QUALITY = config('COMPRESSION_BROTLI_QUALITY', default=5, cast=int)
+
+
+# Password hashing
+# Raising or lowering PASSWORD_HASH_ITERATIONS sets the CPU cost of a login;
+# stored hashes are upgraded to it as their users log in.
+
+PASSWORD_HASH_ITERATIONS = config('PASSWORD_HASH_ITERATIONS', default=150000, cast=int)
+
+PASSWORD_HASHERS = [
+    'airtechapi.utils.hashers.ConfigurablePBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+]
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -132,10 +207,15 @@ STATIC_URL = '/static/'
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework.authentication.SessionAuthentication',
-        'rest_framework_jwt.authentication.JSONWebTokenAuthentication',
-    )
+        'airtechapi.authentication.CachedJSONWebTokenAuthentication',
+    ),
 }
 
+# Rows per page of the cursor paginated flight and booking lists, when
+# the client does not ask for a ?page_size=
+
+CATALOG_PAGE_SIZE = config('PAGE_SIZE', default=50, cast=int)
+
 JWT_AUTH = {
     'JWT_ENCODE_HANDLER':
     'rest_framework_jwt.utils.jwt_encode_handler',
@@ -144,7 +224,7 @@ JWT_AUTH = {
     'rest_framework_jwt.utils.jwt_decode_handler',
 
     'JWT_PAYLOAD_HANDLER':
-    'rest_framework_jwt.utils.jwt_payload_handler',
+    'airtechapi.utils.helpers.jwt_payload_handler',
 
     'JWT_PAYLOAD_GET_USER_ID_HANDLER':
     'rest_framework_jwt.utils.jwt_get_user_id_from_payload_handler',
@@ -162,6 +242,57 @@ JWT_AUTH = {
     'JWT_SECRET_KEY': config('SECRET_KEY')
 }
 
+# Authenticated users are cached per process for the lifetime of their
+# token, capped at AUTH_USER_CACHE_TTL seconds.
+
+AUTH_USER_CACHE_SIZE = config('AUTH_USER_CACHE_SIZE', default=10000, cast=int)
+AUTH_USER_CACHE_TTL = config('AUTH_USER_CACHE_TTL', default=300, cast=int)
+
+# Passport uploads
+# Scans are spooled to PASSPORT_SPOOL_DIR and handed to the storage backend
+# by the process_passport_uploads worker.
+
+PASSPORT_STORAGE_BACKEND = config('PASSPORT_STORAGE_BACKEND', default='airtechapi.storage.CloudinaryPassportStorage')
+PASSPORT_SPOOL_DIR = config('PASSPORT_SPOOL_DIR', default=os.path.join(BASE_DIR, 'spool', 'passports'))
+PASSPORT_STORAGE_ROOT = config('PASSPORT_STORAGE_ROOT', default=os.path.join(BASE_DIR, 'media', 'passports'))
+PASSPORT_STORAGE_URL = config('PASSPORT_STORAGE_URL', default='http://localhost:8000/media/passports/')
+PASSPORT_UPLOAD_MAX_ATTEMPTS = config('PASSPORT_UPLOAD_MAX_ATTEMPTS', default=3, cast=int)
+PASSPORT_UPLOAD_MAX_SIZE = config('PASSPORT_UPLOAD_MAX_SIZE', default=10 * 1024 * 1024, cast=int)
+
+# Flight status events
+# Status changes are pushed to subscribers of flight/<pk>/events and
+# flight/events/ through FLIGHT_EVENT_BROKER. The local broker only reaches
+# subscribers connected to the same process.
+
+FLIGHT_EVENT_BROKER = config('FLIGHT_EVENT_BROKER', default='airtechapi.events.LocalFlightEventBroker')
+FLIGHT_EVENT_HEARTBEAT = config('FLIGHT_EVENT_HEARTBEAT', default=15, cast=int)
+FLIGHT_EVENT_MAX_PENDING = config('FLIGHT_EVENT_MAX_PENDING', default=20, cast=int)
+
+# Request timing
+# SERVER_TIMING_SAMPLE_RATE of the requests (0 to 1) get a Server-Timing
+# header and a JSON log line on the airtechapi.timing logger. Requests that
+# ran one statement SERVER_TIMING_REPEATED_QUERIES times are logged as
+# warnings.
+
+SERVER_TIMING_SAMPLE_RATE = config('SERVER_TIMING_SAMPLE_RATE', default=0.0, cast=float)
+SERVER_TIMING_REPEATED_QUERIES = config('SERVER_TIMING_REPEATED_QUERIES', default=5, cast=int)
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'airtechapi.timing': {
+            'handlers': ['console'],
+            'level': config('SERVER_TIMING_LOG_LEVEL', default='INFO'),
+        },
+    },
+}
+
 cloudinary.config(
     cloud_name=config('cloud_name'),
     api_key=config('api_key', cast=int),
@@ -1,3 +1,128 @@
-from django.contrib import admin
+from django import forms
+from django.contrib import admin, messages
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.http import HttpResponseRedirect
+from .models import Booking, Flight, Profile
+from .pagination import EstimatedCountPaginator
+from .utils.inventory import move_seats, release_seats, reserve_seats
+from .utils.status import apply_status_updates
 
-# Register your models here.
+NOT_ENOUGH_SEATS = 'There are not enough seats left on this flight'
+
+
+def status_action(flight_status, label):
+    def action(modeladmin, request, queryset):
+        # one SELECT of the selected flights and one UPDATE of those whose status changes
+        report = apply_status_updates([
+            {'flight_number': flight_number, 'flight_status': flight_status}
+            for flight_number in queryset.order_by().values_list('flight_number', flat=True)
+        ])
+        modeladmin.message_user(request, '{} flights marked {}, {} already were.'.format(
+            report['updated'], label, report['unchanged']))
+    action.__name__ = 'mark_{}'.format(label.lower().replace('-', '_'))
+    action.short_description = 'Mark selected flights {}'.format(label)
+    return action
+
+
+class ScalableModelAdmin(admin.ModelAdmin):
+    """
+    Changelist defaults for tables that grow without bound: no exact
+    COUNT(*) of the unfiltered table, and no second count of the whole
+    table next to a filtered one.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+@admin.register(Flight)
+class FlightAdmin(ScalableModelAdmin):
+    list_display = (
+        'flight_number', 'origin', 'destination', 'departure', 'airline', 'flight_status', 'price',
+        'capacity', 'booked_tickets', 'booking_count',
+    )
+    # the choices and date filters run no query, airline reads the (airline, departure) index
+    list_filter = ('flight_status', 'airline', 'departure')
+    search_fields = ('=flight_number',)
+    readonly_fields = ('booked_tickets', 'booking_count', 'created_at', 'modified_at')
+    actions = [status_action(flight_status, label) for flight_status, label in Flight.FLIGHT_STATUS]
+
+
+class BookingAdminForm(forms.ModelForm):
+    class Meta:
+        model = Booking
+        fields = '__all__'
+
+    def clean(self):
+        data = super().clean()
+        flight = data.get('flight')
+        tickets = data.get('number_of_tickets')
+        if flight is None or tickets is None:
+            return data
+        # the admin saves in the transaction it validates in, so the lock
+        # keeps these seats free until BookingAdmin.save_model takes them.
+        # Both flights of a move are locked in primary key order, like
+        # move_seats updates them.
+        locked = Flight.objects.select_for_update().filter(
+            pk__in={flight.pk, self.instance.flight_id or flight.pk}
+        ).order_by('pk')
+        flight = {locked_flight.pk: locked_flight for locked_flight in locked}[flight.pk]
+        held = tickets if self.instance.pk is None or self.instance.flight_id != flight.pk else (
+            tickets - self.instance.number_of_tickets
+        )
+        if held > flight.seats_remaining:
+            raise forms.ValidationError(NOT_ENOUGH_SEATS)
+        return data
+
+
+@admin.register(Booking)
+class BookingAdmin(ScalableModelAdmin):
+    """
+    Bookings change the seat counters of their flights here as they do
+    through the booking endpoints.
+    """
+    form = BookingAdminForm
+    list_display = ('id', 'flight', 'passenger', 'number_of_tickets', 'created_at')
+    list_select_related = ('flight', 'passenger')
+    autocomplete_fields = ('flight',)
+    raw_id_fields = ('passenger',)
+    readonly_fields = ('created_at', 'modified_at')
+
+    def changeform_view(self, request, object_id=None, form_url='', extra_context=None):
+        try:
+            return super().changeform_view(request, object_id, form_url, extra_context)
+        except ValidationError as error:
+            # raised by save_model, the admin's transaction is rolled back
+            for message in error.messages:
+                self.message_user(request, message, messages.ERROR)
+            return HttpResponseRedirect(request.get_full_path())
+
+    def save_model(self, request, obj, form, change):
+        with transaction.atomic():
+            if change:
+                old_flight_id, old_tickets = Booking.objects.select_for_update().values_list(
+                    'flight_id', 'number_of_tickets').get(pk=obj.pk)
+                reserved = move_seats(old_flight_id, old_tickets, obj.flight_id, obj.number_of_tickets)
+            else:
+                reserved = reserve_seats(obj.flight_id, obj.number_of_tickets, bookings=1)
+            # clean() checked the seats under a lock, but an overbooking is never saved on that alone
+            if not reserved:
+                raise ValidationError(NOT_ENOUGH_SEATS)
+            obj.save()
+
+    def delete_model(self, request, obj):
+        self.delete_queryset(request, Booking.objects.filter(pk=obj.pk))
+
+    def delete_queryset(self, request, queryset):
+        with transaction.atomic():
+            reserved = list(queryset.select_for_update().values_list('pk', 'flight_id', 'number_of_tickets'))
+            Booking.objects.filter(pk__in=[pk for pk, _, _ in reserved]).delete()
+            for _, flight_id, tickets in reserved:
+                release_seats(flight_id, tickets, bookings=1)
+
+
+@admin.register(Profile)
+class ProfileAdmin(ScalableModelAdmin):
+    list_display = ('user', 'passport_url')
+    list_select_related = ('user',)
+    raw_id_fields = ('user',)
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class AirtechapiConfig(AppConfig):
     name = 'airtechapi'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,47 @@
+import copy
+import time
+from django.conf import settings
+from django.utils.translation import ugettext as _
+from rest_framework import exceptions
+from rest_framework_jwt.authentication import JSONWebTokenAuthentication
+from rest_framework_jwt.settings import api_settings
+from .timing import measured
+from .utils.denylist import token_denylist
+from .utils.lru import LRUCache
+
+jwt_get_username_from_payload = api_settings.JWT_PAYLOAD_GET_USERNAME_HANDLER
+
+user_cache = LRUCache(maxsize=settings.AUTH_USER_CACHE_SIZE)
+
+
+def invalidate_cached_user(pk):
+    user_cache.delete(pk)
+
+
+class CachedJSONWebTokenAuthentication(JSONWebTokenAuthentication):
+    """
+    JSONWebTokenAuthentication that remembers the user behind each token.
+
+    Users are kept per process in a bounded LRU, keyed by the user id in
+    the token, until the token expires or at most AUTH_USER_CACHE_TTL
+    seconds. Saving or deleting a user evicts them from this process at
+    once; the TTL bounds how long other processes may serve the old row.
+    Tokens of revoked sessions are refused.
+    """
+    def authenticate(self, request):
+        return measured('auth', super().authenticate, request)
+
+    def authenticate_credentials(self, payload):
+        if token_denylist.is_revoked(payload):
+            raise exceptions.AuthenticationFailed(_('Token has been revoked.'))
+
+        user_id = payload.get('user_id', None)
+        user = user_cache.get(user_id) if user_id is not None else None
+        if user is not None and user.get_username() == jwt_get_username_from_payload(payload):
+            return copy.copy(user)
+
+        user = super().authenticate_credentials(payload)
+        ttl = min(payload.get('exp', 0) - time.time(), settings.AUTH_USER_CACHE_TTL)
+        if user.pk == user_id and ttl > 0:
+            user_cache.set(user_id, copy.copy(user), ttl)
+        return user
@@ -0,0 +1,183 @@
+import hashlib
+import threading
+import time
+import uuid
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework.response import Response
+from .routers import get_read_alias, set_read_alias
+
+CATALOG_CACHE_ALIAS = 'catalog'
+
+
+class CatalogCache:
+    """
+    Cache of rendered flight catalog payloads.
+
+    Any Django cache backend can hold the entries (local memory and file
+    based caches ship with Django, Redis-compatible stores plug in through
+    the same `django.core.cache` interface). Detail entries are deleted
+    per flight; list entries are keyed by a generation token that is
+    replaced whenever any flight changes. A short `add()` lock lets only
+    one worker render a missing entry while the others wait for it.
+    """
+    generation_key = 'flight:list:generation'
+    lock_timeout = 5
+    lock_poll_interval = 0.01
+
+    def __init__(self, alias=CATALOG_CACHE_ALIAS):
+        self.alias = alias
+        self.hits = 0
+        self.misses = 0
+        self._counter_lock = threading.Lock()
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def list_key(self, request):
+        return self._request_key('list', request)
+
+    def detail_key(self, pk):
+        return 'flight:detail:{}'.format(pk)
+
+    def compressed_key(self, entry, content_type, encoding):
+        """
+        Key of a compressed rendering of the cache entry `entry`. Entries
+        get a new id whenever they are rendered again, so compressed
+        copies of invalidated entries are never served and just expire.
+        """
+        digest = hashlib.md5(content_type.encode('utf-8')).hexdigest()
+        return 'flight:compressed:{}:{}:{}'.format(entry, digest, encoding)
+
+    def variant_key(self, request):
+        """
+        Key of a detail payload trimmed by `?fields=` or `?exclude=`, or
+        extended by `?include=`. Like list entries, variants are dropped
+        with the generation token.
+        """
+        return self._request_key('variant', request)
+
+    def _request_key(self, kind, request):
+        generation = self.cache.get(self.generation_key)
+        if generation is None:
+            self.cache.add(self.generation_key, uuid.uuid4().hex, None)
+            generation = self.cache.get(self.generation_key)
+        url = hashlib.md5(request.build_absolute_uri().encode('utf-8')).hexdigest()
+        return 'flight:{}:{}:{}'.format(kind, generation, url)
+
+    def get_or_set(self, key, render):
+        """
+        Return `(value, hit)` for the key, rendering and storing the value
+        on a miss. Concurrent misses wait for the worker holding the lock
+        instead of all rendering the same payload; a waiter that gets the
+        stored value counts as a hit, like the X-Cache header says.
+        """
+        value = self.cache.get(key)
+        if value is not None:
+            self._count(hit=True)
+            return value, True
+
+        lock_key = key + ':lock'
+        if not self.cache.add(lock_key, 1, self.lock_timeout):
+            deadline = time.monotonic() + self.lock_timeout
+            while time.monotonic() < deadline:
+                time.sleep(self.lock_poll_interval)
+                value = self.cache.get(key)
+                if value is not None:
+                    self._count(hit=True)
+                    return value, True
+                if self.cache.get(lock_key) is None:
+                    break
+            self._count(hit=False)
+            return render(), False
+        self._count(hit=False)
+        try:
+            value = render()
+            self.cache.set(key, value)
+        finally:
+            self.cache.delete(lock_key)
+        return value, False
+
+    def invalidate_flights(self, pks):
+        """
+        Drop the cached payloads of the given flights, now and again once
+        the current transaction commits so a concurrent read cannot cache
+        the rows as they were before the commit.
+        """
+        def invalidate():
+            self.cache.delete_many([self.detail_key(pk) for pk in pks])
+            self.cache.set(self.generation_key, uuid.uuid4().hex, None)
+
+        invalidate()
+        transaction.on_commit(invalidate)
+
+    def invalidate_flight(self, pk):
+        self.invalidate_flights([pk])
+
+    def stats(self):
+        with self._counter_lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0
+            }
+
+    def _count(self, hit):
+        with self._counter_lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+
+catalog_cache = CatalogCache()
+
+
+class CachedResponseMixin:
+    """
+    Serve safe requests of a catalog view from `catalog_cache`.
+
+    Every cached payload is stored with an entry id, exposed as
+    `response.cache_entry`, under which CompressionMiddleware keeps the
+    compressed bodies of the payload.
+
+    Payloads are shared by every client, so misses are rendered from the
+    primary: a lagging replica could otherwise store rows older than the
+    invalidation that caused the miss, and serve them to the writer too.
+    """
+    def cached_response(self, key, render):
+        def render_entry():
+            alias = get_read_alias()
+            set_read_alias(None)
+            try:
+                return uuid.uuid4().hex, render().data
+            finally:
+                set_read_alias(alias)
+
+        (entry, data), hit = catalog_cache.get_or_set(key, render_entry)
+        response = Response(data)
+        response.cache_entry = entry
+        response['X-Cache'] = 'HIT' if hit else 'MISS'
+        return response
+
+
+class CachedListMixin(CachedResponseMixin):
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(
+            catalog_cache.list_key(request),
+            lambda: super(CachedListMixin, self).list(request, *args, **kwargs)
+        )
+
+
+class CachedRetrieveMixin(CachedResponseMixin):
+    def retrieve(self, request, *args, **kwargs):
+        if any(param in request.query_params for param in ('fields', 'exclude', 'include')):
+            key = catalog_cache.variant_key(request)
+        else:
+            key = catalog_cache.detail_key(kwargs[self.lookup_url_kwarg or self.lookup_field])
+        return self.cached_response(
+            key,
+            lambda: super(CachedRetrieveMixin, self).retrieve(request, *args, **kwargs)
+        )
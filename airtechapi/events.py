@@ -0,0 +1,139 @@
+import collections
+import threading
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+from rest_framework.fields import DateTimeField
+
+
+class Subscription:
+    """
+    The pending events of one subscriber. Only the newest `max_pending`
+    events are kept; a subscriber that falls behind loses the oldest ones,
+    which for status updates are superseded anyway.
+    """
+    __slots__ = ('broker', 'channels', 'events', 'ready')
+
+    def __init__(self, broker, channels, max_pending):
+        self.broker = broker
+        self.channels = channels
+        self.events = collections.deque(maxlen=max_pending)
+        self.ready = threading.Event()
+
+    def put(self, event):
+        self.events.append(event)
+        self.ready.set()
+
+    def get(self, timeout=None):
+        """
+        Return the next event, or None if none arrived within `timeout`.
+        """
+        if not self.events:
+            self.ready.wait(timeout)
+        self.ready.clear()
+        try:
+            return self.events.popleft()
+        except IndexError:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class FlightEventBroker:
+    """
+    Fans flight events out to the subscribers of their channels. `publish`
+    receives the channels an event belongs to; `subscribe` returns a
+    Subscription to the given channels.
+    """
+    def publish(self, channels, event):
+        raise NotImplementedError
+
+    def subscribe(self, channels):
+        raise NotImplementedError
+
+    def unsubscribe(self, subscription):
+        raise NotImplementedError
+
+
+class LocalFlightEventBroker(FlightEventBroker):
+    """
+    Delivers events to subscribers in this process only. With several
+    server processes, a broker that relays `publish` between them (e.g.
+    over Redis pub/sub) takes its place through FLIGHT_EVENT_BROKER.
+    """
+    def __init__(self):
+        self._subscriptions = collections.defaultdict(set)
+        self._lock = threading.Lock()
+
+    def publish(self, channels, event):
+        with self._lock:
+            subscriptions = set().union(*[self._subscriptions.get(channel, ()) for channel in channels])
+        for subscription in subscriptions:
+            subscription.put(event)
+
+    def subscribe(self, channels):
+        subscription = Subscription(self, tuple(channels), settings.FLIGHT_EVENT_MAX_PENDING)
+        with self._lock:
+            for channel in subscription.channels:
+                self._subscriptions[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                subscribers = self._subscriptions.get(channel)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscriptions[channel]
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(set().union(*self._subscriptions.values()))
+
+
+_brokers = {}
+_brokers_lock = threading.Lock()
+
+
+def get_flight_event_broker():
+    with _brokers_lock:
+        if settings.FLIGHT_EVENT_BROKER not in _brokers:
+            _brokers[settings.FLIGHT_EVENT_BROKER] = import_string(settings.FLIGHT_EVENT_BROKER)()
+        return _brokers[settings.FLIGHT_EVENT_BROKER]
+
+
+def flight_channel(pk):
+    return 'flight:{}'.format(pk)
+
+
+def route_channel(origin, destination):
+    return 'route:{}:{}'.format(origin.lower(), destination.lower())
+
+
+def flight_event(flight):
+    return {
+        'id': flight.pk,
+        'flight_number': flight.flight_number,
+        'flight_status': flight.flight_status,
+        'modified_at': DateTimeField().to_representation(flight.modified_at)
+    }
+
+
+def publish_flight_events(flights):
+    """
+    Publish the status of each flight to its flight and route channels
+    once the current transaction commits.
+    """
+    events = [
+        ((flight_channel(flight.pk), route_channel(flight.origin, flight.destination)), flight_event(flight))
+        for flight in flights
+    ]
+
+    def publish():
+        broker = get_flight_event_broker()
+        for channels, event in events:
+            broker.publish(channels, event)
+
+    transaction.on_commit(publish)
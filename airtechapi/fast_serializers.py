@@ -0,0 +1,269 @@
+from collections import defaultdict
+from django.core.exceptions import FieldDoesNotExist, ImproperlyConfigured
+from django.db.models import F
+from django.http import Http404
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from .serializers import BookingSerializer, FLightSerializer, FlightDetailSerializer
+from .timing import measured
+
+# fields whose to_representation returns database values unchanged
+PASSTHROUGH_FIELDS = (
+    serializers.BooleanField,
+    serializers.CharField,
+    serializers.ChoiceField,
+    serializers.IntegerField,
+    serializers.PrimaryKeyRelatedField,
+    serializers.SlugRelatedField,
+)
+
+
+class CompiledSerializer:
+    """
+    A read-only copy of a ModelSerializer compiled into one flat function
+    over `.values()` rows.
+
+    The fields of `serializer_class` are inspected once. Each readable
+    field becomes a column of the values query and an entry of the
+    generated function; nested serializers become joined columns, or a
+    second query grouped by parent for `many=True`. Values are formatted
+    by the fields' own to_representation unless the field passes database
+    values through unchanged, so the output renders to the same JSON as
+    the serializer. Sources that are not model fields must be given as
+    `annotations`.
+    """
+    max_subsets = 256
+
+    def __init__(self, serializer_class, annotations=None, prefix='', fields=None):
+        self.serializer_class = serializer_class
+        self.model = serializer_class.Meta.model
+        self.annotations = annotations or {}
+        self.pk_column = prefix + self.model._meta.pk.attname
+        self.columns = [self.pk_column]
+        self.nested_many = []
+        self._used_annotations = {}
+        self._formatters = {}
+        self._subsets = {}
+        readable = [
+            (name, field) for name, field in serializer_class().fields.items() if not field.write_only
+        ]
+        self.field_names = [name for name, field in readable]
+        entries = []
+        for name, field in readable:
+            if fields is None or name in fields:
+                entries.append((name, self._compile_field(name, field, prefix)))
+        self.selected = [name for name, _ in entries]
+        self._serialize = self._generate(entries)
+
+    def values(self, queryset, *columns):
+        """
+        The `.values()` rows this serializer reads from `queryset`, plus
+        any extra `columns` the caller needs, such as the ordering of a
+        paginator.
+        """
+        return queryset.select_related(None).prefetch_related(None).annotate(
+            **self._used_annotations
+        ).values(*self.columns, *[column for column in columns if column not in self.columns])
+
+    def restrict(self, fields=None, exclude=None):
+        """
+        Return a compiled copy limited to the `fields` named and without
+        those in `exclude`. Both keep the serializer's field order; unknown
+        names raise ValueError. Copies are compiled once per combination.
+        """
+        unknown = [name for name in (fields or []) + (exclude or []) if name not in self.field_names]
+        if unknown:
+            raise ValueError('Unknown fields: {}'.format(', '.join(unknown)))
+        selected = tuple(
+            name for name in self.field_names
+            if (not fields or name in fields) and name not in (exclude or [])
+        )
+        # shared by every thread: another one may clear the dict at any time
+        compiled = self._subsets.get(selected)
+        if compiled is None:
+            compiled = CompiledSerializer(self.serializer_class, annotations=self.annotations, fields=selected)
+            if len(self._subsets) >= self.max_subsets:
+                self._subsets.clear()
+            self._subsets[selected] = compiled
+        return compiled
+
+    def serialize(self, rows):
+        return measured('serialize', self._serialize_rows, rows)
+
+    def _serialize_rows(self, rows):
+        rows = list(rows)
+        data = [self._serialize(row) for row in rows]
+        for name, compiled, parent_column in self.nested_many:
+            children = defaultdict(list)
+            related = list(compiled.model.objects.filter(**{
+                parent_column + '__in': [row[self.pk_column] for row in rows]
+            }).annotate(**compiled._used_annotations).values(
+                parent_column, *compiled.columns
+            ).order_by(compiled.pk_column))
+            for child, item in zip(related, compiled.serialize(related)):
+                children[child[parent_column]].append(item)
+            for row, item in zip(rows, data):
+                item[name] = children[row[self.pk_column]]
+        return data
+
+    def iterate(self, queryset, chunk_size=2000):
+        """
+        Serialize `queryset` row by row from a server-side cursor, so
+        memory stays flat however many rows it holds. Nested many=True
+        fields need a second query per batch and cannot be iterated.
+        """
+        if self.nested_many:
+            raise ImproperlyConfigured('Nested many=True fields cannot be iterated')
+        for row in self.values(queryset).iterator(chunk_size=chunk_size):
+            yield self._serialize(row)
+
+    def flat_field_names(self):
+        """
+        Names of the output fields, with nested serializers flattened into
+        `parent.child` names.
+        """
+        names = []
+        many = {name for name, _, _ in self.nested_many}
+        for name in self.selected:
+            nested = self._formatters.get('nested_' + name)
+            if nested is not None:
+                names.extend('{}.{}'.format(name, child) for child in nested.flat_field_names())
+            elif name not in many:
+                names.append(name)
+        return names
+
+    def get(self, queryset, **lookups):
+        """
+        Serialize the single row matching `lookups`, like get_object().
+        """
+        rows = list(self.values(queryset.filter(**lookups))[:2])
+        if len(rows) != 1:
+            raise Http404
+        return self.serialize(rows)[0]
+
+    def _compile_field(self, name, field, prefix):
+        source = field.source
+        if isinstance(field, serializers.ListSerializer):
+            if prefix:
+                raise ImproperlyConfigured('Nested many=True serializers are only compiled at the top level')
+            related = self._model_field(source)
+            compiled = CompiledSerializer(type(field.child))
+            self.nested_many.append((name, compiled, related.field.attname))
+            return None
+        if isinstance(field, serializers.BaseSerializer):
+            compiled = CompiledSerializer(type(field), prefix=prefix + source + '__')
+            self._add_columns(*compiled.columns)
+            self._formatters['nested_' + name] = compiled
+            return "(nested_{0}._serialize(row) if row[{1!r}] is not None else None)".format(
+                name, compiled.pk_column)
+        if isinstance(field, serializers.SlugRelatedField):
+            column = prefix + source + '__' + field.slug_field
+        elif source.startswith('get_') and source.endswith('_display'):
+            model_field = self._model_field(source[len('get_'):-len('_display')])
+            column = prefix + model_field.name
+            self._formatters['display_' + name] = {
+                key: str(value) for key, value in model_field.flatchoices
+            }
+            self._add_columns(column)
+            return "display_{0}.get(row[{1!r}], row[{1!r}])".format(name, column)
+        elif source in self.annotations:
+            column = source
+            self._used_annotations[source] = self.annotations[source]
+        else:
+            column = prefix + self._model_field(source).attname
+        self._add_columns(column)
+        if isinstance(field, PASSTHROUGH_FIELDS):
+            return "row[{!r}]".format(column)
+        if isinstance(field, serializers.DateField) and (getattr(
+                field, 'format', api_settings.DATE_FORMAT) or '').lower() == 'iso-8601':
+            return "(row[{0!r}].isoformat() if row[{0!r}] else None)".format(column)
+        self._formatters['format_' + name] = field.to_representation
+        return "(format_{0}(row[{1!r}]) if row[{1!r}] is not None else None)".format(name, column)
+
+    def _add_columns(self, *columns):
+        self.columns.extend(column for column in columns if column not in self.columns)
+
+    def _model_field(self, name):
+        try:
+            return self.model._meta.get_field(name)
+        except FieldDoesNotExist:
+            raise ImproperlyConfigured(
+                '{}.{} is not a field of {} and has no annotation'.format(
+                    self.serializer_class.__name__, name, self.model.__name__))
+
+    def _generate(self, entries):
+        source = 'def serialize(row):\n    return {\n'
+        for name, expression in entries:
+            source += '        {!r}: {},\n'.format(name, expression if expression is not None else '[]')
+        source += '    }\n'
+        namespace = dict(self._formatters)
+        exec(compile(source, '<compiled {}>'.format(self.serializer_class.__name__), 'exec'), namespace)
+        return namespace['serialize']
+
+
+class FastSerializerMixin:
+    """
+    Serve reads with `fast_serializer`, limited by the comma separated
+    `?fields=` and `?exclude=` query parameters. Only the columns of the
+    selected fields are loaded, and nested lists are only queried when
+    selected.
+    """
+    fast_serializer = None
+
+    def get_fast_serializer(self):
+        fields, exclude = [
+            [name.strip() for name in self.request.query_params.get(param, '').split(',') if name.strip()]
+            for param in ('fields', 'exclude')
+        ]
+        if not fields and not exclude:
+            return self.fast_serializer
+        try:
+            return self.fast_serializer.restrict(fields, exclude)
+        except ValueError as error:
+            raise ValidationError({
+                'fields': str(error)
+            })
+
+
+class FastListMixin(FastSerializerMixin):
+    """
+    Render list responses with `fast_serializer` instead of the
+    serializer_class, paginating over `.values()` rows.
+    """
+    def list(self, request, *args, **kwargs):
+        fast_serializer = self.get_fast_serializer()
+        # a cursor paginator reads its position from the ordering columns
+        ordering = getattr(self.paginator, 'ordering', None) or ()
+        if isinstance(ordering, str):
+            ordering = (ordering,)
+        queryset = fast_serializer.values(
+            self.filter_queryset(self.get_queryset()), *[field.lstrip('-') for field in ordering]
+        )
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(fast_serializer.serialize(page))
+        return Response(fast_serializer.serialize(queryset))
+
+
+class FastRetrieveMixin(FastSerializerMixin):
+    def retrieve(self, request, *args, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        data = self.get_fast_data(
+            self.filter_queryset(self.get_queryset()),
+            **{self.lookup_field: self.kwargs[lookup_url_kwarg]}
+        )
+        self.check_object_permissions(request, data)
+        return Response(data)
+
+    def get_fast_data(self, queryset, **lookups):
+        return self.get_fast_serializer().get(queryset, **lookups)
+
+
+seats_remaining = {
+    'seats_remaining': F('capacity') - F('booked_tickets')
+}
+fast_flight_serializer = CompiledSerializer(FLightSerializer, annotations=seats_remaining)
+fast_flight_detail_serializer = CompiledSerializer(FlightDetailSerializer, annotations=seats_remaining)
+fast_booking_serializer = CompiledSerializer(BookingSerializer)
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+from ...serializers import ExportFilterSerializer
+from ...utils.exports import EXPORT_RENDERERS, EXPORTS, stream_export
+
+
+class Command(BaseCommand):
+    help = 'Stream every flight or booking, or those modified in a window, as NDJSON or CSV.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('export', choices=sorted(EXPORTS))
+        parser.add_argument('--format', choices=sorted(EXPORT_RENDERERS), default='ndjson')
+        parser.add_argument('--modified-since', help='Inclusive ISO 8601 time.')
+        parser.add_argument('--modified-until', help='Exclusive ISO 8601 time.')
+        parser.add_argument('--output', help='Defaults to standard output.')
+
+    def handle(self, *args, **options):
+        filters = ExportFilterSerializer(data={
+            key: options[key] for key in ('modified_since', 'modified_until') if options[key]
+        })
+        if not filters.is_valid():
+            raise CommandError(filters.errors)
+        chunks = stream_export(options['export'], EXPORT_RENDERERS[options['format']](), **filters.validated_data)
+        if not options['output']:
+            for chunk in chunks:
+                self.stdout.write(chunk.decode('utf-8'), ending='')
+            return
+        try:
+            with open(options['output'], 'wb') as output:
+                for chunk in chunks:
+                    output.write(chunk)
+        except OSError as error:
+            raise CommandError(error)
@@ -0,0 +1,29 @@
+import os
+from django.core.management.base import BaseCommand, CommandError
+from ...utils.importer import FORMATS, import_flights, read_rows
+
+
+class Command(BaseCommand):
+    help = 'Stream a CSV or NDJSON flight schedule into the database, upserting on flight_number.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=FORMATS, help='Defaults to the file extension.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or os.path.splitext(path)[1].lstrip('.').lower()
+        if file_format not in FORMATS:
+            raise CommandError('Cannot tell the format of {}, pass --format'.format(path))
+        try:
+            stream = open(path, 'rb')
+        except OSError as error:
+            raise CommandError(error)
+        with stream:
+            report = import_flights(read_rows(stream, file_format), batch_size=options['batch_size'])
+        for error in report.errors:
+            self.stderr.write('row {row}: {errors}'.format(**error))
+        self.stdout.write(self.style.SUCCESS(
+            'Imported flights: {created} created, {updated} updated, {failed} failed'.format(**report.as_dict())
+        ))
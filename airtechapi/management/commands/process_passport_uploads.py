@@ -0,0 +1,36 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand
+from django.db import connection
+from ...utils.uploads import process_pending_passport_uploads
+
+
+class Command(BaseCommand):
+    help = 'Run a pool of workers that hand queued passport uploads to the storage backend.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--poll-interval', type=float, default=1.0)
+        parser.add_argument('--once', action='store_true', help='Exit once the queue is empty.')
+
+    def handle(self, *args, **options):
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            workers = [
+                pool.submit(self.work, options['poll_interval'], options['once'])
+                for _ in range(options['workers'])
+            ]
+            processed = sum(worker.result() for worker in workers)
+        self.stdout.write(self.style.SUCCESS('Processed {} passport uploads'.format(processed)))
+
+    def work(self, poll_interval, once):
+        processed = 0
+        try:
+            while True:
+                done = process_pending_passport_uploads()
+                processed += done
+                if not done:
+                    if once:
+                        return processed
+                    time.sleep(poll_interval)
+        finally:
+            connection.close()
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+from ...utils.fares import compare_fare_summaries, refresh_fare_summaries
+
+
+class Command(BaseCommand):
+    help = (
+        'Check the fare summaries against a full recompute from the flights '
+        'and refresh the ones that drifted.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help='Report drift without fixing it.')
+
+    def handle(self, *args, **options):
+        missing, stale, orphaned = compare_fare_summaries()
+        drifted = missing + stale + orphaned
+        for label, keys in (('missing', missing), ('stale', stale), ('orphaned', orphaned)):
+            for origin, destination, departure in keys[:20]:
+                self.stderr.write('{}: {} - {} {}'.format(label, origin, destination, departure))
+        summary = 'Fare summaries: {} missing, {} stale, {} orphaned'.format(
+            len(missing), len(stale), len(orphaned))
+        if options['check']:
+            if drifted:
+                raise CommandError(summary)
+            self.stdout.write(self.style.SUCCESS(summary))
+            return
+        # the refresh locks and recomputes each key, so it is safe alongside live writes
+        refresh_fare_summaries(drifted)
+        self.stdout.write(self.style.SUCCESS('{}, {} refreshed'.format(summary, len(drifted))))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from ...utils.inventory import reconcile_flight_counters
+
+
+class Command(BaseCommand):
+    help = 'Recount the booked tickets and bookings of every flight and repair the counters that drifted.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500, help='Flights locked per transaction.')
+
+    def handle(self, *args, **options):
+        repaired = reconcile_flight_counters(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS('Repaired the counters of {} flights'.format(repaired)))
@@ -0,0 +1,212 @@
+import brotli
+import gzip
+import hashlib
+import json
+import logging
+import random
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import patch_vary_headers
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.renderers import JSONRenderer
+from .cache import catalog_cache
+from .renderers import ColumnarJSONRenderer, MessagePackRenderer
+from .routers import next_replica, set_read_alias
+from .timing import RequestTimer, current_timer
+
+timing_logger = logging.getLogger('airtechapi.timing')
+
+
+def compress(encoding, content):
+    if encoding == 'br':
+        return brotli.compress(content, quality=settings.COMPRESSION_BROTLI_QUALITY)
+    return gzip.compress(content, compresslevel=settings.COMPRESSION_GZIP_LEVEL, mtime=0)
+
+
+def accepted_encodings(request):
+    """
+    The content codings of the request's Accept-Encoding, minus those
+    refused with q=0.
+    """
+    accepted = set()
+    for part in request.META.get('HTTP_ACCEPT_ENCODING', '').lower().split(','):
+        coding, _, params = part.partition(';')
+        quality = params.strip()[2:] if params.strip().startswith('q=') else '1'
+        try:
+            if float(quality) > 0:
+                accepted.add(coding.strip())
+        except ValueError:
+            pass
+    return accepted
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Serve safe requests to catalog views from a read replica.
+
+    A client whose last write succeeded less than REPLICA_PIN_SECONDS ago
+    keeps reading from the primary, so it sees its own writes despite
+    replication lag. Clients are told apart by their Authorization header,
+    else their session cookie, else their address; the pins live in the
+    default cache, which must be shared for pins to hold across processes.
+    Catalog cache misses are rendered from the primary all the same, see
+    CachedResponseMixin.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            response = self.get_response(request)
+        finally:
+            set_read_alias(None)
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            cache.set(self.pin_key(request), True, settings.REPLICA_PIN_SECONDS)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_class = getattr(view_func, 'cls', None)
+        if (request.method in SAFE_METHODS and getattr(view_class, 'read_from_replica', False)
+                and not cache.get(self.pin_key(request))):
+            set_read_alias(next_replica())
+
+    @staticmethod
+    def pin_key(request):
+        client = (
+            request.META.get('HTTP_AUTHORIZATION') or
+            request.COOKIES.get(settings.SESSION_COOKIE_NAME) or
+            request.META.get('REMOTE_ADDR', '')
+        )
+        return 'db:pin:' + hashlib.md5(client.encode('utf-8')).hexdigest()
+
+
+class CompressionMiddleware:
+    """
+    Compress responses with brotli or gzip, as the client accepts.
+
+    Only complete 200 responses of at least COMPRESSION_MIN_SIZE bytes
+    whose content type is in COMPRESSION_CONTENT_TYPES are compressed.
+    Bodies of catalog cache entries rendered by the data renderers are
+    compressed once per entry, content type and encoding, and kept in the
+    catalog cache next to the entry. Other bodies, such as browsable API
+    pages that carry the user's name and CSRF token, are compressed per
+    response and never shared.
+    """
+    shared_content_types = frozenset(
+        renderer.media_type for renderer in (JSONRenderer, ColumnarJSONRenderer, MessagePackRenderer)
+    )
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if response.streaming or response.status_code != 200 or response.has_header('Content-Encoding'):
+            return response
+        content_type = response.get('Content-Type', '').split(';')[0].strip().lower()
+        if content_type not in settings.COMPRESSION_CONTENT_TYPES:
+            return response
+        if len(response.content) < settings.COMPRESSION_MIN_SIZE:
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+
+        accepted = accepted_encodings(request)
+        if 'br' in accepted:
+            encoding = 'br'
+        elif 'gzip' in accepted or '*' in accepted:
+            encoding = 'gzip'
+        else:
+            return response
+
+        entry = getattr(response, 'cache_entry', None)
+        if content_type not in self.shared_content_types:
+            entry = None
+        key = catalog_cache.compressed_key(entry, response['Content-Type'], encoding) if entry else None
+        content = catalog_cache.cache.get(key) if key else None
+        if content is None:
+            content = compress(encoding, response.content)
+            if key:
+                catalog_cache.cache.set(key, content)
+        if len(content) >= len(response.content):
+            return response
+
+        response.content = content
+        response['Content-Length'] = str(len(content))
+        response['Content-Encoding'] = encoding
+        # the body differs from the uncompressed one, see GZipMiddleware
+        if response.has_header('ETag') and response['ETag'].startswith('"'):
+            response['ETag'] = 'W/' + response['ETag']
+        return response
+
+
+class ServerTimingMiddleware:
+    """
+    Time a sample of requests and report where the time went.
+
+    SERVER_TIMING_SAMPLE_RATE of the requests are timed; the others only
+    pay for drawing a random number. A timed request gets a Server-Timing
+    header and one JSON log line on `airtechapi.timing`, tagged with its
+    URL name, holding:
+
+    - db: the number and duration of the queries
+    - auth: authenticating the request
+    - serialize: turning objects and rows into response data
+    - render: encoding the response data
+    - view: the view, including all of the above but render
+    - total: the whole middleware stack
+
+    A request that ran one statement SERVER_TIMING_REPEATED_QUERIES times
+    or more is flagged, and logged as a warning, since its query count
+    grows with the rows it returns. Streaming bodies are not read; their
+    timings stop when the view returns.
+    """
+    metrics = ('db', 'auth', 'serialize', 'render', 'view', 'total')
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if random.random() >= settings.SERVER_TIMING_SAMPLE_RATE:
+            return self.get_response(request)
+        timer = RequestTimer()
+        with timer.activate():
+            response = self.get_response(request)
+        timer.finish()
+        statement, repeats = timer.most_repeated()
+        repeated = repeats >= settings.SERVER_TIMING_REPEATED_QUERIES
+        response['Server-Timing'] = self.header(timer, repeats if repeated else 0)
+        record = {
+            'url_name': request.resolver_match.url_name if request.resolver_match else None,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'queries': timer.queries,
+            'repeated_query': {'count': repeats, 'sql': statement[:500]} if repeated else None,
+        }
+        record.update(('{}_ms'.format(name), round(timer.durations[name] * 1000, 3)) for name in self.metrics)
+        timing_logger.log(logging.WARNING if repeated else logging.INFO, json.dumps(record, sort_keys=True))
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        timer = current_timer()
+        if timer is not None:
+            timer.start('view')
+
+    def process_template_response(self, request, response):
+        timer = current_timer()
+        if timer is not None:
+            timer.stop('view')
+            timer.start('render')
+            response.add_post_render_callback(lambda rendered: timer.stop('render'))
+        return response
+
+    def header(self, timer, repeats):
+        entries = []
+        for name in self.metrics:
+            entry = '{};dur={:.1f}'.format(name, timer.durations[name] * 1000)
+            if name == 'db':
+                entry += ';desc="{} queries"'.format(timer.queries)
+            entries.append(entry)
+        if repeats:
+            entries.append('n-plus-one;desc="{} identical queries"'.format(repeats))
+        return ', '.join(entries)
@@ -0,0 +1,21 @@
+# Generated by Django 2.2.28 on 2026-10-18 14:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('airtechapi', '0007_auto_20190829_1258'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='flight',
+            index=models.Index(fields=['origin', 'destination', 'departure'], name='flight_route_departure_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='flight',
+            index=models.Index(fields=['airline', 'departure'], name='flight_airline_departure_idx'),
+        ),
+    ]
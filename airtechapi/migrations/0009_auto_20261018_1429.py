@@ -0,0 +1,17 @@
+# Generated by Django 2.2.28 on 2026-10-18 14:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('airtechapi', '0008_auto_20261018_1428'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['passenger', 'created_at'], name='booking_passenger_created_idx'),
+        ),
+    ]
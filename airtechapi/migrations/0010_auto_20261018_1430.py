@@ -0,0 +1,33 @@
+# Generated by Django 2.2.28 on 2026-10-18 14:30
+
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def count_booked_tickets(apps, schema_editor):
+    Flight = apps.get_model('airtechapi', 'Flight')
+    for flight in Flight.objects.annotate(tickets=Sum('bookings__number_of_tickets')).filter(tickets__gt=0):
+        flight.booked_tickets = flight.tickets
+        flight.capacity = max(flight.capacity, flight.tickets)
+        flight.save(update_fields=['booked_tickets', 'capacity'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('airtechapi', '0009_auto_20261018_1429'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='flight',
+            name='booked_tickets',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='flight',
+            name='capacity',
+            field=models.PositiveIntegerField(default=180),
+        ),
+        migrations.RunPython(count_booked_tickets, migrations.RunPython.noop),
+    ]
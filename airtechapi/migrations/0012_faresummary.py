@@ -0,0 +1,55 @@
+# Generated by Django 2.2.28 on 2026-10-18 15:10
+
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Count, Max, Min, Sum
+
+
+def summarize_fares(apps, schema_editor):
+    Flight = apps.get_model('airtechapi', 'Flight')
+    FareSummary = apps.get_model('airtechapi', 'FareSummary')
+    rows = Flight.objects.order_by().values('origin', 'destination', 'departure').annotate(
+        flight_count=Count('pk'),
+        min_price=Min('price'),
+        max_price=Max('price'),
+        total_price=Sum('price')
+    )
+    FareSummary.objects.bulk_create([
+        FareSummary(
+            origin=row['origin'],
+            destination=row['destination'],
+            departure=row['departure'],
+            flight_count=row['flight_count'],
+            min_price=row['min_price'],
+            max_price=row['max_price'],
+            avg_price=(Decimal(row['total_price']) / row['flight_count']).quantize(Decimal('0.01'))
+        ) for row in rows.iterator()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('airtechapi', '0011_auto_20261018_1435'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FareSummary',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('origin', models.CharField(max_length=100)),
+                ('destination', models.CharField(max_length=100)),
+                ('departure', models.DateField()),
+                ('flight_count', models.PositiveIntegerField(default=0)),
+                ('min_price', models.PositiveIntegerField(default=0)),
+                ('max_price', models.PositiveIntegerField(default=0)),
+                ('avg_price', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('modified_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'unique_together': {('origin', 'destination', 'departure')},
+            },
+        ),
+        migrations.RunPython(summarize_fares, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 2.2.28 on 2026-10-18 15:12
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_bookings(apps, schema_editor):
+    Flight = apps.get_model('airtechapi', 'Flight')
+    for flight in Flight.objects.annotate(bookings_total=Count('bookings')).filter(bookings_total__gt=0):
+        flight.booking_count = flight.bookings_total
+        flight.save(update_fields=['booking_count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('airtechapi', '0012_faresummary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='flight',
+            name='booking_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(count_bookings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 2.2.28 on 2026-10-18 15:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('airtechapi', '0013_flight_booking_count'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['modified_at'], name='booking_modified_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='flight',
+            index=models.Index(fields=['modified_at'], name='flight_modified_idx'),
+        ),
+    ]
@@ -17,6 +17,7 @@ class Flight(models.Model):
     LANDED = 'L'
     REDIRECTED = 'R'
     UNKNOWN = 'U'
+    DEFAULT_CAPACITY = 180
     FLIGHT_TYPES = (
         (ONE_WAY, 'One-way'),
         (ROUND_TRIP, 'Round-trip'),
@@ -48,15 +49,49 @@ class Flight(models.Model):
     flight_number = models.CharField(max_length=7, validators=[alphanumeric], unique=True)
     airline = models.CharField(max_length=50, validators=[alphaonly])
     price = models.PositiveIntegerField()
+    capacity = models.PositiveIntegerField(default=DEFAULT_CAPACITY)
+    booked_tickets = models.PositiveIntegerField(default=0)
+    booking_count = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     modified_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ('flight_number',)
+        indexes = [
+            models.Index(fields=['origin', 'destination', 'departure'], name='flight_route_departure_idx'),
+            models.Index(fields=['airline', 'departure'], name='flight_airline_departure_idx'),
+            models.Index(fields=['modified_at'], name='flight_modified_idx'),
+        ]
 
     def __str__(self):
         return self.flight_number
 
+    @property
+    def seats_remaining(self):
+        return self.capacity - self.booked_tickets
+
+
+class FareSummary(models.Model):
+    """
+    Fares of the flights on one route and departure date, kept in step
+    with Flight by airtechapi.utils.fares.
+    """
+    origin = models.CharField(max_length=100)
+    destination = models.CharField(max_length=100)
+    departure = models.DateField()
+    flight_count = models.PositiveIntegerField(default=0)
+    min_price = models.PositiveIntegerField(default=0)
+    max_price = models.PositiveIntegerField(default=0)
+    avg_price = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    modified_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        # the unique index doubles as the index of the fare calendar range reads
+        unique_together = ('origin', 'destination', 'departure')
+
+    def __str__(self):
+        return '{} - {} {}'.format(self.origin, self.destination, self.departure)
+
 
 class Booking(models.Model):
     flight = models.ForeignKey(Flight, related_name='bookings', on_delete=models.CASCADE)
@@ -67,9 +102,13 @@ class Booking(models.Model):
 
     class Meta:
         unique_together = ('flight', 'passenger')
+        indexes = [
+            models.Index(fields=['passenger', 'created_at'], name='booking_passenger_created_idx'),
+            models.Index(fields=['modified_at'], name='booking_modified_idx'),
+        ]
 
     def __str__(self):
-        return self.flight, self.passenger
+        return '{} - {}'.format(self.flight, self.passenger)
 
 
 class Profile(models.Model):
@@ -78,4 +117,33 @@ class Profile(models.Model):
     cloudinary_public_id = models.CharField(max_length=100)
 
     def __str__(self):
-        return self.user, self.passport_url
+        return '{} - {}'.format(self.user, self.passport_url)
+
+
+class PassportUpload(models.Model):
+    PENDING = 'P'
+    RUNNING = 'R'
+    DONE = 'D'
+    FAILED = 'F'
+    UPLOAD_STATUS = (
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed')
+    )
+    user = models.ForeignKey(User, related_name='passport_uploads', on_delete=models.CASCADE)
+    profile = models.ForeignKey(Profile, null=True, blank=True, on_delete=models.SET_NULL)
+    spool_path = models.CharField(max_length=255)
+    status = models.CharField(max_length=1, choices=UPLOAD_STATUS, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    modified_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='passport_upload_status_idx'),
+        ]
+
+    def __str__(self):
+        return '{} ({})'.format(self.user, self.get_status_display())
@@ -0,0 +1,64 @@
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+from rest_framework.pagination import CursorPagination
+
+
+class FlightCursorPagination(CursorPagination):
+    """
+    Keyset pagination over the unique flight_number ordering.
+
+    Each page is a range read starting after the last flight_number of
+    the previous page, so deep pages cost the same as the first one and
+    rows inserted while a client is scrolling never shift the results.
+    """
+    ordering = 'flight_number'
+    page_size = settings.CATALOG_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+
+class BookingCursorPagination(CursorPagination):
+    """
+    Keyset pagination over bookings, newest first.
+    """
+    ordering = '-created_at'
+    page_size = settings.CATALOG_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator for admin changelists of large tables.
+
+    An exact COUNT(*) reads the whole table. When the changelist is not
+    filtered, the planner's row estimate from pg_class is used instead
+    once it passes `estimate_threshold`; filtered lists and small tables
+    are still counted exactly.
+    """
+    estimate_threshold = 100000
+
+    @cached_property
+    def count(self):
+        estimate = self.estimate()
+        if estimate is not None and estimate > self.estimate_threshold:
+            return estimate
+        return super().count
+
+    def estimate(self):
+        query = getattr(self.object_list, 'query', None)
+        if query is None or query.where or query.distinct or query.combinator:
+            return None
+        connection = connections[self.object_list.db]
+        if connection.vendor != 'postgresql':
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+                [connection.ops.quote_name(query.model._meta.db_table)]
+            )
+            row = cursor.fetchone()
+        # tables that were never analyzed have no estimate
+        return row[0] if row and row[0] >= 0 else None
@@ -0,0 +1,198 @@
+import csv
+import functools
+import io
+import json
+import msgpack
+from rest_framework import serializers
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder
+
+
+def format_event(data, event=None):
+    lines = []
+    if event is not None:
+        lines.append('event: {}'.format(event))
+    lines.append('data: {}'.format(json.dumps(data, cls=JSONEncoder, separators=(',', ':'))))
+    return '\n'.join(lines) + '\n\n'
+
+
+class EventStreamRenderer(BaseRenderer):
+    """
+    Server-Sent Events. Streams are written by the views themselves; this
+    renderer lets clients ask for text/event-stream and receives the error
+    responses of those views, which it sends as a single `error` event.
+    """
+    media_type = 'text/event-stream'
+    format = 'sse'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return format_event(data, event='error').encode(self.charset)
+
+
+# bytes buffered before a chunk of an export stream is sent
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def flatten(row, prefix=''):
+    """
+    Flatten nested dicts into one level of `parent.child` keys.
+    """
+    flat = {}
+    for key, value in row.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, prefix + key + '.'))
+        else:
+            flat[prefix + key] = value
+    return flat
+
+
+class StreamingRendererMixin:
+    """
+    Renderers of record exports. `stream` encodes an iterable of rows into
+    chunks of about STREAM_CHUNK_SIZE bytes for a StreamingHttpResponse,
+    holding one chunk in memory at a time; `render` encodes the other
+    responses, such as errors, as a single row.
+    """
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return b''.join(self.stream(data if isinstance(data, list) else [data]))
+
+    def stream(self, rows, fields=None):
+        buffer = []
+        buffered = 0
+        for piece in self.encode(rows, fields):
+            buffer.append(piece)
+            buffered += len(piece)
+            if buffered >= STREAM_CHUNK_SIZE:
+                yield ''.join(buffer).encode(self.charset)
+                buffer = []
+                buffered = 0
+        if buffer:
+            yield ''.join(buffer).encode(self.charset)
+
+    def encode(self, rows, fields):
+        raise NotImplementedError
+
+
+class NDJSONRenderer(StreamingRendererMixin, BaseRenderer):
+    """
+    One JSON document per line.
+    """
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def encode(self, rows, fields):
+        encoder = JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+        for row in rows:
+            yield encoder.encode(row) + '\n'
+
+
+class CSVRenderer(StreamingRendererMixin, BaseRenderer):
+    """
+    CSV with a header line. Nested objects become `parent.child` columns;
+    without `fields` the columns are those of the first row.
+    """
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+
+    def encode(self, rows, fields):
+        line = io.StringIO()
+        writer = None
+        for row in rows:
+            row = flatten(row)
+            if writer is None:
+                writer = self._writer(line, fields or list(row))
+                yield self._take(line)
+            writer.writerow(row)
+            yield self._take(line)
+        if writer is None and fields:
+            self._writer(line, fields)
+            yield self._take(line)
+
+    @staticmethod
+    def _writer(line, fields):
+        writer = csv.DictWriter(line, fields, extrasaction='ignore')
+        writer.writeheader()
+        return writer
+
+    @staticmethod
+    def _take(line):
+        value = line.getvalue()
+        line.seek(0)
+        line.truncate()
+        return value
+
+
+@functools.lru_cache(maxsize=None)
+def choice_table(serializer_class):
+    """
+    Map each choice field of `serializer_class` to its {code: label} pairs.
+    """
+    return {
+        name: {str(code): str(label) for code, label in field.choices.items()}
+        for name, field in serializer_class().fields.items()
+        if isinstance(field, serializers.ChoiceField)
+    }
+
+
+class ListRendererMixin:
+    """
+    Reshape paginated list responses before encoding them. Choice fields
+    keep their codes and the labels are sent once, as a `choices` table
+    built from the view's serializer. Other responses are left as they are.
+    """
+    def prepare(self, data, renderer_context):
+        view = (renderer_context or {}).get('view')
+        if not isinstance(data, dict) or not isinstance(data.get('results'), list) or view is None:
+            return data
+        prepared = dict(data)
+        prepared['results'] = self.prepare_results(data['results'])
+        prepared['choices'] = choice_table(view.get_serializer_class())
+        return prepared
+
+    def prepare_results(self, results):
+        return results
+
+
+class ColumnarJSONRenderer(ListRendererMixin, JSONRenderer):
+    """
+    JSON with the results of a list as one array per field,
+    {"results": {"id": [...], "origin": [...], ...}}, so no key is
+    repeated per row.
+    """
+    media_type = 'application/vnd.airtech.columnar+json'
+    format = 'columnar'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return super().render(self.prepare(data, renderer_context), accepted_media_type, renderer_context)
+
+    def prepare_results(self, results):
+        fields = list(results[0]) if results else []
+        return {field: [row[field] for row in results] for field in fields}
+
+
+class MessagePackRenderer(ListRendererMixin, BaseRenderer):
+    """
+    MessagePack encoding of the response, with the `choices` table added
+    to list responses.
+    """
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(self.prepare(data, renderer_context), default=JSONEncoder().default)
+
+
+# the default renderers plus the compact list formats that can be used here
+LIST_RENDERER_CLASSES = tuple(api_settings.DEFAULT_RENDERER_CLASSES) + (ColumnarJSONRenderer, MessagePackRenderer)
@@ -0,0 +1,56 @@
+import itertools
+import threading
+from django.conf import settings
+
+_state = threading.local()
+_replica_lock = threading.Lock()
+_replica_cycle = None
+_replica_aliases = None
+
+
+def next_replica():
+    """
+    Return the next alias of DATABASE_REPLICAS in round-robin order, or
+    None when no replica is configured.
+    """
+    global _replica_cycle, _replica_aliases
+    with _replica_lock:
+        if _replica_aliases != settings.DATABASE_REPLICAS:
+            _replica_aliases = list(settings.DATABASE_REPLICAS)
+            _replica_cycle = itertools.cycle(_replica_aliases)
+        return next(_replica_cycle) if _replica_aliases else None
+
+
+def set_read_alias(alias):
+    _state.read_alias = alias
+
+
+def get_read_alias():
+    return getattr(_state, 'read_alias', None)
+
+
+class ReplicaRouter:
+    """
+    Send reads to the replica chosen for the current request, if any.
+
+    ReplicaRoutingMiddleware picks one replica per request for safe
+    requests to views marked `read_from_replica`; every other query, and
+    every write, goes to `default`. Replicas are never migrated, they
+    follow the primary.
+    """
+    def db_for_read(self, model, **hints):
+        return get_read_alias()
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {'default'} | set(settings.DATABASE_REPLICAS)
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
@@ -1,13 +1,20 @@
+import calendar
+import time
+from django.db import transaction
 from django.utils.translation import ugettext_lazy as _
 from rest_framework import serializers
+from rest_framework_jwt.serializers import RefreshJSONWebTokenSerializer
+from rest_framework_jwt.settings import api_settings
 from django.contrib.auth import get_user_model
-from .models import Flight, Booking, Profile
-from .utils.validations import validate_date, validate_arrival_departure
+from .models import FareSummary, Flight, Booking, Profile, PassportUpload
+from .timing import TimedSerializerMixin
+from .utils.denylist import token_denylist
+from .utils.validations import validate_date, validate_arrival_departure, alphanumeric
 
 User = get_user_model()
 
 
-class UserDataSerializer(serializers.ModelSerializer):
+class UserDataSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = (
@@ -32,16 +39,67 @@ class UserDataSerializer(serializers.ModelSerializer):
         return user
 
 
-class BookingSerializer(serializers.ModelSerializer):
-    flight = serializers.SlugRelatedField(queryset=Flight.objects.all(), slug_field='flight_number')
+class RefreshTokenSerializer(RefreshJSONWebTokenSerializer):
+    """
+    Refresh a token of a session that has not been revoked, keeping the
+    session and `orig_iat` of the token it replaces.
+    """
+    def validate(self, attrs):
+        payload = self._check_payload(token=attrs['token'])
+        if token_denylist.is_revoked(payload):
+            raise serializers.ValidationError(_('Token has been revoked.'))
+        user = self._check_user(payload=payload)
+
+        orig_iat = payload.get('orig_iat')
+        if not orig_iat:
+            raise serializers.ValidationError(_('orig_iat field is required.'))
+        refresh_limit = api_settings.JWT_REFRESH_EXPIRATION_DELTA.total_seconds()
+        if time.time() > orig_iat + refresh_limit:
+            raise serializers.ValidationError(_('Refresh has expired.'))
+
+        new_payload = api_settings.JWT_PAYLOAD_HANDLER(user, session=payload.get('session'))
+        new_payload['orig_iat'] = orig_iat
+        return {
+            'token': api_settings.JWT_ENCODE_HANDLER(new_payload),
+            'user': user
+        }
+
+
+class FlightNumberField(serializers.SlugRelatedField):
+    """
+    Resolve flights from the `flights` context mapping when the caller has
+    already fetched them, so a batch of bookings costs one flight query.
+    """
+    def to_internal_value(self, data):
+        flights = self.context.get('flights', None)
+        if flights is None:
+            return super().to_internal_value(data)
+        try:
+            return flights[data]
+        except KeyError:
+            self.fail('does_not_exist', slug_name=self.slug_field, value=data)
+        except TypeError:
+            self.fail('invalid')
+
+
+class BookingListSerializer(serializers.ListSerializer):
+    def create(self, validated_data):
+        return Booking.objects.bulk_create([Booking(**attrs) for attrs in validated_data])
+
+
+class BookingSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    flight = FlightNumberField(queryset=Flight.objects.all(), slug_field='flight_number')
     passenger = UserDataSerializer(read_only=True)
 
     class Meta:
         model = Booking
         fields = '__all__'
+        list_serializer_class = BookingListSerializer
+
 
+class FLightSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    seats_remaining = serializers.IntegerField(read_only=True)
 
-class FLightSerializer(serializers.ModelSerializer):
     class Meta:
         model = Flight
         fields = (
@@ -55,7 +113,12 @@ class FLightSerializer(serializers.ModelSerializer):
             'flight_number',
             'airline',
             'price',
+            'capacity',
+            'seats_remaining',
+            'booked_tickets',
+            'booking_count',
         )
+        read_only_fields = ('booked_tickets', 'booking_count')
 
     def validate_departure(self, value):
         if validate_date(value):
@@ -71,18 +134,60 @@ class FLightSerializer(serializers.ModelSerializer):
             )
         return value
 
+    def validate_capacity(self, value):
+        if self.instance is not None and value < self.instance.booked_tickets:
+            raise serializers.ValidationError(
+                'The capacity cannot be less than the number of booked tickets'
+            )
+        return value
+
     def validate(self, data):
-        arrival = data.get('arrival', None)
-        departure = data.get('departure', None)
-        if validate_arrival_departure(arrival, departure):
+        arrival = data.get('arrival', getattr(self.instance, 'arrival', None))
+        departure = data.get('departure', getattr(self.instance, 'departure', None))
+        if arrival and departure and validate_arrival_departure(arrival, departure):
             raise serializers.ValidationError({
                 'invalid_dates': _('The arrival date cannot be less than the departure date')
             })
         return data
 
+    def update(self, instance, validated_data):
+        # booked_tickets and booking_count are maintained by atomic updates
+        # from the booking views, so only the submitted fields are written
+        # back and stale counters on this instance never overwrite
+        # concurrent reservations.
+        capacity = validated_data.pop('capacity', None)
+        with transaction.atomic():
+            if capacity is not None:
+                resized = Flight.objects.filter(
+                    pk=instance.pk,
+                    booked_tickets__lte=capacity
+                ).update(capacity=capacity)
+                if not resized:
+                    raise serializers.ValidationError({
+                        'capacity': _('The capacity cannot be less than the number of booked tickets')
+                    })
+                instance.capacity = capacity
+            for attr, value in validated_data.items():
+                setattr(instance, attr, value)
+            instance.save(update_fields=list(validated_data) + ['modified_at'])
+        instance.refresh_from_db(fields=['booked_tickets', 'booking_count'])
+        return instance
+
+
+class FlightImportSerializer(FLightSerializer):
+    """
+    Validates imported rows with the FLightSerializer rules. The unique
+    check on flight_number is left to the importer, which upserts on it.
+    """
+    class Meta(FLightSerializer.Meta):
+        extra_kwargs = {
+            'flight_number': {
+                'validators': [alphanumeric]
+            }
+        }
+
 
 class FlightDetailSerializer(FLightSerializer):
-    bookings = BookingSerializer(many=True, read_only=True)
     type_of_flight = serializers.ChoiceField(
             choices=Flight.FLIGHT_TYPES
         )
@@ -104,12 +209,102 @@ class FlightDetailSerializer(FLightSerializer):
             'type_of_flight_detail',
             'flight_status_detail',
             'created_at',
-            'modified_at',
-            'bookings'
+            'modified_at'
         )
 
 
-class ProfileSerializer(serializers.ModelSerializer):
+class FlightSearchSerializer(serializers.Serializer):
+    origin = serializers.CharField(required=False)
+    destination = serializers.CharField(required=False)
+    departure_from = serializers.DateField(required=False)
+    departure_to = serializers.DateField(required=False)
+    flight_status = serializers.ChoiceField(choices=Flight.FLIGHT_STATUS, required=False)
+    type_of_flight = serializers.ChoiceField(choices=Flight.FLIGHT_TYPES, required=False)
+    airline = serializers.CharField(required=False)
+    max_price = serializers.IntegerField(min_value=0, required=False)
+
+    lookups = {
+        'origin': 'origin',
+        'destination': 'destination',
+        'departure_from': 'departure__gte',
+        'departure_to': 'departure__lte',
+        'flight_status': 'flight_status',
+        'type_of_flight': 'type_of_flight',
+        'airline': 'airline',
+        'max_price': 'price__lte',
+    }
+
+    def validate(self, data):
+        departure_from = data.get('departure_from', None)
+        departure_to = data.get('departure_to', None)
+        if departure_from and departure_to and validate_arrival_departure(departure_to, departure_from):
+            raise serializers.ValidationError({
+                'invalid_dates': _('The departure_to date cannot be less than the departure_from date')
+            })
+        return data
+
+    def get_filters(self):
+        return {
+            self.lookups[field]: value for field, value in self.validated_data.items()
+        }
+
+
+class FareSummarySerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    class Meta:
+        model = FareSummary
+        fields = ('departure', 'flight_count', 'min_price', 'max_price', 'avg_price')
+
+
+class FareCalendarSerializer(serializers.Serializer):
+    origin = serializers.CharField()
+    destination = serializers.CharField()
+    month = serializers.DateField(input_formats=['%Y-%m'])
+
+    def get_filters(self):
+        month = self.validated_data['month']
+        last_day = calendar.monthrange(month.year, month.month)[1]
+        return {
+            'origin': self.validated_data['origin'],
+            'destination': self.validated_data['destination'],
+            'departure__range': (month, month.replace(day=last_day))
+        }
+
+
+class ExportFilterSerializer(serializers.Serializer):
+    modified_since = serializers.DateTimeField(required=False)
+    modified_until = serializers.DateTimeField(required=False)
+
+    def validate(self, data):
+        modified_since = data.get('modified_since', None)
+        modified_until = data.get('modified_until', None)
+        if modified_since and modified_until and modified_until <= modified_since:
+            raise serializers.ValidationError({
+                'invalid_dates': _('The modified_until time must be after the modified_since time')
+            })
+        return data
+
+
+class ProfileSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Profile
         fields = '__all__'
+
+
+class PassportUploadSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    url = serializers.HyperlinkedIdentityField(view_name='passport-upload-status')
+    status_detail = serializers.CharField(source='get_status_display', read_only=True)
+    profile = ProfileSerializer(read_only=True)
+
+    class Meta:
+        model = PassportUpload
+        fields = (
+            'id',
+            'url',
+            'status',
+            'status_detail',
+            'attempts',
+            'error',
+            'profile',
+            'created_at',
+            'modified_at'
+        )
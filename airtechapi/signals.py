@@ -0,0 +1,60 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from .authentication import invalidate_cached_user
+from .cache import catalog_cache
+from .events import publish_flight_events
+from .models import Flight, Booking
+from .utils.fares import FARE_FIELDS, fare_key, refresh_fare_summaries
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=Flight)
+@receiver(post_delete, sender=Flight)
+def invalidate_cached_flight(sender, instance, **kwargs):
+    catalog_cache.invalidate_flight(instance.pk)
+
+
+@receiver(post_save, sender=Flight)
+def publish_flight_status(sender, instance, **kwargs):
+    publish_flight_events([instance])
+
+
+def _changes_fares(update_fields):
+    return update_fields is None or not FARE_FIELDS.isdisjoint(update_fields)
+
+
+@receiver(pre_save, sender=Flight)
+def remember_fare_key(sender, instance, update_fields=None, **kwargs):
+    instance._previous_fare_key = None
+    if instance.pk is not None and _changes_fares(update_fields):
+        instance._previous_fare_key = Flight.objects.filter(pk=instance.pk).values_list(
+            'origin', 'destination', 'departure'
+        ).first()
+
+
+@receiver(post_save, sender=Flight)
+def update_fare_summary(sender, instance, update_fields=None, **kwargs):
+    if _changes_fares(update_fields):
+        keys = [fare_key(instance)]
+        if getattr(instance, '_previous_fare_key', None):
+            keys.append(instance._previous_fare_key)
+        refresh_fare_summaries(keys)
+
+
+@receiver(post_delete, sender=Flight)
+def remove_from_fare_summary(sender, instance, **kwargs):
+    refresh_fare_summaries([fare_key(instance)])
+
+
+@receiver(post_save, sender=Booking)
+@receiver(post_delete, sender=Booking)
+def invalidate_cached_booking_flight(sender, instance, **kwargs):
+    catalog_cache.invalidate_flight(instance.flight_id)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_authenticated_user(sender, instance, **kwargs):
+    invalidate_cached_user(instance.pk)
@@ -0,0 +1,52 @@
+import os
+import shutil
+import uuid
+from urllib.parse import urljoin
+import cloudinary.uploader
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+class PassportStorage:
+    """
+    Where processed passport scans end up. `upload` receives the path of a
+    spooled file and returns the `secure_url` and `public_id` of the stored
+    copy, replacing the existing copy when `public_id` is given.
+    """
+    def upload(self, path, public_id=None):
+        raise NotImplementedError
+
+
+class CloudinaryPassportStorage(PassportStorage):
+    eager = [
+        {"width": 1350, "height": 1200}
+    ]
+
+    def upload(self, path, public_id=None):
+        options = {'eager': self.eager}
+        if public_id:
+            options['public_id'] = public_id
+        uploaded = cloudinary.uploader.upload(path, **options)
+        return {
+            'secure_url': uploaded['secure_url'],
+            'public_id': uploaded['public_id']
+        }
+
+
+class LocalPassportStorage(PassportStorage):
+    """
+    Keeps passports under PASSPORT_STORAGE_ROOT, served from
+    PASSPORT_STORAGE_URL. Meant for development, tests and benchmarks.
+    """
+    def upload(self, path, public_id=None):
+        public_id = public_id or uuid.uuid4().hex
+        os.makedirs(settings.PASSPORT_STORAGE_ROOT, exist_ok=True)
+        shutil.copyfile(path, os.path.join(settings.PASSPORT_STORAGE_ROOT, public_id))
+        return {
+            'secure_url': urljoin(settings.PASSPORT_STORAGE_URL, public_id),
+            'public_id': public_id
+        }
+
+
+def get_passport_storage():
+    return import_string(settings.PASSPORT_STORAGE_BACKEND)()
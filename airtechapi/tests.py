@@ -1,14 +1,54 @@
+import csv
+import gzip
 import json
+from collections import OrderedDict
 import os
+import re
 import datetime
+from decimal import Decimal
+import multiprocessing
+import threading
+import time
 import cloudinary.uploader
+from django.db import connection, connections
+from django.db.models import Prefetch
+from django.db.models.query import QuerySet
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from rest_framework.renderers import JSONRenderer
 from rest_framework.views import status
-from rest_framework.test import APITestCase, APIClient
+from rest_framework.test import APITestCase, APITransactionTestCase, APIClient
 from django.contrib.auth import get_user_model
-from unittest.mock import Mock
-from tempfile import TemporaryFile
-from .models import Flight
+from io import StringIO
+import brotli
+import msgpack
+from unittest.mock import Mock, patch
+from tempfile import NamedTemporaryFile, TemporaryDirectory
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.test import RequestFactory, TransactionTestCase, override_settings
+from .admin import BookingAdminForm
+from .pagination import EstimatedCountPaginator
+from .models import FareSummary, Flight, Booking, PassportUpload, Profile
+from .cache import CatalogCache, catalog_cache
+from .events import get_flight_event_broker
+from .fast_serializers import (
+    CompiledSerializer, fast_booking_serializer, fast_flight_detail_serializer, fast_flight_serializer)
+from .serializers import BookingSerializer, FLightSerializer, FlightDetailSerializer
+from .authentication import user_cache
+from .middleware import ServerTimingMiddleware, compress
+from .routers import ReplicaRouter, next_replica, get_read_alias, set_read_alias
+from .utils.denylist import token_denylist
+from .utils.fares import compare_fare_summaries
+from .utils.hashers import ConfigurablePBKDF2PasswordHasher
+from .utils.importer import import_flights
+from .utils.lru import LRUCache
+from .utils.status import apply_status_updates
+from .utils.uploads import enqueue_passport_upload, process_pending_passport_uploads
+from .views import FlightDetailView
 
 User = get_user_model()
 
@@ -17,6 +57,9 @@ class BaseViewTest(APITestCase):
     client = APIClient()
 
     def setUp(self):
+        caches['catalog'].clear()
+        user_cache.clear()
+        token_denylist.clear()
         user = User.objects.create(username='paddy', email='paddy@mail.com')
         user.set_password('fakepassword')
         user.save()
@@ -119,6 +162,47 @@ class AuthUserAPITest(BaseViewTest):
         assert response.status_code == status.HTTP_400_BAD_REQUEST
         assert response.data['error'] == "Invalid Credentials"
 
+    def login(self, username, password):
+        return self.client.post(
+            reverse("auth-login"),
+            data=json.dumps({"username": username, "password": password}),
+            content_type="application/json"
+        )
+
+    def test_login_user_runs_a_single_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.login("paddy", "fakepassword")
+        assert response.status_code == status.HTTP_200_OK
+        assert len(queries) == 1
+
+    def test_login_unknown_user_still_hashes_the_password(self):
+        with patch.object(ConfigurablePBKDF2PasswordHasher, 'encode', autospec=True,
+                          side_effect=ConfigurablePBKDF2PasswordHasher.encode) as encode:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.login("paddington", "password")
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert len(queries) == 1
+        assert encode.call_count == 1
+
+    def test_login_upgrades_password_hash_work_factor(self):
+        with override_settings(PASSWORD_HASH_ITERATIONS=1000):
+            user = User.objects.create(username='legacy', email='legacy@mail.com')
+            user.set_password('legacypassword')
+            user.save()
+        assert user.password.split('$')[1] == '1000'
+
+        with override_settings(PASSWORD_HASH_ITERATIONS=2000):
+            response = self.login("legacy", "legacypassword")
+        assert response.status_code == status.HTTP_200_OK
+        user.refresh_from_db()
+        assert user.password.split('$')[1] == '2000'
+
+        with override_settings(PASSWORD_HASH_ITERATIONS=1000):
+            response = self.login("legacy", "wrongpassword")
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        user.refresh_from_db()
+        assert user.password.split('$')[1] == '2000'
+
 
 class FlightTest(BaseViewTest):
     """
@@ -140,7 +224,7 @@ class FlightTest(BaseViewTest):
             content_type="application/json"
         )
         assert response.status_code == status.HTTP_200_OK
-        assert len(response.data) == 1
+        assert len(response.data['results']) == 1
 
     def test_create_flight_without_auth_token_fails(self):
         url = reverse(
@@ -438,6 +522,30 @@ class BookingTest(BaseViewTest):
 
 
 class TestPassportUpload(BaseViewTest):
+    def setUp(self):
+        super().setUp()
+        media = TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.spool_dir = os.path.join(media.name, 'spool')
+        self.storage_root = os.path.join(media.name, 'passports')
+        passport_settings = self.settings(
+            PASSPORT_SPOOL_DIR=self.spool_dir,
+            PASSPORT_STORAGE_ROOT=self.storage_root
+        )
+        passport_settings.enable()
+        self.addCleanup(passport_settings.disable)
+
+    def upload_passport(self, method='post', data=None):
+        url = reverse(
+            "passport-upload",
+        )
+        with open(os.path.dirname(__file__) + '/passport.jpg', 'rb') as passport:
+            return getattr(self.client, method)(
+                url,
+                dict(data or {}, passport=passport),
+                format="multipart",
+            )
+
     def test_passport_upload_success(self):
         self.user_token(
             data={
@@ -451,21 +559,2054 @@ class TestPassportUpload(BaseViewTest):
         cloudinary.uploader.upload = Mock(
             side_effect=lambda *args, **kwargs: cloudinary_mock_response)
 
+        response = self.upload_passport()
+
+        response_data = response.data
+        assert response.status_code == 202
+        assert response_data['data']['status'] == "P"
+        assert not cloudinary.uploader.upload.called
+        assert process_pending_passport_uploads() == 1
+        assert cloudinary.uploader.upload.called
+        response = self.client.get(response_data['data']['url'])
+        assert response.data['status'] == "D"
+        assert response.data['profile']['passport_url'] == 'http://hello.com/here'
+        assert response.data['profile']['cloudinary_public_id'] == 'public-id'
+        assert os.listdir(self.spool_dir) == []
+
+    @override_settings(PASSPORT_STORAGE_BACKEND='airtechapi.storage.LocalPassportStorage')
+    def test_passport_upload_and_update_with_local_storage_success(self):
+        self.user_token(
+            data={
+                "username": "paddy",
+                "password": "fakepassword"
+            })
+        response = self.upload_passport()
+        assert response.status_code == 202
+        assert process_pending_passport_uploads() == 1
+        response = self.client.get(response.data['data']['url'])
+        assert response.data['status'] == "D"
+        profile = response.data['profile']
+        with open(os.path.dirname(__file__) + '/passport.jpg', 'rb') as passport:
+            with open(os.path.join(self.storage_root, profile['cloudinary_public_id']), 'rb') as stored:
+                assert stored.read() == passport.read()
+
+        response = self.upload_passport()
+        assert response.status_code == 400
+        response = self.upload_passport(method='put', data={'id': profile['id']})
+        assert response.status_code == 202
+        assert process_pending_passport_uploads() == 1
+        response = self.client.get(response.data['data']['url'])
+        assert response.data['profile']['cloudinary_public_id'] == profile['cloudinary_public_id']
+
+    def test_failed_passport_upload_is_retried_then_failed(self):
+        self.user_token(
+            data={
+                "username": "paddy",
+                "password": "fakepassword"
+            })
+        cloudinary.uploader.upload = Mock(side_effect=Exception('Cloudinary is down'))
+        response = self.upload_passport()
+        with self.settings(PASSPORT_UPLOAD_MAX_ATTEMPTS=2):
+            assert process_pending_passport_uploads(limit=1) == 1
+            job = PassportUpload.objects.get(pk=response.data['data']['id'])
+            assert job.status == PassportUpload.PENDING
+            assert process_pending_passport_uploads() == 1
+        job.refresh_from_db()
+        assert job.status == PassportUpload.FAILED
+        assert job.error == 'Cloudinary is down'
+        assert cloudinary.uploader.upload.call_count == 2
+
+    def test_passport_upload_beyond_max_size_fails(self):
+        self.user_token(
+            data={
+                "username": "paddy",
+                "password": "fakepassword"
+            })
+        passport_size = os.path.getsize(os.path.dirname(__file__) + '/passport.jpg')
+        with self.settings(PASSPORT_UPLOAD_MAX_SIZE=passport_size - 1):
+            response = self.upload_passport()
+        assert response.status_code == 413
+        large_scan = SimpleUploadedFile('passport.jpg', b'\xff\xd8\xff' + b'0' * 200 * 1024)
+        with self.settings(PASSPORT_UPLOAD_MAX_SIZE=100 * 1024):
+            response = self.client.post(reverse("passport-upload"), {'passport': large_scan}, format="multipart")
+        assert response.status_code == 413
+        assert not PassportUpload.objects.exists()
+
+    def test_passport_upload_with_unsupported_file_fails(self):
+        self.user_token(
+            data={
+                "username": "paddy",
+                "password": "fakepassword"
+            })
+        response = self.client.post(
+            reverse("passport-upload"),
+            {'passport': SimpleUploadedFile('passport.jpg', b'#!/bin/sh\necho not a passport\n')},
+            format="multipart"
+        )
+        assert response.status_code == 400
+        assert response.data['passport'][0] == 'The passport scan must be a JPEG, PNG or PDF file.'
+        assert not PassportUpload.objects.exists()
+
+    def test_passport_upload_status_of_other_user_fails(self):
+        self.user_token(
+            data={
+                "username": "paddy",
+                "password": "fakepassword"
+            })
+        response = self.upload_passport()
+        self.client.credentials()
+        self.user_token(
+            data={
+                "username": "maddy",
+                "password": "thepassword"
+            })
+        response = self.client.get(response.data['data']['url'])
+        assert response.status_code == 404
+
+
+class FlightPaginationTest(BaseViewTest):
+    """
+    Test the cursor pagination of the flight/ endpoint
+    """
+    def create_flights(self, flight_numbers):
+        for flight_number in flight_numbers:
+            Flight.objects.create(
+                origin="Lagos",
+                destination="Enugu",
+                departure="2019-08-26",
+                arrival="2019-08-27",
+                flight_number=flight_number,
+                airline="Emirates",
+                price=15000
+            )
+
+    def test_walk_flight_list_pages_with_cursor_success(self):
+        self.create_flights(["BK 0005", "BK 0001", "BK 0004", "BK 0002", "BK 0003"])
+        self.user_token(
+            data={
+                "username": "paddy",
+                "password": "fakepassword"
+            })
         url = reverse(
-            "passport-upload",
+            "flight-list"
+        ) + '?page_size=2'
+        flight_numbers = []
+        while url:
+            response = self.client.get(
+                url,
+                content_type="application/json"
+            )
+            assert response.status_code == status.HTTP_200_OK
+            assert len(response.data['results']) <= 2
+            flight_numbers += [flight['flight_number'] for flight in response.data['results']]
+            if len(flight_numbers) == 2:
+                # rows inserted behind the cursor must not shift the next page
+                self.create_flights(["BK 0000"])
+            url = response.data['next']
+        assert flight_numbers == ["BK 0001", "BK 0002", "BK 0003", "BK 0004", "BK 0005"]
+
+    def test_get_flight_list_with_invalid_cursor_fails(self):
+        self.user_token(
+            data={
+                "username": "paddy",
+                "password": "fakepassword"
+            })
+        url = reverse(
+            "flight-list"
+        ) + '?cursor=invalid'
+        response = self.client.get(
+            url,
+            content_type="application/json"
+        )
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+class FlightSearchTest(BaseViewTest):
+    """
+    Test the flight/search/ endpoint
+    """
+    routes = (
+        ("Lagos", "Enugu"), ("Lagos", "Abuja"), ("Abuja", "Kano"), ("Kano", "Lagos"),
+        ("Enugu", "Lagos"), ("Abuja", "Lagos"), ("Lagos", "Kano"), ("Kano", "Abuja"),
+    )
+
+    def seed_flights(self, count):
+        start = datetime.date.today()
+        Flight.objects.bulk_create([
+            Flight(
+                origin=self.routes[index % len(self.routes)][0],
+                destination=self.routes[index % len(self.routes)][1],
+                departure=start + datetime.timedelta(days=index % 365),
+                arrival=start + datetime.timedelta(days=index % 365 + 1),
+                flight_status=Flight.DELAYED if index % 2 else Flight.SCHEDULED,
+                flight_number="SK{:05d}".format(index),
+                airline="Emirates" if index % 3 else "Arik",
+                price=10000 + index % 50 * 1000
+            ) for index in range(count)
+        ])
+
+    def test_search_flights_by_route_date_and_price_success(self):
+        self.seed_flights(200)
+        self.user_token(
+            data={
+                "username": "paddy",
+                "password": "fakepassword"
+            })
+        today = datetime.date.today()
+        url = reverse(
+            "flight-search"
+        )
+        response = self.client.get(
+            url,
+            {
+                "origin": "Lagos",
+                "destination": "Enugu",
+                "departure_from": today.strftime('%Y-%m-%d'),
+                "departure_to": (today + datetime.timedelta(days=100)).strftime('%Y-%m-%d'),
+                "flight_status": "S",
+                "max_price": 40000,
+                "page_size": 100
+            }
+        )
+        assert response.status_code == status.HTTP_200_OK
+        expected = Flight.objects.filter(
+            origin="Lagos",
+            destination="Enugu",
+            departure__range=(today, today + datetime.timedelta(days=100)),
+            flight_status="S",
+            price__lte=40000
+        )
+        assert expected.exists()
+        assert [flight['id'] for flight in response.data['results']] == [flight.id for flight in expected]
+
+    def test_search_flights_with_invalid_parameters_fails(self):
+        self.user_token(
+            data={
+                "username": "paddy",
+                "password": "fakepassword"
+            })
+        url = reverse(
+            "flight-search"
+        )
+        response = self.client.get(
+            url,
+            {
+                "departure_from": "2019-08-27",
+                "departure_to": "2019-08-26",
+                "flight_status": "X"
+            }
+        )
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert "flight_status" in response.data
+
+    def test_search_flights_by_route_and_date_uses_index(self):
+        self.seed_flights(20000)
+        self.user_token(
+            data={
+                "username": "paddy",
+                "password": "fakepassword"
+            })
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE airtechapi_flight")
+        today = datetime.date.today()
+        url = reverse("flight-search") + "?origin=Lagos&destination=Enugu&departure_from={}&departure_to={}".format(
+            today, today + datetime.timedelta(days=7))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        assert response.status_code == status.HTTP_200_OK
+        # explain the paginated, ordered query the view ran, not a bare filter
+        searches = [query['sql'] for query in queries if query['sql'].startswith('SELECT "airtechapi_flight"')]
+        assert len(searches) == 1
+        assert 'ORDER BY "airtechapi_flight"."flight_number"' in searches[0] and 'LIMIT' in searches[0]
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN ' + searches[0])
+            plan = '\n'.join(row[0] for row in cursor.fetchall())
+        assert "flight_route_departure_idx" in plan
+
+
+class FlightBookingsTest(BaseViewTest):
+    """
+    Test the included bookings of the flight/<pk> and flight/<pk>/bookings endpoints
+    """
+    def add_bookings(self, flight, count):
+        start = User.objects.count()
+        passengers = User.objects.bulk_create([
+            User(username='passenger{}'.format(start + index)) for index in range(count)
+        ])
+        Booking.objects.bulk_create([
+            Booking(flight=flight, passenger=passenger) for passenger in passengers
+        ])
+        # bulk_create skips the signals that drop the cached flight detail
+        catalog_cache.invalidate_flight(flight.id)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(
+                url,
+                content_type="application/json"
+            )
+        assert response.status_code == status.HTTP_200_OK
+        return len(context.captured_queries), response
+
+    def test_get_flight_detail_query_count_is_constant(self):
+        flight01 = self.create_flight()
+        self.user_token(
+            data={
+                "username": "paddy",
+                "password": "fakepassword"
+            })
+        url = reverse(
+            "flight-detail",
+            kwargs={
+                "pk": flight01.id
+            }
+        ) + '?include=bookings'
+        # warm the authentication cache so only the view's queries are counted
+        self.count_queries(url)
+        self.add_bookings(flight01, 1)
+        few_queries, response = self.count_queries(url)
+        assert len(response.data['bookings']) == 1
+        self.add_bookings(flight01, 30)
+        many_queries, response = self.count_queries(url)
+        assert len(response.data['bookings']) == 31
+        assert response.data['bookings'][0]['flight'] == "BK 6089"
+        assert few_queries == many_queries
+
+    def test_get_flight_detail_leaves_bookings_out(self):
+        flight01 = self.create_flight()
+        self.add_bookings(flight01, 3)
+        self.user_token(
+            data={
+                "username": "paddy",
+                "password": "fakepassword"
+            })
+        url = reverse("flight-detail", kwargs={"pk": flight01.id})
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        assert 'bookings' not in response.data
+        assert not any('airtechapi_booking' in query['sql'] for query in queries)
+        response = self.client.get(url, {"include": "passengers"})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert response.data['include'] == "Only bookings can be included"
+
+    @patch.object(FlightDetailView, 'max_included_bookings', 2)
+    def test_get_flight_detail_included_bookings_are_capped(self):
+        flight01 = self.create_flight()
+        self.add_bookings(flight01, 3)
+        self.user_token(
+            data={
+                "username": "paddy",
+                "password": "fakepassword"
+            })
+        url = reverse("flight-detail", kwargs={"pk": flight01.id})
+        response = self.client.get(url, {"include": "bookings"})
+        first = list(Booking.objects.filter(flight=flight01).order_by('pk').values_list('pk', flat=True)[:2])
+        assert [booking['id'] for booking in response.data['bookings']] == first
+
+    def test_get_flight_bookings_paginated_success(self):
+        flight01 = self.create_flight()
+        self.add_bookings(flight01, 5)
+        self.user_token(
+            data={
+                "username": "paddy",
+                "password": "fakepassword"
+            })
+        url = reverse(
+            "flight-bookings",
+            kwargs={
+                "pk": flight01.id
+            }
+        ) + '?page_size=2'
+        self.count_queries(url)
+        few_queries, response = self.count_queries(url)
+        assert len(response.data['results']) == 2
+        assert response.data['results'][0]['passenger']['username'].startswith('passenger')
+        booking_ids = [booking['id'] for booking in response.data['results']]
+        while response.data['next']:
+            many_queries, response = self.count_queries(response.data['next'])
+            assert many_queries == few_queries
+            booking_ids += [booking['id'] for booking in response.data['results']]
+        assert sorted(booking_ids) == sorted(flight01.bookings.values_list('id', flat=True))
+
+    def test_get_bookings_of_missing_flight_fails(self):
+        self.user_token(
+            data={
+                "username": "paddy",
+                "password": "fakepassword"
+            })
+        url = reverse(
+            "flight-bookings",
+            kwargs={
+                "pk": 0
+            }
+        )
+        response = self.client.get(
+            url,
+            content_type="application/json"
         )
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
 
-        with TemporaryFile() as temp_image_obj:
-            for line in open(os.path.dirname(__file__) + '/passport.jpg', 'rb'):
-                temp_image_obj.write(line)
+class BookingListTest(BaseViewTest):
+    """
+    Test the booking/ list endpoint
+    """
+    def add_bookings(self, username, count):
+        passenger = User.objects.get(username=username)
+        start = Flight.objects.count()
+        flights = Flight.objects.bulk_create([
+            Flight(
+                origin="Lagos",
+                destination="Enugu",
+                departure="2019-08-26",
+                arrival="2019-08-27",
+                flight_number="BL{:05d}".format(start + index),
+                airline="Emirates",
+                price=15000
+            ) for index in range(count)
+        ])
+        Booking.objects.bulk_create([
+            Booking(flight=flight, passenger=passenger) for flight in flights
+        ])
 
-            response = self.client.post(
+    def get_bookings(self):
+        url = reverse(
+            "booking-list"
+        )
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(
                 url,
-                {'passport': temp_image_obj},
-                format="multipart",
+                content_type="application/json"
             )
+        assert response.status_code == status.HTTP_200_OK
+        return len(context.captured_queries), response
+
+    def test_get_booking_list_returns_own_bookings_only(self):
+        self.add_bookings("maddy", 3)
+        self.add_bookings("paddy", 2)
+        self.user_token(
+            data={
+                "username": "paddy",
+                "password": "fakepassword"
+            })
+        # warm the authentication cache so only the view's queries are counted
+        self.get_bookings()
+        few_queries, response = self.get_bookings()
+        assert len(response.data['results']) == 2
+        assert {booking['passenger']['username'] for booking in response.data['results']} == {"paddy"}
+        self.add_bookings("maddy", 20)
+        self.add_bookings("paddy", 10)
+        many_queries, response = self.get_bookings()
+        assert len(response.data['results']) == 12
+        assert few_queries == many_queries
+
+
+class SeatInventoryTest(BaseViewTest):
+    """
+    Test the seat reservations of the booking/ endpoints
+    """
+    def book(self, data):
+        return self.client.post(
+            reverse("booking-list"),
+            data=json.dumps(data),
+            content_type="application/json"
+        )
+
+    def test_create_booking_beyond_capacity_fails(self):
+        flight01 = self.create_flight()
+        flight01.capacity = 3
+        flight01.save()
+        self.user_token(
+            data={
+                "username": "maddy",
+                "password": "thepassword"
+            })
+        response = self.book({"flight": "BK 6089", "number_of_tickets": 4})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert response.data['message'] == "There are not enough seats left on this flight"
+        response = self.book({"flight": "BK 6089", "number_of_tickets": 3})
+        assert response.status_code == status.HTTP_201_CREATED
+        flight01.refresh_from_db()
+        assert flight01.seats_remaining == 0
+
+    def test_update_and_delete_booking_release_seats(self):
+        flight01 = self.create_flight()
+        flight02 = Flight.objects.create(
+            origin="Lagos",
+            destination="Abuja",
+            departure="2019-08-26",
+            arrival="2019-08-27",
+            flight_number="BK 6090",
+            airline="Emirates",
+            price=15000,
+            capacity=2
+        )
+        self.user_token(
+            data={
+                "username": "maddy",
+                "password": "thepassword"
+            })
+        response = self.book({"flight": "BK 6089", "number_of_tickets": 3})
+        url = reverse(
+            "booking-detail",
+            kwargs={
+                "pk": response.data['id']
+            }
+        )
+        response = self.client.put(
+            url,
+            data=json.dumps({"flight": "BK 6089", "number_of_tickets": 1}),
+            content_type="application/json"
+        )
+        assert response.status_code == status.HTTP_200_OK
+        flight01.refresh_from_db()
+        assert flight01.booked_tickets == 1
+        response = self.client.put(
+            url,
+            data=json.dumps({"flight": "BK 6090", "number_of_tickets": 3}),
+            content_type="application/json"
+        )
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        flight01.refresh_from_db()
+        assert flight01.booked_tickets == 1
+        assert flight01.booking_count == 1
+        response = self.client.put(
+            url,
+            data=json.dumps({"flight": "BK 6090", "number_of_tickets": 2}),
+            content_type="application/json"
+        )
+        assert response.status_code == status.HTTP_200_OK
+        flight01.refresh_from_db()
+        flight02.refresh_from_db()
+        assert flight01.booked_tickets == 0
+        assert flight01.booking_count == 0
+        assert flight02.booked_tickets == 2
+        assert flight02.booking_count == 1
+        response = self.client.delete(url)
+        assert response.status_code == status.HTTP_204_NO_CONTENT
+        flight02.refresh_from_db()
+        assert flight02.booked_tickets == 0
+        assert flight02.booking_count == 0
 
-            response_data = response.data
-            assert response.status_code == 201
-            assert response_data['data']['id'] == 1
-            assert cloudinary.uploader.upload.called
+    def test_move_booking_updates_flights_in_primary_key_order(self):
+        flight01 = self.create_flight()
+        flight02 = Flight.objects.create(
+            origin="Lagos",
+            destination="Abuja",
+            departure="2019-08-26",
+            arrival="2019-08-27",
+            flight_number="BK 6090",
+            airline="Emirates",
+            price=15000
+        )
+        self.user_token(
+            data={
+                "username": "maddy",
+                "password": "thepassword"
+            })
+        url = reverse(
+            "booking-detail",
+            kwargs={
+                "pk": self.book({"flight": "BK 6089", "number_of_tickets": 2}).data['id']
+            }
+        )
+        for flight_number in ("BK 6090", "BK 6089"):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.put(
+                    url,
+                    data=json.dumps({"flight": flight_number, "number_of_tickets": 2}),
+                    content_type="application/json"
+                )
+            assert response.status_code == status.HTTP_200_OK
+            updated = [
+                int(re.findall(r'"airtechapi_flight"\."id" = (\d+)', query['sql'])[-1]) for query in queries
+                if query['sql'].startswith('UPDATE "airtechapi_flight"')
+            ]
+            assert updated == [flight01.id, flight02.id]
+        flight01.refresh_from_db()
+        flight02.refresh_from_db()
+        assert (flight01.booked_tickets, flight02.booked_tickets) == (2, 0)
+
+    def test_reduce_capacity_below_booked_tickets_fails(self):
+        flight01 = self.create_flight()
+        self.user_token(
+            data={
+                "username": "maddy",
+                "password": "thepassword"
+            })
+        self.book({"flight": "BK 6089", "number_of_tickets": 5})
+        url = reverse(
+            "flight-detail",
+            kwargs={
+                "pk": flight01.id
+            }
+        )
+        response = self.client.patch(
+            url,
+            data=json.dumps({"capacity": 4}),
+            content_type="application/json"
+        )
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        response = self.client.patch(
+            url,
+            data=json.dumps({"capacity": 5}),
+            content_type="application/json"
+        )
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['seats_remaining'] == 0
+
+    def test_flight_responses_read_occupancy_counters(self):
+        flight01 = self.create_flight()
+        self.user_token(
+            data={
+                "username": "paddy",
+                "password": "fakepassword"
+            })
+        self.book({"flight": "BK 6089", "number_of_tickets": 2})
+        self.client.credentials()
+        self.user_token(
+            data={
+                "username": "maddy",
+                "password": "thepassword"
+            })
+        self.book({"flight": "BK 6089", "number_of_tickets": 3})
+        response = self.client.get(reverse("flight-list"))
+        assert response.data['results'][0]['booked_tickets'] == 5
+        assert response.data['results'][0]['booking_count'] == 2
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("flight-detail", kwargs={"pk": flight01.id}))
+        assert response.data['booked_tickets'] == 5
+        assert response.data['booking_count'] == 2
+        assert not any('airtechapi_booking' in query['sql'] for query in queries)
+        response = self.client.patch(
+            reverse("flight-detail", kwargs={"pk": flight01.id}),
+            data=json.dumps({"booked_tickets": 0, "booking_count": 0, "price": 16000}),
+            content_type="application/json"
+        )
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['booked_tickets'] == 5
+        assert response.data['booking_count'] == 2
+
+    def test_reconcile_command_repairs_drifted_counters(self):
+        flight01 = self.create_flight()
+        flight02 = Flight.objects.create(
+            origin="Lagos", destination="Abuja", departure="2019-08-26", arrival="2019-08-27",
+            flight_number="BK 6090", airline="Emirates", price=15000
+        )
+        Flight.objects.create(
+            origin="Lagos", destination="Kano", departure="2019-08-26", arrival="2019-08-27",
+            flight_number="BK 6091", airline="Emirates", price=15000, booked_tickets=4, booking_count=1
+        )
+        Booking.objects.create(flight=flight01, passenger=User.objects.get(username="paddy"), number_of_tickets=2)
+        Booking.objects.create(flight=flight01, passenger=User.objects.get(username="maddy"), number_of_tickets=1)
+        Booking.objects.create(flight=flight02, passenger=User.objects.get(username="paddy"))
+        Flight.objects.filter(pk=flight02.pk).update(booked_tickets=1, booking_count=1)
+        stdout = StringIO()
+        call_command('reconcile_flight_counters', chunk_size=2, stdout=stdout)
+        assert "Repaired the counters of 2 flights" in stdout.getvalue()
+        assert list(Flight.objects.order_by('pk').values_list('booked_tickets', 'booking_count')) == [
+            (3, 2), (1, 1), (0, 0)
+        ]
+
+
+class BulkBookingTest(BaseViewTest):
+    """
+    Test the booking/bulk/ endpoint
+    """
+    def setUp(self):
+        super().setUp()
+        self.flights = [
+            Flight.objects.create(
+                origin="Lagos",
+                destination="Enugu",
+                departure="2019-08-26",
+                arrival="2019-08-27",
+                flight_number="BB 000{}".format(index),
+                airline="Emirates",
+                price=15000,
+                capacity=4
+            ) for index in range(3)
+        ]
+        self.user_token(
+            data={
+                "username": "paddy",
+                "password": "fakepassword"
+            })
+
+    def book(self, data):
+        return self.client.post(
+            reverse("booking-bulk"),
+            data=json.dumps(data),
+            content_type="application/json"
+        )
+
+    def test_bulk_booking_with_valid_details_success(self):
+        data = [
+            {"flight": "BB 0000", "number_of_tickets": 2},
+            {"flight": "BB 0001"},
+            {"flight": "BB 0002", "number_of_tickets": 4},
+        ]
+        with CaptureQueriesContext(connection) as context:
+            response = self.book(data)
+        assert response.status_code == status.HTTP_201_CREATED
+        assert [booking['flight'] for booking in response.data] == ["BB 0000", "BB 0001", "BB 0002"]
+        assert [booking['number_of_tickets'] for booking in response.data] == [2, 1, 4]
+        flight_queries = [
+            query for query in context.captured_queries
+            if query['sql'].startswith('SELECT') and 'FROM "airtechapi_flight"' in query['sql']
+        ]
+        assert len(flight_queries) == 1
+        inserts = [query for query in context.captured_queries if query['sql'].startswith('INSERT')]
+        assert len(inserts) == 1
+        assert [flight.seats_remaining for flight in Flight.objects.order_by('flight_number')] == [2, 3, 0]
+        assert [flight.booking_count for flight in Flight.objects.order_by('flight_number')] == [1, 1, 1]
+
+    def test_bulk_booking_is_all_or_nothing(self):
+        response = self.book([{"flight": "BB 0000"}])
+        assert response.status_code == status.HTTP_201_CREATED
+        response = self.book([
+            {"flight": "BB 0001"},
+            {"flight": "BB 0000"},
+        ])
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert response.data == [
+            {},
+            {"message": "The flight and the passenger fields should be unique together"}
+        ]
+        response = self.book([
+            {"flight": "BB 0001", "number_of_tickets": 1},
+            {"flight": "BB 0002", "number_of_tickets": 5},
+        ])
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert response.data == [
+            {},
+            {"message": "There are not enough seats left on this flight"}
+        ]
+        assert Booking.objects.count() == 1
+        assert Flight.objects.get(flight_number="BB 0001").booked_tickets == 0
+
+    def test_bulk_booking_with_invalid_data_fails(self):
+        response = self.book({"flight": "BB 0000"})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        response = self.book([
+            {"flight": "BB 0000"},
+            {"flight": "XX 0000"},
+        ])
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert response.data[0] == {}
+        assert 'flight' in response.data[1]
+
+    def test_bulk_booking_with_unhashable_flights_fails(self):
+        response = self.book([
+            {"flight": "BB 0000"},
+            {"flight": ["BB 0001"]},
+            {"flight": {}},
+        ])
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert response.data[0] == {}
+        assert response.data[1] == response.data[2] == {"flight": ["Invalid value."]}
+        assert Booking.objects.count() == 0
+
+
+class FlightImportTest(BaseViewTest):
+    """
+    Test the flight/import/ endpoint and the import_flights command
+    """
+    def dates(self, days):
+        return (datetime.date.today() + datetime.timedelta(days=days)).strftime('%Y-%m-%d')
+
+    def test_import_flights_csv_with_superuser_success(self):
+        self.create_flight()
+        self.user_token(
+            data={
+                "username": "maddy",
+                "password": "thepassword"
+            })
+        rows = [
+            "origin,destination,departure,arrival,flight_number,airline,price,flight_status",
+            "Lagos,Abuja,{0},{1},BK 6089,Emirates,20000,D".format(self.dates(1), self.dates(2)),
+            "Lagos,Kano,{0},{1},IM 0001,Arik,18000,".format(self.dates(1), self.dates(2)),
+            "Lagos,Kano,{0},{1},IM 0002,Arik,18000,S".format(self.dates(2), self.dates(1)),
+            "Lagos,Kano,2019-08-24,2019-08-25,IM 0003,Arik,18000,S",
+            "Lagos,Kano,{0},{1},IM-0004,Arik 2,18000,S".format(self.dates(1), self.dates(2)),
+        ]
+        upload = SimpleUploadedFile("schedule.csv", "\n".join(rows).encode('utf-8'))
+        response = self.client.post(
+            reverse("flight-import"),
+            {'file': upload},
+            format="multipart"
+        )
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['created'] == 1
+        assert response.data['updated'] == 1
+        assert response.data['failed'] == 3
+        assert [error['row'] for error in response.data['errors']] == [3, 4, 5]
+        assert 'invalid_dates' in response.data['errors'][0]['errors']
+        assert 'departure' in response.data['errors'][1]['errors']
+        assert 'flight_number' in response.data['errors'][2]['errors']
+        flight01 = Flight.objects.get(flight_number="BK 6089")
+        assert flight01.destination == "Abuja"
+        assert flight01.flight_status == "D"
+        assert Flight.objects.get(flight_number="IM 0001").flight_status == "S"
+
+    def test_import_flights_without_superuser_fails(self):
+        self.user_token(
+            data={
+                "username": "paddy",
+                "password": "fakepassword"
+            })
+        upload = SimpleUploadedFile("schedule.csv", b"origin")
+        response = self.client.post(
+            reverse("flight-import"),
+            {'file': upload},
+            format="multipart"
+        )
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+
+    def test_import_flights_ndjson_command_in_batches(self):
+        with NamedTemporaryFile(mode='w', suffix='.ndjson') as schedule:
+            for index in range(25):
+                schedule.write(json.dumps({
+                    "origin": "Lagos",
+                    "destination": "Enugu",
+                    "departure": self.dates(1),
+                    "arrival": self.dates(2),
+                    "flight_number": "ND {:04d}".format(index),
+                    "airline": "Emirates",
+                    "price": 15000 + index
+                }) + "\n")
+            schedule.write("not json\n")
+            schedule.flush()
+            stdout = StringIO()
+            stderr = StringIO()
+            call_command('import_flights', schedule.name, batch_size=10, stdout=stdout, stderr=stderr)
+        assert "25 created, 0 updated, 1 failed" in stdout.getvalue()
+        assert "row 26" in stderr.getvalue()
+        assert Flight.objects.filter(flight_number__startswith="ND").count() == 25
+
+    def test_import_flights_reports_duplicates_within_a_batch(self):
+        with NamedTemporaryFile(mode='w', suffix='.ndjson') as schedule:
+            for flight_number, price in [
+                ("ND 0001", 15000), ("ND 0002", 16000), ("ND 0001", 17000), ("ND 0001", 18000)
+            ]:
+                schedule.write(json.dumps({
+                    "origin": "Lagos",
+                    "destination": "Enugu",
+                    "departure": self.dates(1),
+                    "arrival": self.dates(2),
+                    "flight_number": flight_number,
+                    "airline": "Emirates",
+                    "price": price
+                }) + "\n")
+            schedule.flush()
+            stdout = StringIO()
+            stderr = StringIO()
+            call_command('import_flights', schedule.name, batch_size=3, stdout=stdout, stderr=stderr)
+        assert "2 created, 1 updated, 1 failed" in stdout.getvalue()
+        assert "row 3" in stderr.getvalue()
+        assert "Duplicate of row 1 in the same batch." in stderr.getvalue()
+        assert Flight.objects.get(flight_number="ND 0001").price == 18000
+
+    def test_import_flights_stops_at_invalid_utf8(self):
+        self.user_token(
+            data={
+                "username": "maddy",
+                "password": "thepassword"
+            })
+        rows = [
+            "origin,destination,departure,arrival,flight_number,airline,price",
+            "Lagos,Kano,{0},{1},IM 0001,Arik,18000".format(self.dates(1), self.dates(2)),
+            "Lagos,Kano,{0},{1},IM 0002,Arik,18000".format(self.dates(1), self.dates(2)),
+        ]
+        content = "\n".join(rows).encode('utf-8') + b"\nLagos,Kano,\xff\xfe,,IM 0003,Arik,1\n"
+        response = self.client.post(
+            reverse("flight-import"),
+            {'file': SimpleUploadedFile("schedule.csv", content)},
+            format="multipart"
+        )
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['created'] == 2
+        assert response.data['failed'] == 1
+        assert response.data['errors'] == [{
+            'row': 3, 'errors': {'non_field_errors': ['The file is not valid UTF-8 from this row on.']}
+        }]
+        with NamedTemporaryFile(mode='wb', suffix='.ndjson') as schedule:
+            schedule.write(b'{"flight_number": "ND \xff\xfe"}\n{}\n')
+            schedule.flush()
+            stderr = StringIO()
+            call_command('import_flights', schedule.name, stdout=StringIO(), stderr=stderr)
+        assert "row 1: {'non_field_errors': ['Invalid row.']}" in stderr.getvalue()
+        assert "row 2" in stderr.getvalue()
+
+    def test_import_flights_updates_flights_inserted_concurrently(self):
+        Flight.objects.create(
+            origin="Lagos", destination="Kano", departure=self.dates(1), arrival=self.dates(2),
+            flight_number="IM 0001", airline="Arik", price=18000
+        )
+        in_bulk = QuerySet.in_bulk
+        reads = []
+
+        def concurrent_insert(queryset, *args, **kwargs):
+            # the first read misses IM 0001, as if it was committed right after
+            existing = in_bulk(queryset, *args, **kwargs)
+            reads.append(existing)
+            if len(reads) == 1:
+                existing.pop("IM 0001", None)
+            return existing
+
+        rows = [{
+            "origin": "Lagos", "destination": "Kano", "departure": self.dates(1), "arrival": self.dates(2),
+            "flight_number": flight_number, "airline": "Arik", "price": 20000
+        } for flight_number in ("IM 0001", "IM 0002")]
+        with patch.object(QuerySet, 'in_bulk', autospec=True, side_effect=concurrent_insert):
+            report = import_flights(rows)
+        assert report.as_dict() == {'created': 1, 'updated': 1, 'failed': 0, 'errors': []}
+        assert len(reads) == 2
+        assert Flight.objects.get(flight_number="IM 0001").price == 20000
+        assert Flight.objects.filter(flight_number="IM 0002").exists()
+
+
+class FareSummaryTest(BaseViewTest):
+    """
+    Test the fare summaries and the flight/fares/ calendar
+    """
+    def summary(self, origin="Lagos", destination="Enugu", departure="2019-08-26"):
+        return FareSummary.objects.filter(origin=origin, destination=destination, departure=departure).values(
+            'flight_count', 'min_price', 'max_price', 'avg_price').first()
+
+    def add_flight(self, flight_number, price, departure="2019-08-26", destination="Enugu"):
+        return Flight.objects.create(
+            origin="Lagos", destination=destination, departure=departure, arrival=departure,
+            flight_number=flight_number, airline="Arik", price=price
+        )
+
+    def test_summary_follows_flight_changes(self):
+        flight = self.create_flight()
+        self.add_flight("IM 0001", 10000)
+        cheapest = self.add_flight("IM 0002", 5000)
+        assert self.summary() == {
+            'flight_count': 3, 'min_price': 5000, 'max_price': 15000, 'avg_price': Decimal('10000.00')
+        }
+        cheapest.delete()
+        assert self.summary()['min_price'] == 10000
+        flight.destination = "Abuja"
+        flight.save()
+        assert self.summary() == {
+            'flight_count': 1, 'min_price': 10000, 'max_price': 10000, 'avg_price': Decimal('10000.00')
+        }
+        assert self.summary(destination="Abuja")['flight_count'] == 1
+        Flight.objects.get(flight_number="IM 0001").delete()
+        assert self.summary() is None
+        flight.flight_status = "D"
+        with CaptureQueriesContext(connection) as queries:
+            flight.save(update_fields=['flight_status'])
+        assert not any('airtechapi_faresummary' in query['sql'] for query in queries)
+        assert compare_fare_summaries() == ([], [], [])
+
+    def test_import_updates_summaries(self):
+        self.create_flight()
+        rows = [
+            '{"origin": "Lagos", "destination": "Abuja", "departure": "2030-01-05", "arrival": "2030-01-05",'
+            ' "flight_number": "BK 6089", "airline": "Emirates", "price": 20000}',
+            '{"origin": "Lagos", "destination": "Abuja", "departure": "2030-01-05", "arrival": "2030-01-05",'
+            ' "flight_number": "IM 0001", "airline": "Arik", "price": 10000}',
+        ]
+        with NamedTemporaryFile(mode='w', suffix='.ndjson') as schedule:
+            schedule.write("\n".join(rows))
+            schedule.flush()
+            call_command('import_flights', schedule.name, stdout=StringIO())
+        assert self.summary() is None
+        assert self.summary(destination="Abuja", departure="2030-01-05") == {
+            'flight_count': 2, 'min_price': 10000, 'max_price': 20000, 'avg_price': Decimal('15000.00')
+        }
+
+    def test_fare_calendar_reads_one_month(self):
+        self.add_flight("IM 0001", 10000, departure="2030-01-01")
+        self.add_flight("IM 0002", 12001, departure="2030-01-31")
+        self.add_flight("IM 0003", 8000, departure="2030-01-31")
+        self.add_flight("IM 0004", 9000, departure="2030-02-01")
+        self.add_flight("IM 0005", 9000, departure="2030-01-15", destination="Abuja")
+        self.user_token(
+            data={
+                "username": "paddy",
+                "password": "fakepassword"
+            })
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                reverse("flight-fares"), {"origin": "Lagos", "destination": "Enugu", "month": "2030-01"})
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data == [
+            {'departure': '2030-01-01', 'flight_count': 1, 'min_price': 10000, 'max_price': 10000,
+             'avg_price': '10000.00'},
+            {'departure': '2030-01-31', 'flight_count': 2, 'min_price': 8000, 'max_price': 12001,
+             'avg_price': '10000.50'},
+        ]
+        fare_queries = [query for query in queries if 'airtechapi_faresummary' in query['sql']]
+        assert len(fare_queries) == 1
+        assert 'BETWEEN' in fare_queries[0]['sql']
+
+    def test_fare_calendar_requires_route_and_month(self):
+        self.user_token(
+            data={
+                "username": "paddy",
+                "password": "fakepassword"
+            })
+        response = self.client.get(reverse("flight-fares"), {"origin": "Lagos", "month": "January"})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert set(response.data) == {'destination', 'month'}
+
+    def test_rebuild_command_repairs_drift(self):
+        self.create_flight()
+        self.add_flight("IM 0001", 10000, departure="2030-01-01")
+        FareSummary.objects.filter(departure="2019-08-26").update(max_price=1)
+        FareSummary.objects.filter(departure="2030-01-01").delete()
+        FareSummary.objects.create(origin="Lagos", destination="Kano", departure="2030-01-01", flight_count=1)
+        with self.assertRaisesMessage(CommandError, '1 missing, 1 stale, 1 orphaned'):
+            call_command('rebuild_fare_summaries', check=True, stdout=StringIO(), stderr=StringIO())
+        stdout = StringIO()
+        call_command('rebuild_fare_summaries', stdout=stdout, stderr=StringIO())
+        assert '3 refreshed' in stdout.getvalue()
+        assert compare_fare_summaries() == ([], [], [])
+        assert self.summary()['max_price'] == 15000
+
+
+class ExportTest(BaseViewTest):
+    """
+    Test the flight/export/ and booking/export/ streams and the export_records command
+    """
+    def setUp(self):
+        super().setUp()
+        self.flight = self.create_flight()
+        self.newer = Flight.objects.create(
+            origin="Lagos", destination="Abuja", departure="2030-01-01", arrival="2030-01-01",
+            flight_number="IM 0001", airline="Arik", price=18000
+        )
+        Flight.objects.filter(pk=self.flight.pk).update(
+            modified_at=datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+        )
+        Booking.objects.create(flight=self.newer, passenger=User.objects.get(username="paddy"), number_of_tickets=2)
+        self.user_token(
+            data={
+                "username": "maddy",
+                "password": "thepassword"
+            })
+
+    def export(self, name, **params):
+        response = self.client.get(reverse(name), params)
+        assert response.streaming
+        return response, b''.join(response.streaming_content).decode('utf-8')
+
+    def test_export_flights_as_ndjson(self):
+        response, content = self.export("flight-export")
+        assert response.status_code == status.HTTP_200_OK
+        assert response['Content-Type'] == 'application/x-ndjson; charset=utf-8'
+        assert response['Content-Disposition'] == 'attachment; filename="flights.ndjson"'
+        rows = [json.loads(line) for line in content.splitlines()]
+        assert [row['flight_number'] for row in rows] == ["BK 6089", "IM 0001"]
+        assert rows[1]['seats_remaining'] == 180
+        assert 'modified_at' in rows[1] and 'bookings' not in rows[1]
+
+    def test_export_bookings_as_csv_in_a_window(self):
+        response, content = self.export("booking-export", format="csv")
+        assert response['Content-Type'] == 'text/csv; charset=utf-8'
+        rows = list(csv.DictReader(StringIO(content)))
+        assert len(rows) == 1
+        assert rows[0]['flight'] == "IM 0001"
+        assert rows[0]['passenger.username'] == "paddy"
+        assert rows[0]['number_of_tickets'] == "2"
+        response, content = self.export("flight-export", format="csv", modified_since="2021-01-01T00:00:00Z")
+        assert [row['flight_number'] for row in csv.DictReader(StringIO(content))] == ["IM 0001"]
+        response, content = self.export("flight-export", modified_until="2021-01-01T00:00:00Z")
+        assert [json.loads(line)['flight_number'] for line in content.splitlines()] == ["BK 6089"]
+
+    def test_booking_changes_reach_incremental_exports(self):
+        response = self.client.post(
+            reverse("booking-list"),
+            data=json.dumps({"flight": "BK 6089", "number_of_tickets": 2}),
+            content_type="application/json"
+        )
+        assert response.status_code == status.HTTP_201_CREATED
+        response, content = self.export("flight-export", modified_since="2021-01-01T00:00:00Z")
+        rows = {row['flight_number']: row for row in map(json.loads, content.splitlines())}
+        assert rows["BK 6089"]['booked_tickets'] == 2
+        assert rows["BK 6089"]['booking_count'] == 1
+        Flight.objects.filter(pk=self.flight.pk).update(
+            booked_tickets=0, modified_at=datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+        )
+        call_command('reconcile_flight_counters', stdout=StringIO())
+        response, content = self.export("flight-export", modified_since="2021-01-01T00:00:00Z")
+        assert "BK 6089" in [json.loads(line)['flight_number'] for line in content.splitlines()]
+
+    def test_export_rejects_bad_windows_and_non_admins(self):
+        response = self.client.get(reverse("flight-export"), {
+            "modified_since": "2021-01-01T00:00:00Z", "modified_until": "2020-01-01T00:00:00Z"
+        })
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert 'invalid_dates' in json.loads(response.content.decode('utf-8'))
+        self.client.credentials()
+        self.user_token(
+            data={
+                "username": "paddy",
+                "password": "fakepassword"
+            })
+        assert self.client.get(reverse("booking-export")).status_code == status.HTTP_403_FORBIDDEN
+
+    def test_export_records_command(self):
+        stdout = StringIO()
+        call_command('export_records', 'bookings', format='csv', modified_since='2100-01-01T00:00:00Z', stdout=stdout)
+        assert stdout.getvalue().splitlines() == [
+            "id,flight,passenger.id,passenger.username,passenger.email,number_of_tickets,created_at,modified_at"
+        ]
+        with NamedTemporaryFile(suffix='.ndjson') as output:
+            call_command('export_records', 'flights', output=output.name)
+            assert len(output.read().splitlines()) == 2
+        with self.assertRaises(CommandError):
+            call_command('export_records', 'flights', modified_since='yesterday')
+
+
+class AdminTest(BaseViewTest):
+    """
+    Test the admin changelists and actions
+    """
+    def setUp(self):
+        super().setUp()
+        self.admin = APIClient()
+        self.admin.force_login(User.objects.get(username="maddy"))
+        self.flights = [
+            Flight.objects.create(
+                origin="Lagos", destination="Abuja", departure="2030-01-01", arrival="2030-01-01",
+                flight_number="AD {:04d}".format(index), airline="Arik", price=10000
+            ) for index in range(5)
+        ]
+
+    def test_booking_changelist_joins_its_foreign_keys(self):
+        passenger = User.objects.get(username="paddy")
+        for flight in self.flights[:2]:
+            Booking.objects.create(flight=flight, passenger=passenger)
+        self.admin.get(reverse("admin:airtechapi_booking_changelist"))
+        with CaptureQueriesContext(connection) as two_bookings:
+            response = self.admin.get(reverse("admin:airtechapi_booking_changelist"))
+        assert response.status_code == status.HTTP_200_OK
+        for flight in self.flights[2:]:
+            Booking.objects.create(flight=flight, passenger=passenger)
+        with CaptureQueriesContext(connection) as five_bookings:
+            response = self.admin.get(reverse("admin:airtechapi_booking_changelist"))
+        assert response.status_code == status.HTTP_200_OK
+        assert len(five_bookings) == len(two_bookings)
+
+    def test_flight_changelist_filters_and_status_action(self):
+        response = self.admin.get(reverse("admin:airtechapi_flight_changelist"), {"flight_status__exact": "S"})
+        assert response.status_code == status.HTTP_200_OK
+        with CaptureQueriesContext(connection) as queries:
+            response = self.admin.post(reverse("admin:airtechapi_flight_changelist"), {
+                "action": "mark_delayed",
+                "_selected_action": [flight.pk for flight in self.flights[:3]]
+            })
+        assert response.status_code == status.HTTP_302_FOUND
+        assert len([query for query in queries if query['sql'].startswith('UPDATE')]) == 1
+        assert list(Flight.objects.filter(flight_status="D").values_list('flight_number', flat=True)) == [
+            "AD 0000", "AD 0001", "AD 0002"
+        ]
+
+    def test_booking_admin_keeps_seat_counters(self):
+        flight = self.flights[0]
+        Flight.objects.filter(pk=flight.pk).update(capacity=3)
+        url = reverse("admin:airtechapi_booking_add")
+        data = {"flight": flight.pk, "passenger": User.objects.get(username="paddy").pk, "number_of_tickets": 4}
+        response = self.admin.post(url, data)
+        assert response.status_code == status.HTTP_200_OK
+        assert not Booking.objects.exists()
+        data["number_of_tickets"] = 2
+        assert self.admin.post(url, data).status_code == status.HTTP_302_FOUND
+        booking = Booking.objects.get()
+        flight.refresh_from_db()
+        assert (flight.booked_tickets, flight.booking_count) == (2, 1)
+        response = self.admin.post(reverse("admin:airtechapi_booking_delete", args=[booking.pk]), {"post": "yes"})
+        assert response.status_code == status.HTTP_302_FOUND
+        flight.refresh_from_db()
+        assert (flight.booked_tickets, flight.booking_count) == (0, 0)
+
+    def test_booking_admin_rolls_back_when_the_seats_are_gone(self):
+        flight = self.flights[0]
+        Flight.objects.filter(pk=flight.pk).update(capacity=3)
+        clean = BookingAdminForm.clean
+
+        def concurrent_booking(form):
+            data = clean(form)
+            Flight.objects.filter(pk=flight.pk).update(booked_tickets=2, booking_count=1)
+            return data
+
+        url = reverse("admin:airtechapi_booking_add")
+        data = {"flight": flight.pk, "passenger": User.objects.get(username="paddy").pk, "number_of_tickets": 2}
+        with patch.object(BookingAdminForm, 'clean', autospec=True, side_effect=concurrent_booking):
+            response = self.admin.post(url, data, follow=True)
+        assert response.status_code == status.HTTP_200_OK
+        assert "There are not enough seats left on this flight" in response.content.decode('utf-8')
+        assert not Booking.objects.exists()
+        # the stand-in booking ran in the admin's transaction and was rolled back with it
+        flight.refresh_from_db()
+        assert (flight.booked_tickets, flight.booking_count) == (0, 0)
+
+    def test_estimated_count_paginator_skips_the_count_query(self):
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE airtechapi_flight')
+        paginator = EstimatedCountPaginator(Flight.objects.all(), 2)
+        paginator.estimate_threshold = 0
+        with CaptureQueriesContext(connection) as queries:
+            assert paginator.count == 5
+        assert not any('COUNT(' in query['sql'] for query in queries)
+        filtered = EstimatedCountPaginator(Flight.objects.filter(flight_number="AD 0000"), 2)
+        filtered.estimate_threshold = 0
+        assert filtered.count == 1
+
+
+class FlightStatusTest(BaseViewTest):
+    """
+    Test the flight/status/ ingest endpoint
+    """
+    def post_statuses(self, updates):
+        return self.client.post(
+            reverse("flight-status"),
+            data=json.dumps(updates),
+            content_type="application/json"
+        )
+
+    def test_status_batch_with_superuser_success(self):
+        departed = self.create_flight()
+        scheduled = Flight.objects.create(
+            origin="Lagos", destination="Kano", departure="2019-08-26", arrival="2019-08-27",
+            flight_number="IM 0001", airline="Arik", price=18000
+        )
+        self.user_token(
+            data={
+                "username": "maddy",
+                "password": "thepassword"
+            })
+        self.client.get(reverse("flight-detail", kwargs={"pk": departed.id}))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.post_statuses([
+                {"flight_number": "BK 6089", "flight_status": "E"},
+                {"flight_number": "IM 0001", "flight_status": "S"},
+                {"flight_number": "XX 0000", "flight_status": "D"},
+                {"flight_number": "IM 0001", "flight_status": "Z"},
+                "L",
+                {"flight_number": "BK 6089", "flight_status": "L"},
+            ])
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['received'] == 6
+        assert response.data['updated'] == 1
+        assert response.data['unchanged'] == 1
+        assert response.data['failed'] == 3
+        assert [error['index'] for error in response.data['errors']] == [2, 3, 4]
+        assert len([query for query in queries if query['sql'].startswith('UPDATE')]) == 1
+        departed.refresh_from_db()
+        scheduled.refresh_from_db()
+        assert departed.flight_status == "L"
+        assert scheduled.flight_status == "S"
+        response = self.client.get(reverse("flight-detail", kwargs={"pk": departed.id}))
+        assert response['X-Cache'] == 'MISS'
+        assert response.data['flight_status'] == "L"
+
+    def test_status_batch_by_non_admin_fails(self):
+        self.create_flight()
+        self.user_token(
+            data={
+                "username": "paddy",
+                "password": "fakepassword"
+            })
+        response = self.post_statuses([{"flight_number": "BK 6089", "flight_status": "L"}])
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+        assert Flight.objects.get(flight_number="BK 6089").flight_status == "S"
+
+    def test_status_batch_must_be_a_non_empty_list(self):
+        self.user_token(
+            data={
+                "username": "maddy",
+                "password": "thepassword"
+            })
+        response = self.post_statuses({"flight_number": "BK 6089", "flight_status": "L"})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        response = self.post_statuses([])
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+class FlightWithBookingsSerializer(FlightDetailSerializer):
+    bookings = BookingSerializer(many=True, read_only=True)
+
+    class Meta(FlightDetailSerializer.Meta):
+        fields = FlightDetailSerializer.Meta.fields + ('bookings',)
+
+
+fast_flight_with_bookings_serializer = CompiledSerializer(
+    FlightWithBookingsSerializer, annotations=fast_flight_detail_serializer.annotations
+)
+
+
+class FastSerializerTest(BaseViewTest):
+    """
+    Test that the compiled serializers render the same JSON as the DRF ones
+    """
+    def setUp(self):
+        super().setUp()
+        self.flights = [self.create_flight()] + Flight.objects.bulk_create([
+            Flight(
+                origin="Abuja", destination="Kano", departure="2030-01-0{}".format(day),
+                arrival="2030-01-0{}".format(day + 1), flight_number="IM 000{}".format(day),
+                airline="Arik", price=1000 * day, capacity=day, booked_tickets=day - 1,
+                type_of_flight=("OW", "RT", "DF")[day % 3], flight_status=("S", "D", "U")[day % 3]
+            ) for day in range(1, 5)
+        ])
+        users = User.objects.all()
+        Booking.objects.bulk_create([
+            Booking(flight=flight, passenger=user, number_of_tickets=index + 1)
+            for index, flight in enumerate(self.flights[:3]) for user in users
+        ])
+
+    def assert_same_json(self, serializer_class, fast_serializer, queryset):
+        expected = JSONRenderer().render(serializer_class(queryset, many=True).data)
+        assert JSONRenderer().render(fast_serializer.serialize(fast_serializer.values(queryset))) == expected
+
+    def test_compiled_serializers_render_identical_json(self):
+        self.assert_same_json(FLightSerializer, fast_flight_serializer, Flight.objects.all())
+        self.assert_same_json(FlightDetailSerializer, fast_flight_detail_serializer, Flight.objects.all())
+        self.assert_same_json(
+            FlightWithBookingsSerializer, fast_flight_with_bookings_serializer,
+            Flight.objects.prefetch_related(Prefetch('bookings', queryset=Booking.objects.order_by('pk')))
+        )
+        self.assert_same_json(BookingSerializer, fast_booking_serializer, Booking.objects.order_by('pk'))
+
+    def test_views_render_identical_json(self):
+        self.user_token(
+            data={
+                "username": "paddy",
+                "password": "fakepassword"
+            })
+        flight = self.flights[0]
+        response = self.client.get(reverse("flight-detail", kwargs={"pk": flight.id}))
+        assert response.content == JSONRenderer().render(FlightDetailSerializer(flight).data)
+        response = self.client.get(reverse("flight-list"))
+        assert response.content == JSONRenderer().render(OrderedDict([
+            ('next', None),
+            ('previous', None),
+            ('results', FLightSerializer(Flight.objects.all(), many=True).data)
+        ]))
+
+    def test_restrict_survives_a_concurrent_clear(self):
+        class ClearedDict(dict):
+            # as if another thread cleared the subsets right after each store
+            def __setitem__(self, key, value):
+                pass
+
+        with patch.object(fast_booking_serializer, '_subsets', ClearedDict()):
+            assert fast_booking_serializer.restrict(['flight']).selected == ['flight']
+
+    def test_compiled_nested_lists_run_two_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            fast_flight_with_bookings_serializer.serialize(
+                fast_flight_with_bookings_serializer.values(Flight.objects.all())
+            )
+        assert len(queries) == 2
+
+
+class SparseFieldsetTest(BaseViewTest):
+    """
+    Test ?fields= and ?exclude= on the flight and booking views
+    """
+    def setUp(self):
+        super().setUp()
+        self.flight = self.create_flight()
+        Flight.objects.create(
+            origin="Abuja", destination="Kano", departure="2030-01-01", arrival="2030-01-02",
+            flight_number="IM 0001", airline="Arik", price=18000
+        )
+        Booking.objects.create(flight=self.flight, passenger=User.objects.get(username="paddy"))
+        self.user_token(
+            data={
+                "username": "paddy",
+                "password": "fakepassword"
+            })
+        self.client.get(reverse("booking-list"))
+
+    def test_detail_fields_narrow_the_query(self):
+        url = reverse("flight-detail", kwargs={"pk": self.flight.id})
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url + "?fields=flight_status")
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data == {"flight_status": "S"}
+        assert len(queries) == 1
+        assert '"capacity"' not in queries[0]['sql']
+        assert '"origin"' not in queries[0]['sql']
+
+    def test_detail_exclude_drops_fields(self):
+        url = reverse("flight-detail", kwargs={"pk": self.flight.id})
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url + "?exclude=modified_at,created_at")
+        assert 'modified_at' not in response.data
+        assert 'created_at' not in response.data
+        assert response.data['flight_status_detail'] == "Scheduled"
+        assert len(queries) == 1
+        assert 'airtechapi_booking' not in queries[0]['sql']
+
+    def test_detail_variants_are_cached_apart_and_invalidated(self):
+        url = reverse("flight-detail", kwargs={"pk": self.flight.id})
+        assert 'bookings' not in self.client.get(url).data
+        assert len(self.client.get(url + "?include=bookings").data['bookings']) == 1
+        assert self.client.get(url + "?include=bookings")['X-Cache'] == 'HIT'
+        response = self.client.get(url + "?fields=flight_status")
+        assert response.data == {"flight_status": "S"}
+        assert self.client.get(url + "?fields=flight_status")['X-Cache'] == 'HIT'
+        self.flight.flight_status = "D"
+        self.flight.save()
+        response = self.client.get(url + "?fields=flight_status")
+        assert response['X-Cache'] == 'MISS'
+        assert response.data == {"flight_status": "D"}
+
+    def test_list_fields_keep_pagination_working(self):
+        response = self.client.get(reverse("flight-list") + "?fields=price&page_size=1")
+        assert response.data['results'] == [{"price": 15000}]
+        response = self.client.get(response.data['next'])
+        assert response.data['results'] == [{"price": 18000}]
+        response = self.client.get(reverse("booking-list") + "?fields=flight,number_of_tickets")
+        assert response.data['results'] == [{"flight": "BK 6089", "number_of_tickets": 1}]
+
+    def test_booking_detail_fields_and_exclude(self):
+        booking = Booking.objects.get(flight=self.flight)
+        url = reverse("booking-detail", kwargs={"pk": booking.id})
+        assert self.client.get(url).content == JSONRenderer().render(BookingSerializer(booking).data)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url + "?fields=flight,number_of_tickets")
+        assert response.data == {"flight": "BK 6089", "number_of_tickets": 1}
+        assert len(queries) == 1
+        assert 'auth_user' not in queries[0]['sql']
+        response = self.client.get(url + "?exclude=passenger")
+        assert 'passenger' not in response.data
+        assert response.data['flight'] == "BK 6089"
+
+    def test_unknown_fields_fail(self):
+        response = self.client.get(reverse("flight-list") + "?fields=price,password")
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert response.data['fields'] == "Unknown fields: password"
+
+
+class ListRendererTest(BaseViewTest):
+    """
+    Test the columnar JSON and MessagePack renderers of the list endpoints
+    """
+    def setUp(self):
+        super().setUp()
+        flight = self.create_flight()
+        Flight.objects.create(
+            origin="Abuja", destination="Kano", departure="2030-01-01", arrival="2030-01-02",
+            flight_number="IM 0001", airline="Arik", price=18000, flight_status="D", type_of_flight="RT"
+        )
+        Booking.objects.create(flight=flight, passenger=User.objects.get(username="paddy"))
+        self.user_token(
+            data={
+                "username": "paddy",
+                "password": "fakepassword"
+            })
+
+    def test_flight_list_columnar(self):
+        rows = self.client.get(reverse("flight-list")).data['results']
+        response = self.client.get(reverse("flight-list"), HTTP_ACCEPT='application/vnd.airtech.columnar+json')
+        assert response.status_code == status.HTTP_200_OK
+        assert response['Content-Type'] == 'application/vnd.airtech.columnar+json'
+        data = json.loads(response.content)
+        assert list(data['results']) == list(rows[0])
+        assert data['results']['flight_number'] == ["BK 6089", "IM 0001"]
+        assert data['results']['flight_status'] == ["S", "D"]
+        assert [dict(zip(data['results'], values)) for values in zip(*data['results'].values())] == rows
+        assert data['choices']['flight_status']['D'] == "Delayed"
+        assert data['choices']['type_of_flight'] == {"OW": "One-way", "RT": "Round-trip", "DF": "Direct-flight"}
+        assert data['next'] is None
+
+    def test_booking_list_columnar(self):
+        response = self.client.get(reverse("booking-list") + "?format=columnar")
+        data = json.loads(response.content)
+        assert data['results']['flight'] == ["BK 6089"]
+        assert data['results']['passenger'][0]['username'] == "paddy"
+        assert data['choices'] == {}
+
+    def test_flight_list_msgpack(self):
+        rows = self.client.get(reverse("flight-list")).data['results']
+        response = self.client.get(reverse("flight-list"), HTTP_ACCEPT='application/msgpack')
+        assert response['Content-Type'] == 'application/msgpack'
+        data = msgpack.unpackb(response.content)
+        assert data['results'] == rows
+        assert data['choices']['flight_status']['L'] == "Landed"
+
+
+class CatalogCacheTest(BaseViewTest):
+    """
+    Test the cached flight/ and flight/<pk> responses
+    """
+    def get(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(
+                url,
+                content_type="application/json"
+            )
+        flight_queries = [query for query in context.captured_queries if 'airtechapi_' in query['sql']]
+        return response, len(flight_queries)
+
+    def test_get_flight_list_and_detail_from_cache(self):
+        flight01 = self.create_flight()
+        self.user_token(
+            data={
+                "username": "paddy",
+                "password": "fakepassword"
+            })
+        hits = catalog_cache.stats()['hits']
+        for url in (reverse("flight-list"), reverse("flight-detail", kwargs={"pk": flight01.id})):
+            response, queries = self.get(url)
+            assert response['X-Cache'] == "MISS"
+            assert queries > 0
+            cached, queries = self.get(url)
+            assert cached['X-Cache'] == "HIT"
+            assert queries == 0
+            assert cached.data == response.data
+        assert catalog_cache.stats()['hits'] == hits + 2
+
+    def test_flight_and_booking_changes_invalidate_cache(self):
+        flight01 = self.create_flight()
+        self.user_token(
+            data={
+                "username": "maddy",
+                "password": "thepassword"
+            })
+        detail_url = reverse("flight-detail", kwargs={"pk": flight01.id})
+        list_url = reverse("flight-list")
+        self.get(detail_url)
+        self.get(list_url)
+        response = self.client.post(
+            reverse("booking-list"),
+            data=json.dumps({"flight": "BK 6089", "number_of_tickets": 2}),
+            content_type="application/json"
+        )
+        assert response.status_code == status.HTTP_201_CREATED
+        response, queries = self.get(detail_url)
+        assert response['X-Cache'] == "MISS"
+        assert response.data['booking_count'] == 1
+        assert response.data['seats_remaining'] == 178
+        response, queries = self.get(list_url)
+        assert response['X-Cache'] == "MISS"
+        assert response.data['results'][0]['seats_remaining'] == 178
+        flight01.airline = "Arik"
+        flight01.save()
+        response, queries = self.get(list_url)
+        assert response.data['results'][0]['airline'] == "Arik"
+
+    def test_concurrent_miss_waits_for_the_rendering_worker(self):
+        cache = CatalogCache()
+        cache.cache.add('stampede:lock', 1, cache.lock_timeout)
+        render = Mock(return_value={'rendered': True})
+        timer = threading.Timer(0.05, lambda: cache.cache.set('stampede', {'rendered': 'elsewhere'}))
+        timer.start()
+        value, hit = cache.get_or_set('stampede', render)
+        timer.join()
+        assert value == {'rendered': 'elsewhere'}
+        assert hit
+        assert not render.called
+        assert cache.stats() == {'hits': 1, 'misses': 0, 'hit_ratio': 1.0}
+
+
+class CompressionTest(BaseViewTest):
+    """
+    Test response compression and the precompressed catalog entries
+    """
+    def setUp(self):
+        super().setUp()
+        Flight.objects.bulk_create([
+            Flight(
+                origin="Lagos", destination="Abuja", departure="2030-01-01", arrival="2030-01-02",
+                flight_number="BK {:04d}".format(number), airline="Arik", price=10000 + number
+            ) for number in range(50)
+        ])
+        self.user_token(
+            data={
+                "username": "paddy",
+                "password": "fakepassword"
+            })
+
+    def test_gzip_flight_list(self):
+        plain = self.client.get(reverse("flight-list"))
+        assert not plain.has_header('Content-Encoding')
+        assert 'Accept-Encoding' in plain['Vary']
+        response = self.client.get(reverse("flight-list"), HTTP_ACCEPT_ENCODING="deflate, gzip")
+        assert response['Content-Encoding'] == "gzip"
+        assert int(response['Content-Length']) == len(response.content) < len(plain.content)
+        assert gzip.decompress(response.content) == plain.content
+
+    def test_refused_small_or_other_responses_are_not_compressed(self):
+        response = self.client.get(reverse("flight-list"), HTTP_ACCEPT_ENCODING="gzip;q=0")
+        assert not response.has_header('Content-Encoding')
+        with override_settings(COMPRESSION_MIN_SIZE=10 ** 6):
+            response = self.client.get(reverse("flight-list"), HTTP_ACCEPT_ENCODING="gzip")
+        assert not response.has_header('Content-Encoding')
+        with override_settings(COMPRESSION_CONTENT_TYPES=['text/html']):
+            response = self.client.get(reverse("flight-list"), HTTP_ACCEPT_ENCODING="gzip")
+        assert not response.has_header('Content-Encoding')
+
+    def test_catalog_entries_are_compressed_once(self):
+        url = reverse("flight-list")
+        with patch('airtechapi.middleware.compress', side_effect=compress) as compressor:
+            first = self.client.get(url, HTTP_ACCEPT_ENCODING="gzip")
+            second = self.client.get(url, HTTP_ACCEPT_ENCODING="gzip")
+            assert second['X-Cache'] == 'HIT'
+            assert second.content == first.content
+            assert compressor.call_count == 1
+            self.client.get(url + "?format=columnar", HTTP_ACCEPT_ENCODING="gzip")
+            assert compressor.call_count == 2
+            flight = Flight.objects.get(flight_number="BK 0000")
+            flight.price = 1
+            flight.save()
+            response = self.client.get(url, HTTP_ACCEPT_ENCODING="gzip")
+            assert compressor.call_count == 3
+        assert json.loads(gzip.decompress(response.content))['results'][0]['price'] == 1
+
+    def test_browsable_pages_are_compressed_per_user(self):
+        url = reverse("flight-list")
+        with patch('airtechapi.middleware.compress', side_effect=compress) as compressor:
+            paddy = self.client.get(url, HTTP_ACCEPT="text/html", HTTP_ACCEPT_ENCODING="gzip")
+            self.client.credentials()
+            self.user_token(
+                data={
+                    "username": "maddy",
+                    "password": "thepassword"
+                })
+            maddy = self.client.get(url, HTTP_ACCEPT="text/html", HTTP_ACCEPT_ENCODING="gzip")
+            assert maddy['X-Cache'] == 'HIT'
+            assert compressor.call_count == 2
+        assert maddy['Content-Encoding'] == paddy['Content-Encoding'] == "gzip"
+        paddy_page = gzip.decompress(paddy.content).decode('utf-8')
+        maddy_page = gzip.decompress(maddy.content).decode('utf-8')
+        assert 'paddy' in paddy_page and 'maddy' not in paddy_page
+        assert 'maddy' in maddy_page and 'paddy' not in maddy_page
+
+    def test_brotli_is_preferred(self):
+        plain = self.client.get(reverse("flight-list"))
+        response = self.client.get(reverse("flight-list"), HTTP_ACCEPT_ENCODING="gzip, br")
+        assert response['Content-Encoding'] == "br"
+        assert brotli.decompress(response.content) == plain.content
+
+
+@override_settings(SERVER_TIMING_SAMPLE_RATE=1.0)
+class ServerTimingTest(BaseViewTest):
+    """
+    Test the Server-Timing header and log lines of sampled requests
+    """
+    def setUp(self):
+        super().setUp()
+        self.flight = self.create_flight()
+        self.user_token(
+            data={
+                "username": "maddy",
+                "password": "thepassword"
+            })
+
+    def timings(self, response):
+        return {entry.split(';')[0]: entry for entry in response['Server-Timing'].split(', ')}
+
+    def test_sampled_request_reports_its_timings(self):
+        with self.assertLogs('airtechapi.timing', 'INFO') as logs:
+            response = self.client.get(reverse("flight-list"))
+        assert response.status_code == status.HTTP_200_OK
+        timings = self.timings(response)
+        assert set(timings) == {'db', 'auth', 'serialize', 'render', 'view', 'total'}
+        record = json.loads(logs.records[-1].getMessage())
+        assert record['url_name'] == "flight-list"
+        assert record['status'] == 200
+        assert record['queries'] > 0
+        assert timings['db'].endswith('desc="{} queries"'.format(record['queries']))
+        assert record['serialize_ms'] > 0 and record['auth_ms'] > 0
+        assert record['total_ms'] >= record['view_ms'] >= record['serialize_ms']
+        assert record['repeated_query'] is None
+
+    @override_settings(SERVER_TIMING_SAMPLE_RATE=0.0)
+    def test_unsampled_request_has_no_header(self):
+        response = self.client.get(reverse("flight-detail", kwargs={"pk": self.flight.id}))
+        assert response.status_code == status.HTTP_200_OK
+        assert not response.has_header('Server-Timing')
+
+    def test_repeated_queries_are_flagged(self):
+        def get_response(request):
+            for _ in range(6):
+                Flight.objects.filter(pk=self.flight.pk).exists()
+            return HttpResponse()
+
+        with self.assertLogs('airtechapi.timing', 'WARNING') as logs:
+            response = ServerTimingMiddleware(get_response)(RequestFactory().get('/'))
+        assert self.timings(response)['n-plus-one'] == 'n-plus-one;desc="6 identical queries"'
+        record = json.loads(logs.records[-1].getMessage())
+        assert record['repeated_query']['count'] == 6
+        assert record['repeated_query']['sql'].startswith('SELECT')
+
+    def test_streaming_response_is_not_consumed(self):
+        with self.assertLogs('airtechapi.timing', 'INFO'):
+            response = self.client.get(reverse("flight-export"))
+        assert response.streaming
+        assert 'view' in self.timings(response)
+        assert len(b''.join(response.streaming_content).splitlines()) == 1
+
+
+class CachedAuthenticationTest(BaseViewTest):
+    """
+    Test the per-token user cache of the JWT authentication
+    """
+    def get_flights(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(
+                reverse("flight-list"),
+                content_type="application/json"
+            )
+        auth_queries = [query for query in context.captured_queries if 'auth_user' in query['sql']]
+        return response, len(auth_queries)
+
+    def test_warm_cache_authenticates_without_queries(self):
+        self.user_token(
+            data={
+                "username": "paddy",
+                "password": "fakepassword"
+            })
+        response, auth_queries = self.get_flights()
+        assert response.status_code == status.HTTP_200_OK
+        assert auth_queries == 1
+        response, auth_queries = self.get_flights()
+        assert response.status_code == status.HTTP_200_OK
+        assert auth_queries == 0
+
+    def test_saved_user_is_evicted_from_cache(self):
+        self.user_token(
+            data={
+                "username": "paddy",
+                "password": "fakepassword"
+            })
+        self.get_flights()
+        user = User.objects.get(username="paddy")
+        user.set_password("newpassword")
+        user.save()
+        response, auth_queries = self.get_flights()
+        assert auth_queries == 1
+        user.is_active = False
+        user.save()
+        response, auth_queries = self.get_flights()
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+        assert response.data['detail'] == "User account is disabled."
+
+    def test_cache_is_bounded(self):
+        cache = LRUCache(maxsize=2)
+        cache.set('a', 1, 60)
+        cache.set('b', 2, 60)
+        cache.get('a')
+        cache.set('c', 3, 60)
+        assert cache.get('a') == 1
+        assert cache.get('b') is None
+        assert cache.get('c') == 3
+        cache.set('c', 3, -1)
+        assert cache.get('c') is None
+        assert len(cache) == 1
+
+
+class TokenRefreshTest(BaseViewTest):
+    """
+    Test the auth/refresh/ and auth/logout/ endpoints
+    """
+    def login(self):
+        response = self.client.post(
+            reverse("auth-login"),
+            data=json.dumps({
+                "username": "paddy",
+                "password": "fakepassword"
+            }),
+            content_type="application/json"
+        )
+        return response.data['token']
+
+    def refresh(self, token):
+        return self.client.post(
+            reverse("auth-refresh"),
+            data=json.dumps({"token": token}),
+            content_type="application/json"
+        )
+
+    def test_refresh_token_success(self):
+        token = self.login()
+        response = self.refresh(token)
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['user'] == "paddy"
+        self.client.credentials(HTTP_AUTHORIZATION='JWT ' + response.data['token'])
+        response = self.client.get(reverse("flight-list"))
+        assert response.status_code == status.HTTP_200_OK
+
+    def test_refresh_invalid_token_fails(self):
+        response = self.refresh("not-a-token")
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_logout_revokes_token_and_its_refreshes(self):
+        token = self.login()
+        refreshed = self.refresh(token).data['token']
+        self.client.credentials(HTTP_AUTHORIZATION='JWT ' + token)
+        response = self.client.post(reverse("auth-logout"))
+        assert response.status_code == status.HTTP_204_NO_CONTENT
+        response = self.client.get(reverse("flight-list"))
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+        assert response.data['detail'] == "Token has been revoked."
+        self.client.credentials(HTTP_AUTHORIZATION='JWT ' + refreshed)
+        response = self.client.get(reverse("flight-list"))
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+        response = self.refresh(refreshed)
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        self.client.credentials()
+        self.user_token(
+            data={
+                "username": "paddy",
+                "password": "fakepassword"
+            })
+        response = self.client.get(reverse("flight-list"))
+        assert response.status_code == status.HTTP_200_OK
+
+
+class ReplicaRoutingTest(BaseViewTest):
+    """
+    Test routing catalog reads to read replicas
+    """
+    def setUp(self):
+        super().setUp()
+        caches['default'].clear()
+        self.user_token(
+            data={
+                "username": "paddy",
+                "password": "fakepassword"
+            })
+
+    @override_settings(DATABASE_REPLICAS=['replica_a', 'replica_b'])
+    def test_replicas_are_used_in_turn(self):
+        assert [next_replica() for _ in range(4)] in (
+            ['replica_a', 'replica_b'] * 2,
+            ['replica_b', 'replica_a'] * 2
+        )
+
+    def test_router_reads_from_the_chosen_replica_only(self):
+        router = ReplicaRouter()
+        assert router.db_for_read(Flight) is None
+        set_read_alias('replica_a')
+        try:
+            assert router.db_for_read(Flight) == 'replica_a'
+            assert router.db_for_write(Flight) == 'default'
+        finally:
+            set_read_alias(None)
+
+    @patch('airtechapi.middleware.next_replica', return_value='default')
+    def test_catalog_reads_use_a_replica_until_the_client_writes(self, next_replica):
+        flight = self.create_flight()
+        response = self.client.get(reverse("flight-list"))
+        assert response.status_code == status.HTTP_200_OK
+        assert next_replica.call_count == 1
+        self.client.get(reverse("flight-detail", kwargs={"pk": flight.id}))
+        assert next_replica.call_count == 2
+
+        self.client.get(reverse("booking-list"))
+        assert next_replica.call_count == 2
+
+        response = self.client.post(
+            reverse("booking-list"),
+            data=json.dumps({"flight": flight.flight_number}),
+            content_type="application/json"
+        )
+        assert response.status_code == status.HTTP_201_CREATED
+        self.client.get(reverse("flight-list"))
+        assert next_replica.call_count == 2
+        assert get_read_alias() is None
+
+    @patch('airtechapi.middleware.next_replica', return_value='default')
+    def test_catalog_cache_misses_are_rendered_from_the_primary(self, next_replica):
+        flight = self.create_flight()
+        serialize = fast_flight_serializer.serialize
+
+        def lagging_replica(rows):
+            data = serialize(rows)
+            if get_read_alias() is not None:
+                for item in data:
+                    item['price'] = 15000
+            return data
+
+        with patch.object(fast_flight_serializer, 'serialize', side_effect=lagging_replica):
+            assert self.client.get(reverse("flight-list")).data['results'][0]['price'] == 15000
+            flight.price = 20000
+            flight.save()
+            response = self.client.get(reverse("flight-list"))
+            assert response['X-Cache'] == "MISS"
+            assert response.data['results'][0]['price'] == 20000
+            response = self.client.get(reverse("flight-list"))
+            assert response['X-Cache'] == "HIT"
+            assert response.data['results'][0]['price'] == 20000
+        assert next_replica.call_count == 3
+
+
+def book_flight_worker(flight_number, user_ids, results):
+    client = APIClient()
+    booked = 0
+    for user in User.objects.filter(id__in=user_ids):
+        client.force_authenticate(user=user)
+        response = client.post(
+            reverse("booking-list"),
+            data=json.dumps({"flight": flight_number, "number_of_tickets": 1}),
+            content_type="application/json"
+        )
+        if response.status_code == status.HTTP_201_CREATED:
+            booked += 1
+        else:
+            assert response.status_code == status.HTTP_400_BAD_REQUEST
+    connections.close_all()
+    results.put(booked)
+
+
+class SeatInventoryStressTest(APITransactionTestCase):
+    """
+    Book the last seats of a flight from many processes at once
+    """
+    workers = 32
+    bookings_per_worker = 5
+    capacity = 60
+
+    def test_concurrent_bookings_never_oversell(self):
+        flight = Flight.objects.create(
+            origin="Lagos",
+            destination="Enugu",
+            departure="2019-08-26",
+            arrival="2019-08-27",
+            flight_number="ST 0001",
+            airline="Emirates",
+            price=15000,
+            capacity=self.capacity
+        )
+        users = User.objects.bulk_create([
+            User(username='stress{}'.format(index))
+            for index in range(self.workers * self.bookings_per_worker)
+        ])
+        user_ids = [user.id for user in users]
+        connections.close_all()
+
+        context = multiprocessing.get_context('fork')
+        results = context.Queue()
+        processes = [
+            context.Process(
+                target=book_flight_worker,
+                args=(flight.flight_number, user_ids[index::self.workers], results)
+            ) for index in range(self.workers)
+        ]
+        started = time.monotonic()
+        for process in processes:
+            process.start()
+        booked = sum(results.get(timeout=120) for _ in processes)
+        for process in processes:
+            process.join()
+        elapsed = time.monotonic() - started
+
+        flight.refresh_from_db()
+        assert booked == self.capacity
+        assert flight.booked_tickets == self.capacity
+        assert Booking.objects.filter(flight=flight).count() == self.capacity
+        assert len(user_ids) / elapsed > 20
+
+
+@override_settings(PASSPORT_STORAGE_BACKEND='airtechapi.storage.LocalPassportStorage')
+class PassportUploadWorkerTest(TransactionTestCase):
+    """
+    Run the process_passport_uploads worker pool against committed jobs
+    """
+    def test_worker_pool_processes_queued_uploads(self):
+        media = TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        users = User.objects.bulk_create([User(username='traveller{}'.format(index)) for index in range(6)])
+        with self.settings(
+            PASSPORT_SPOOL_DIR=os.path.join(media.name, 'spool'),
+            PASSPORT_STORAGE_ROOT=os.path.join(media.name, 'passports')
+        ):
+            for user in users:
+                enqueue_passport_upload(user, SimpleUploadedFile('passport.jpg', b'scan'))
+            stdout = StringIO()
+            call_command('process_passport_uploads', workers=3, once=True, stdout=stdout)
+        assert "Processed 6 passport uploads" in stdout.getvalue()
+        assert PassportUpload.objects.filter(status=PassportUpload.DONE).count() == 6
+        assert Profile.objects.count() == 6
+
+
+@override_settings(FLIGHT_EVENT_HEARTBEAT=1)
+class FlightEventStreamTest(APITransactionTestCase):
+    """
+    Test the flight/<pk>/events and flight/events/ Server-Sent Events streams
+    """
+    def setUp(self):
+        user = User.objects.create(username='paddy', email='paddy@mail.com')
+        user.set_password('fakepassword')
+        user.save()
+        self.client.force_authenticate(user)
+        self.flight = Flight.objects.create(
+            origin="Lagos",
+            destination="Enugu",
+            departure="2019-08-26",
+            arrival="2019-08-27",
+            flight_number="BK 6089",
+            airline="Emirates",
+            price=15000
+        )
+
+    def open_stream(self, url):
+        response = self.client.get(url, HTTP_ACCEPT='text/event-stream')
+        assert response.status_code == status.HTTP_200_OK
+        assert response['Content-Type'] == 'text/event-stream'
+        self.addCleanup(response.close)
+        events = (chunk.decode('utf-8') for chunk in response.streaming_content)
+        assert next(events).startswith('retry: ')
+        return response, events
+
+    def read_event(self, events):
+        chunk = next(events)
+        while chunk.startswith(':'):
+            chunk = next(events)
+        assert chunk.startswith('event: status\n')
+        return json.loads(chunk.split('data: ', 1)[1])
+
+    def test_flight_stream_sends_snapshot_then_changes(self):
+        broker = get_flight_event_broker()
+        subscribers = broker.subscriber_count()
+        response, events = self.open_stream(reverse("flight-events", kwargs={"pk": self.flight.id}))
+        assert self.read_event(events)['flight_status'] == "S"
+        assert broker.subscriber_count() == subscribers + 1
+
+        apply_status_updates([{"flight_number": "BK 6089", "flight_status": "D"}])
+        self.flight.flight_status = "E"
+        self.flight.save()
+        delayed = self.read_event(events)
+        assert delayed['id'] == self.flight.id
+        assert delayed['flight_status'] == "D"
+        en_route = self.read_event(events)
+        assert en_route['flight_status'] == "E"
+        assert en_route['modified_at'] >= delayed['modified_at']
+
+        response.close()
+        assert broker.subscriber_count() == subscribers
+
+    def test_route_stream_only_sends_the_route(self):
+        other = Flight.objects.create(
+            origin="Lagos", destination="Kano", departure="2019-08-26", arrival="2019-08-27",
+            flight_number="IM 0001", airline="Arik", price=18000
+        )
+        response, events = self.open_stream(reverse("route-events") + "?origin=lagos&destination=enugu")
+        assert self.read_event(events)['flight_number'] == "BK 6089"
+        apply_status_updates([
+            {"flight_number": "IM 0001", "flight_status": "L"},
+            {"flight_number": "BK 6089", "flight_status": "C"},
+        ])
+        assert Flight.objects.get(pk=other.pk).flight_status == "L"
+        event = self.read_event(events)
+        assert event['flight_number'] == "BK 6089"
+        assert event['flight_status'] == "C"
+
+    def test_stream_errors(self):
+        response = self.client.get(reverse("flight-events", kwargs={"pk": self.flight.id + 1}))
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+        response = self.client.get(reverse("route-events") + "?origin=Lagos", HTTP_ACCEPT='text/event-stream')
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert response.content.startswith(b'event: error\n')
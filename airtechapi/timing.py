@@ -0,0 +1,100 @@
+import collections
+import contextlib
+import threading
+import time
+from django.db import connections
+
+_state = threading.local()
+
+
+class RequestTimer:
+    """
+    Timings of one sampled request. Durations are summed per name, with
+    nested measurements of the same name counted once; every query run
+    through the request's database connections is timed as `db`.
+    """
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.durations = collections.defaultdict(float)
+        self.queries = 0
+        self.statements = collections.Counter()
+        self._depth = collections.defaultdict(int)
+        self._marks = {}
+
+    @contextlib.contextmanager
+    def activate(self):
+        with contextlib.ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(self.execute))
+            _state.timer = self
+            try:
+                yield self
+            finally:
+                _state.timer = None
+
+    def execute(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.durations['db'] += time.perf_counter() - started
+            self.queries += 1
+            self.statements[sql] += 1
+
+    @contextlib.contextmanager
+    def measure(self, name):
+        self._depth[name] += 1
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._depth[name] -= 1
+            if not self._depth[name]:
+                self.durations[name] += time.perf_counter() - started
+
+    def start(self, name):
+        self._marks[name] = time.perf_counter()
+
+    def stop(self, name):
+        started = self._marks.pop(name, None)
+        if started is not None:
+            self.durations[name] += time.perf_counter() - started
+
+    def finish(self):
+        for name in list(self._marks):
+            self.stop(name)
+        self.durations['total'] = time.perf_counter() - self.started
+
+    def most_repeated(self):
+        """
+        The statement run most often and how many times, or (None, 0).
+        Per-row queries of a list share one parameterized statement, so
+        a high count is the mark of a query count growing with the rows.
+        """
+        if not self.statements:
+            return None, 0
+        return self.statements.most_common(1)[0]
+
+
+def current_timer():
+    return getattr(_state, 'timer', None)
+
+
+def measured(name, function, *args, **kwargs):
+    """
+    Call `function`, timing it as `name` when the current request is
+    sampled. Unsampled requests pay for one attribute lookup.
+    """
+    timer = getattr(_state, 'timer', None)
+    if timer is None:
+        return function(*args, **kwargs)
+    with timer.measure(name):
+        return function(*args, **kwargs)
+
+
+class TimedSerializerMixin:
+    """
+    Time the representations of a serializer as `serialize`.
+    """
+    def to_representation(self, instance):
+        return measured('serialize', super().to_representation, instance)
@@ -2,19 +2,47 @@ from django.urls import path
 from .views import (
     RegisterUsersView,
     LoginView,
+    RefreshTokenView,
+    LogoutView,
     FlightListView,
+    FlightSearchView,
+    FareCalendarView,
+    FlightImportView,
+    FlightExportView,
+    FlightStatusView,
+    CatalogCacheStatsView,
+    FlightEventsView,
+    RouteEventsView,
     FlightDetailView,
+    FlightBookingListView,
     BookFlightView,
+    BulkBookFlightView,
+    BookingExportView,
     BookFlightDetailView,
-    UploadPassportView
+    UploadPassportView,
+    PassportUploadStatusView
 )
 
 urlpatterns = [
     path('auth/register/', RegisterUsersView.as_view(), name="auth-register"),
     path('auth/login/', LoginView.as_view(), name="auth-login"),
+    path('auth/refresh/', RefreshTokenView.as_view(), name="auth-refresh"),
+    path('auth/logout/', LogoutView.as_view(), name="auth-logout"),
     path('flight/', FlightListView.as_view(), name="flight-list"),
+    path('flight/search/', FlightSearchView.as_view(), name="flight-search"),
+    path('flight/fares/', FareCalendarView.as_view(), name="flight-fares"),
+    path('flight/import/', FlightImportView.as_view(), name="flight-import"),
+    path('flight/export/', FlightExportView.as_view(), name="flight-export"),
+    path('flight/status/', FlightStatusView.as_view(), name="flight-status"),
+    path('flight/cache/', CatalogCacheStatsView.as_view(), name="flight-cache"),
+    path('flight/events/', RouteEventsView.as_view(), name="route-events"),
     path('flight/<int:pk>', FlightDetailView.as_view(), name="flight-detail"),
+    path('flight/<int:pk>/events', FlightEventsView.as_view(), name="flight-events"),
+    path('flight/<int:pk>/bookings', FlightBookingListView.as_view(), name="flight-bookings"),
     path('booking/', BookFlightView.as_view(), name="booking-list"),
+    path('booking/bulk/', BulkBookFlightView.as_view(), name="booking-bulk"),
+    path('booking/export/', BookingExportView.as_view(), name="booking-export"),
     path('booking/<int:pk>', BookFlightDetailView.as_view(), name="booking-detail"),
-    path('passport/', UploadPassportView.as_view(), name="passport-upload")
+    path('passport/', UploadPassportView.as_view(), name="passport-upload"),
+    path('passport/jobs/<int:pk>', PassportUploadStatusView.as_view(), name="passport-upload-status")
 ]
@@ -0,0 +1,46 @@
+import threading
+import time
+from rest_framework_jwt.settings import api_settings
+
+
+class TokenDenylist:
+    """
+    In-process record of revoked login sessions.
+
+    A session is identified by the user id and the `session` claim of the
+    login it started from (`orig_iat` for tokens issued without one).
+    Refreshed tokens keep both, so revoking a session revokes every token
+    refreshed from it. Entries are dropped once no token of the session
+    can still be valid.
+    """
+    def __init__(self):
+        self._revoked = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def session(payload):
+        return payload.get('user_id', None), payload.get('session', payload.get('orig_iat', None))
+
+    @staticmethod
+    def session_expiry(payload):
+        refresh_limit = api_settings.JWT_REFRESH_EXPIRATION_DELTA.total_seconds()
+        token_lifetime = api_settings.JWT_EXPIRATION_DELTA.total_seconds()
+        return payload.get('orig_iat', payload.get('exp', 0)) + refresh_limit + token_lifetime
+
+    def revoke(self, payload):
+        now = time.time()
+        with self._lock:
+            self._revoked = {
+                session: expiry for session, expiry in self._revoked.items() if expiry > now
+            }
+            self._revoked[self.session(payload)] = self.session_expiry(payload)
+
+    def is_revoked(self, payload):
+        return self.session(payload) in self._revoked
+
+    def clear(self):
+        with self._lock:
+            self._revoked = {}
+
+
+token_denylist = TokenDenylist()
@@ -0,0 +1,34 @@
+from ..fast_serializers import fast_booking_serializer, fast_flight_detail_serializer
+from ..models import Booking, Flight
+from ..renderers import CSVRenderer, NDJSONRenderer
+
+EXPORT_RENDERERS = {
+    renderer.format: renderer for renderer in (NDJSONRenderer, CSVRenderer)
+}
+# every exported model, with the compiled serializer of its rows
+EXPORTS = {
+    'flights': (Flight, fast_flight_detail_serializer),
+    'bookings': (Booking, fast_booking_serializer),
+}
+
+
+def export_rows(name, modified_since=None, modified_until=None, using=None):
+    """
+    Serialized rows of the `name` export in modified_at order, read from
+    a server-side cursor. `modified_since` is inclusive and
+    `modified_until` exclusive, so consecutive windows never overlap.
+    """
+    model, compiled = EXPORTS[name]
+    queryset = model.objects.using(using).order_by('modified_at', 'pk')
+    if modified_since is not None:
+        queryset = queryset.filter(modified_at__gte=modified_since)
+    if modified_until is not None:
+        queryset = queryset.filter(modified_at__lt=modified_until)
+    return compiled.iterate(queryset)
+
+
+def stream_export(name, renderer, **filters):
+    """
+    The encoded chunks of the `name` export in the format of `renderer`.
+    """
+    return renderer.stream(export_rows(name, **filters), fields=EXPORTS[name][1].flat_field_names())
@@ -0,0 +1,109 @@
+import functools
+import operator
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import Count, Max, Min, Q, Sum
+from django.utils import timezone
+from ..models import FareSummary, Flight
+
+FARE_FIELDS = frozenset(('origin', 'destination', 'departure', 'price'))
+SUMMARY_FIELDS = ('flight_count', 'min_price', 'max_price', 'avg_price')
+# keys refreshed per statement, bounds the size of the OR-ed route filters
+REFRESH_CHUNK_SIZE = 500
+
+_to_date = Flight._meta.get_field('departure').to_python
+
+
+def fare_key(flight):
+    """
+    The (origin, destination, departure) summary a flight counts towards.
+    """
+    return flight.origin, flight.destination, _to_date(flight.departure)
+
+
+def summarize_fares(queryset):
+    """
+    Yield (key, values) pairs of the fare summaries of the flights in
+    `queryset`, one per route and departure date.
+    """
+    rows = queryset.order_by().values('origin', 'destination', 'departure').annotate(
+        flight_count=Count('pk'),
+        min_price=Min('price'),
+        max_price=Max('price'),
+        total_price=Sum('price')
+    )
+    for row in rows.iterator():
+        yield (row['origin'], row['destination'], row['departure']), {
+            'flight_count': row['flight_count'],
+            'min_price': row['min_price'],
+            'max_price': row['max_price'],
+            'avg_price': (Decimal(row['total_price']) / row['flight_count']).quantize(Decimal('0.01'))
+        }
+
+
+def refresh_fare_summaries(keys):
+    """
+    Bring the summaries of the given (origin, destination, departure)
+    keys in line with their flights.
+
+    Only the flights of those keys are aggregated, through the route and
+    departure index. The summary rows are created if missing and locked in
+    key order before the flights are read, so concurrent writers to the
+    same key take turns and the last one sees every committed flight.
+    Summaries left without flights are deleted.
+    """
+    keys = sorted({(origin, destination, _to_date(departure)) for origin, destination, departure in keys})
+    for start in range(0, len(keys), REFRESH_CHUNK_SIZE):
+        _refresh_chunk(keys[start:start + REFRESH_CHUNK_SIZE])
+
+
+def _refresh_chunk(keys):
+    lookup = functools.reduce(operator.or_, [
+        Q(origin=origin, destination=destination, departure=departure)
+        for origin, destination, departure in keys
+    ])
+    with transaction.atomic():
+        FareSummary.objects.bulk_create([
+            FareSummary(origin=origin, destination=destination, departure=departure)
+            for origin, destination, departure in keys
+        ], ignore_conflicts=True)
+        summaries = FareSummary.objects.select_for_update().filter(lookup).order_by(
+            'origin', 'destination', 'departure'
+        )
+        summaries = {fare_key(summary): summary for summary in summaries}
+        fares = dict(summarize_fares(Flight.objects.filter(lookup)))
+        now = timezone.now()
+        changed = []
+        empty = []
+        for key, summary in summaries.items():
+            values = fares.get(key)
+            if values is None:
+                empty.append(summary.pk)
+                continue
+            for field, value in values.items():
+                setattr(summary, field, value)
+            summary.modified_at = now
+            changed.append(summary)
+        if changed:
+            FareSummary.objects.bulk_update(changed, SUMMARY_FIELDS + ('modified_at',))
+        if empty:
+            FareSummary.objects.filter(pk__in=empty).delete()
+
+
+def compare_fare_summaries():
+    """
+    Check the summary table against a full recompute from the flights.
+    Returns the keys that are missing, that hold stale values and that
+    have no flights left.
+    """
+    expected = dict(summarize_fares(Flight.objects.all()))
+    stale = []
+    orphaned = []
+    for summary in FareSummary.objects.values('origin', 'destination', 'departure', *SUMMARY_FIELDS).iterator():
+        key = (summary['origin'], summary['destination'], summary['departure'])
+        values = expected.pop(key, None)
+        if values is None:
+            orphaned.append(key)
+        elif any(summary[field] != value for field, value in values.items()):
+            stale.append(key)
+    return sorted(expected), stale, orphaned
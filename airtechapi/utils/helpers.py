@@ -1,6 +1,8 @@
 import datetime
+import uuid
 from django.utils import timezone
 from rest_framework_jwt.settings import api_settings
+from rest_framework_jwt.utils import jwt_payload_handler as default_jwt_payload_handler
 
 expire_delta = api_settings.JWT_REFRESH_EXPIRATION_DELTA
 
@@ -11,3 +13,14 @@ def jwt_response_payload_handler(token, user=None, request=None):
         'user': user.username,
         'expires': timezone.now() + expire_delta - datetime.timedelta(seconds=200)
     }
+
+
+def jwt_payload_handler(user, session=None):
+    """
+    The default payload plus a `session` claim naming the login the token
+    belongs to. Refreshed tokens are issued with the session of the token
+    they replace.
+    """
+    payload = default_jwt_payload_handler(user)
+    payload['session'] = session or uuid.uuid4().hex
+    return payload
@@ -0,0 +1,158 @@
+import csv
+import json
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from ..cache import catalog_cache
+from ..events import publish_flight_events
+from ..models import Flight
+from ..serializers import FlightImportSerializer
+from .fares import fare_key, refresh_fare_summaries
+
+FORMATS = ('csv', 'ndjson')
+
+
+class ImportReport:
+    """
+    Running totals of a flight import. Only the first `max_errors` row
+    errors are kept so a badly broken file cannot exhaust memory.
+    """
+    def __init__(self, max_errors=1000):
+        self.created = 0
+        self.updated = 0
+        self.failed = 0
+        self.errors = []
+        self.max_errors = max_errors
+
+    def add_error(self, row, errors):
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'row': row, 'errors': errors})
+
+    def as_dict(self):
+        return {
+            'created': self.created,
+            'updated': self.updated,
+            'failed': self.failed,
+            'errors': self.errors
+        }
+
+
+def read_rows(stream, file_format):
+    """
+    Lazily decode a binary stream of CSV or NDJSON flight rows, one dict
+    per row, without loading the file into memory. Lines are decoded one
+    at a time, so the rows before a line that is not UTF-8 still load.
+    """
+    if file_format == 'csv':
+        # a line that is not UTF-8 raises UnicodeDecodeError, as the
+        # records after it cannot be told apart
+        for row in csv.DictReader(line.decode('utf-8') for line in stream):
+            # blank cells fall back to the model defaults
+            yield {key: value for key, value in row.items() if key and value != ''}
+    elif file_format == 'ndjson':
+        for line in stream:
+            if line.strip():
+                try:
+                    yield json.loads(line.decode('utf-8'))
+                except ValueError:
+                    yield None
+    else:
+        raise ValueError('Unsupported import format: {}'.format(file_format))
+
+
+def import_flights(rows, batch_size=1000, report=None):
+    """
+    Validate and upsert flight rows on flight_number in batches.
+
+    Every batch is validated with FlightImportSerializer, then written in
+    its own transaction with one bulk insert for new flights and one bulk
+    update for existing ones. Invalid rows are reported, never fatal; a
+    flight_number repeated within a batch keeps its first row and reports
+    the others.
+    """
+    report = report or ImportReport()
+    batch = []
+    number = 0
+    try:
+        for number, row in enumerate(rows, start=1):
+            batch.append((number, row))
+            if len(batch) >= batch_size:
+                _import_batch(batch, report)
+                batch = []
+    except UnicodeDecodeError:
+        # the stream cannot be decoded past this point, keep what was read
+        if batch:
+            _import_batch(batch, report)
+        report.add_error(number + 1, {'non_field_errors': ['The file is not valid UTF-8 from this row on.']})
+        return report
+    if batch:
+        _import_batch(batch, report)
+    return report
+
+
+def _import_batch(batch, report):
+    flights = {}
+    for number, row in batch:
+        if not isinstance(row, dict):
+            report.add_error(number, {'non_field_errors': ['Invalid row.']})
+            continue
+        serializer = FlightImportSerializer(data=row)
+        if not serializer.is_valid():
+            report.add_error(number, serializer.errors)
+            continue
+        data = serializer.validated_data
+        if data['flight_number'] in flights:
+            report.add_error(number, {
+                'flight_number': ['Duplicate of row {} in the same batch.'.format(flights[data['flight_number']][0])]
+            })
+            continue
+        flights[data['flight_number']] = (number, data)
+
+    if not flights:
+        return
+
+    try:
+        errors, created, updated = _write_batch(flights)
+    except IntegrityError:
+        # another writer inserted some of these flight numbers after they
+        # were read; the rolled back batch now finds them and updates them
+        errors, created, updated = _write_batch(flights)
+    for number, error in errors:
+        report.add_error(number, error)
+    report.created += created
+    report.updated += updated
+
+
+def _write_batch(flights):
+    errors = []
+    with transaction.atomic():
+        existing = Flight.objects.select_for_update().in_bulk(list(flights), field_name='flight_number')
+        created = []
+        updated = []
+        update_fields = set()
+        fare_keys = set()
+        now = timezone.now()
+        for flight_number, (number, data) in flights.items():
+            flight = existing.get(flight_number, None)
+            if flight is None:
+                created.append(Flight(**data))
+                continue
+            if data.get('capacity', flight.capacity) < flight.booked_tickets:
+                errors.append((number, {
+                    'capacity': ['The capacity cannot be less than the number of booked tickets']
+                }))
+                continue
+            fare_keys.add(fare_key(flight))
+            for attr, value in data.items():
+                setattr(flight, attr, value)
+            flight.modified_at = now
+            update_fields.update(data)
+            updated.append(flight)
+        Flight.objects.bulk_create(created)
+        if updated:
+            Flight.objects.bulk_update(updated, list(update_fields) + ['modified_at'])
+        # bulk writes bypass the model signals that keep the catalog cache and fare summaries fresh
+        catalog_cache.invalidate_flights([flight.pk for flight in updated])
+        refresh_fare_summaries(fare_keys.union(fare_key(flight) for flight in created + updated))
+        publish_flight_events(updated)
+    return errors, len(created), len(updated)
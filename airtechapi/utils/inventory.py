@@ -0,0 +1,102 @@
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.utils import timezone
+from ..cache import catalog_cache
+from ..models import Booking, Flight
+
+
+def reserve_seats(flight_id, tickets, bookings=0):
+    """
+    Reserve seats with a single conditional UPDATE, counting `bookings`
+    new bookings on the flight.
+
+    The capacity check and the increments happen in the same statement, so
+    concurrent bookings can never oversell a flight and no row lock is
+    held beyond the enclosing transaction. Returns False when the flight
+    does not have enough seats left.
+    """
+    reserved = Flight.objects.filter(
+        pk=flight_id,
+        booked_tickets__lte=F('capacity') - tickets
+    ).update(
+        booked_tickets=F('booked_tickets') + tickets,
+        booking_count=F('booking_count') + bookings,
+        modified_at=timezone.now()
+    ) == 1
+    if reserved:
+        catalog_cache.invalidate_flight(flight_id)
+    return reserved
+
+
+def release_seats(flight_id, tickets, bookings=0):
+    """
+    Give seats back to a flight, along with `bookings` removed bookings.
+    """
+    Flight.objects.filter(pk=flight_id).update(
+        booked_tickets=F('booked_tickets') - tickets,
+        booking_count=F('booking_count') - bookings,
+        modified_at=timezone.now()
+    )
+    catalog_cache.invalidate_flight(flight_id)
+
+
+def move_seats(old_flight_id, old_tickets, new_flight_id, new_tickets):
+    """
+    Adjust the reservations of a booking whose flight or ticket count
+    changed. Returns False when the new flight cannot take the tickets.
+
+    The two flights are updated in primary key order, so opposite moves
+    between the same flights cannot deadlock. The old flight may then be
+    released before the new one is found full: callers must roll back
+    the enclosing transaction when False is returned.
+    """
+    if old_flight_id == new_flight_id:
+        delta = new_tickets - old_tickets
+        if delta > 0:
+            return reserve_seats(new_flight_id, delta)
+        if delta < 0:
+            release_seats(old_flight_id, -delta)
+        return True
+    if old_flight_id < new_flight_id:
+        release_seats(old_flight_id, old_tickets, bookings=1)
+        return reserve_seats(new_flight_id, new_tickets, bookings=1)
+    if not reserve_seats(new_flight_id, new_tickets, bookings=1):
+        return False
+    release_seats(old_flight_id, old_tickets, bookings=1)
+    return True
+
+
+def reconcile_flight_counters(chunk_size=500):
+    """
+    Recount booked_tickets and booking_count from the bookings and repair
+    the flights whose counters drifted. Returns the number repaired.
+
+    Flights are walked in primary key order, one chunk per transaction.
+    A chunk locks only its own flights while its bookings are aggregated,
+    so bookings on other flights carry on, and bookings on a locked
+    flight wait for one short transaction rather than the whole run.
+    """
+    repaired = 0
+    last_pk = 0
+    while True:
+        with transaction.atomic():
+            flights = list(Flight.objects.select_for_update().filter(pk__gt=last_pk).order_by('pk').values_list(
+                'pk', 'booked_tickets', 'booking_count'
+            )[:chunk_size])
+            if not flights:
+                return repaired
+            last_pk = flights[-1][0]
+            counts = {
+                row['flight_id']: (row['tickets'], row['bookings'])
+                for row in Booking.objects.filter(flight_id__in=[pk for pk, _, _ in flights]).order_by().values(
+                    'flight_id').annotate(tickets=Sum('number_of_tickets'), bookings=Count('pk'))
+            }
+            drifted = [
+                (pk, counts.get(pk, (0, 0))) for pk, tickets, bookings in flights
+                if counts.get(pk, (0, 0)) != (tickets, bookings)
+            ]
+            now = timezone.now()
+            for pk, (tickets, bookings) in drifted:
+                Flight.objects.filter(pk=pk).update(booked_tickets=tickets, booking_count=bookings, modified_at=now)
+            catalog_cache.invalidate_flights([pk for pk, _ in drifted])
+        repaired += len(drifted)
@@ -0,0 +1,73 @@
+from collections import defaultdict
+from django.db import transaction
+from django.db.models import Case, Value, When
+from django.utils import timezone
+from ..cache import catalog_cache
+from ..events import publish_flight_events
+from ..models import Flight
+
+FLIGHT_STATUSES = frozenset(code for code, _ in Flight.FLIGHT_STATUS)
+UNKNOWN_FLIGHT = 'Flight does not exist'
+INVALID_STATUS = 'flight_status must be one of: {}'.format(', '.join(sorted(FLIGHT_STATUSES)))
+INVALID_ITEM = 'Expected an object with flight_number and flight_status'
+
+
+def apply_status_updates(updates):
+    """
+    Apply a batch of {flight_number, flight_status} changes and return a
+    report of what happened.
+
+    Only the status is checked, the rest of the flight is not
+    re-validated. When a flight appears more than once the last change
+    wins. Flights already in their new status are skipped, and the
+    remaining changes are written with a single UPDATE.
+    """
+    report = {'received': len(updates), 'updated': 0, 'unchanged': 0, 'failed': 0, 'errors': []}
+    requested = {}
+    for index, item in enumerate(updates):
+        if not isinstance(item, dict) or not isinstance(item.get('flight_number'), str):
+            _add_error(report, index, INVALID_ITEM)
+        elif item.get('flight_status') not in FLIGHT_STATUSES:
+            _add_error(report, index, INVALID_STATUS)
+        else:
+            requested[item['flight_number']] = (index, item['flight_status'])
+
+    with transaction.atomic():
+        current = Flight.objects.only(
+            'flight_number', 'origin', 'destination', 'flight_status'
+        ).in_bulk(list(requested), field_name='flight_number')
+        changed = []
+        changes = defaultdict(list)
+        for flight_number, (index, flight_status) in requested.items():
+            flight = current.get(flight_number)
+            if flight is None:
+                _add_error(report, index, UNKNOWN_FLIGHT)
+            elif flight.flight_status == flight_status:
+                report['unchanged'] += 1
+            else:
+                flight.flight_status = flight_status
+                changed.append(flight)
+                changes[flight_status].append(flight.pk)
+
+        if changed:
+            now = timezone.now()
+            Flight.objects.filter(pk__in=[flight.pk for flight in changed]).update(
+                flight_status=Case(*[
+                    When(pk__in=pks, then=Value(flight_status))
+                    for flight_status, pks in changes.items()
+                ]),
+                modified_at=now
+            )
+            for flight in changed:
+                flight.modified_at = now
+            # update() skips the save signals
+            catalog_cache.invalidate_flights([flight.pk for flight in changed])
+            publish_flight_events(changed)
+        report['updated'] = len(changed)
+    report['errors'].sort(key=lambda error: error['index'])
+    return report
+
+
+def _add_error(report, index, message):
+    report['failed'] += 1
+    report['errors'].append({'index': index, 'error': message})
@@ -0,0 +1,142 @@
+import datetime
+import os
+import shutil
+import uuid
+from django.conf import settings
+from django.core.files.uploadhandler import StopUpload, TemporaryFileUploadHandler
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from ..models import PassportUpload
+from ..serializers import ProfileSerializer
+from ..storage import get_passport_storage
+
+# a job still running after this long is assumed to belong to a dead worker
+STALE_AFTER = datetime.timedelta(minutes=10)
+
+# leading bytes of the scan formats we accept
+PASSPORT_SIGNATURES = (
+    b'\xff\xd8\xff',  # JPEG
+    b'\x89PNG\r\n\x1a\n',  # PNG
+    b'%PDF-',  # PDF
+)
+TOO_LARGE = 'too_large'
+UNSUPPORTED_TYPE = 'unsupported_type'
+
+
+class PassportUploadHandler(TemporaryFileUploadHandler):
+    """
+    Streams passport scans straight to a temporary file on disk.
+
+    The upload is abandoned, without reading the rest of the body, as soon
+    as it grows past PASSPORT_UPLOAD_MAX_SIZE or its first chunk does not
+    start with a known scan signature. The reason is left on the request
+    as `passport_rejected`.
+    """
+    def receive_data_chunk(self, raw_data, start):
+        if start == 0 and not raw_data.startswith(PASSPORT_SIGNATURES):
+            self.reject(UNSUPPORTED_TYPE)
+        if start + len(raw_data) > settings.PASSPORT_UPLOAD_MAX_SIZE:
+            self.reject(TOO_LARGE)
+        return super().receive_data_chunk(raw_data, start)
+
+    def reject(self, reason):
+        self.request.passport_rejected = reason
+        raise StopUpload(connection_reset=True)
+
+
+def spool_passport(uploaded_file):
+    """
+    Persist an uploaded scan under PASSPORT_SPOOL_DIR and return its path.
+    Files Django already spooled to disk are moved rather than copied.
+    """
+    os.makedirs(settings.PASSPORT_SPOOL_DIR, exist_ok=True)
+    path = os.path.join(settings.PASSPORT_SPOOL_DIR, uuid.uuid4().hex)
+    if hasattr(uploaded_file, 'temporary_file_path'):
+        shutil.move(uploaded_file.temporary_file_path(), path)
+        # the temporary file is gone, closing it now stops its cleanup from failing later
+        uploaded_file.close()
+    else:
+        with open(path, 'wb') as spool:
+            for chunk in uploaded_file.chunks():
+                spool.write(chunk)
+    return path
+
+
+def enqueue_passport_upload(user, uploaded_file, profile=None):
+    return PassportUpload.objects.create(
+        user=user,
+        profile=profile,
+        spool_path=spool_passport(uploaded_file)
+    )
+
+
+def claim_passport_upload():
+    """
+    Mark the oldest pending (or abandoned) job as running and return it.
+    SKIP LOCKED lets any number of workers poll the table concurrently.
+    """
+    with transaction.atomic():
+        job = PassportUpload.objects.select_for_update(skip_locked=True).filter(
+            Q(status=PassportUpload.PENDING) |
+            Q(status=PassportUpload.RUNNING, modified_at__lt=timezone.now() - STALE_AFTER)
+        ).order_by('created_at').first()
+        if job is None:
+            return None
+        PassportUpload.objects.filter(pk=job.pk).update(
+            status=PassportUpload.RUNNING,
+            attempts=F('attempts') + 1,
+            modified_at=timezone.now()
+        )
+    job.refresh_from_db()
+    return job
+
+
+def process_passport_upload(job):
+    try:
+        uploaded = get_passport_storage().upload(
+            job.spool_path,
+            public_id=job.profile.cloudinary_public_id if job.profile else None
+        )
+        serializer = ProfileSerializer(job.profile, data={
+            "user": job.user_id,
+            "passport_url": uploaded['secure_url'],
+            "cloudinary_public_id": uploaded['public_id']
+        })
+        serializer.is_valid(raise_exception=True)
+        job.profile = serializer.save()
+    except Exception as error:
+        job.error = str(error)
+        if job.attempts < settings.PASSPORT_UPLOAD_MAX_ATTEMPTS:
+            job.status = PassportUpload.PENDING
+        else:
+            job.status = PassportUpload.FAILED
+            _discard_spool(job)
+    else:
+        job.error = ''
+        job.status = PassportUpload.DONE
+        _discard_spool(job)
+    job.save(update_fields=['profile', 'status', 'error', 'modified_at'])
+    return job
+
+
+def process_pending_passport_uploads(limit=None):
+    """
+    Process queued jobs until the queue is empty or `limit` jobs ran.
+    Returns the number of jobs processed.
+    """
+    processed = 0
+    while limit is None or processed < limit:
+        job = claim_passport_upload()
+        if job is None:
+            break
+        process_passport_upload(job)
+        processed += 1
+    return processed
+
+
+def _discard_spool(job):
+    try:
+        os.remove(job.spool_path)
+    except FileNotFoundError:
+        pass
@@ -1,27 +1,55 @@
-import cloudinary.uploader
+import os
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from rest_framework import generics, status
 from rest_framework.permissions import AllowAny
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework_jwt.settings import api_settings
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.parsers import MultiPartParser, JSONParser
-from django.db import IntegrityError
+from rest_framework.renderers import JSONRenderer
+from django.db import IntegrityError, connections, transaction
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from rest_framework.exceptions import ValidationError
 from .serializers import (
-    UserDataSerializer, FLightSerializer, FlightDetailSerializer, BookingSerializer, ProfileSerializer)
+    UserDataSerializer, FLightSerializer, FlightDetailSerializer, BookingSerializer,
+    FlightSearchSerializer, PassportUploadSerializer, RefreshTokenSerializer, FareSummarySerializer,
+    FareCalendarSerializer, ExportFilterSerializer)
+from .exceptions import PayloadTooLarge
 from .permissions import AnonymousPermissionOnly, IsAdminOrReadOnly, IsCurrentUserOwnerOrReadOnly
-from .models import Flight, Booking, Profile
+from .pagination import FlightCursorPagination, BookingCursorPagination
+from .cache import catalog_cache, CachedListMixin, CachedRetrieveMixin
+from .fast_serializers import (
+    FastListMixin, FastRetrieveMixin, fast_booking_serializer, fast_flight_detail_serializer,
+    fast_flight_serializer)
+from .events import flight_channel, flight_event, get_flight_event_broker, route_channel
+from .renderers import CSVRenderer, EventStreamRenderer, LIST_RENDERER_CLASSES, NDJSONRenderer, format_event
+from .routers import get_read_alias
+from .models import FareSummary, Flight, Booking, Profile, PassportUpload
+from .utils.inventory import reserve_seats, release_seats, move_seats
+from .utils.importer import FORMATS, import_flights, read_rows
+from .utils.denylist import token_denylist
+from .utils.exports import stream_export
+from .utils.status import apply_status_updates
+from .utils.uploads import enqueue_passport_upload, PassportUploadHandler, TOO_LARGE, UNSUPPORTED_TYPE
 
 
 jwt_payload_handler = api_settings.JWT_PAYLOAD_HANDLER
 jwt_encode_handler = api_settings.JWT_ENCODE_HANDLER
+jwt_decode_handler = api_settings.JWT_DECODE_HANDLER
 jwt_response_payload_handler = api_settings.JWT_RESPONSE_PAYLOAD_HANDLER
 
 User = get_user_model()
 
+NOT_ENOUGH_SEATS = {
+    'message': 'There are not enough seats left on this flight'
+}
+NOT_UNIQUE_BOOKING = {
+    'message': 'The flight and the passenger fields should be unique together'
+}
+
 
 # User Related Views
 class RegisterUsersView(generics.CreateAPIView):
@@ -36,6 +64,10 @@ class RegisterUsersView(generics.CreateAPIView):
 class LoginView(APIView):
     """
     POST auth/login/
+
+    Unknown usernames cost one password hash like known ones, so the
+    response time does not reveal which usernames exist. A hash stored
+    with an outdated work factor is upgraded on a successful login.
     """
     permission_classes = (AnonymousPermissionOnly,)
 
@@ -43,109 +75,514 @@ class LoginView(APIView):
         data = request.data
         username = data.get('username')
         password = data.get('password')
-        qs = User.objects.filter(username__exact=username)
-        if qs.count() == 1:
-            user_obj = qs.first()
-            if user_obj.check_password(password):
-                payload = jwt_payload_handler(user_obj)
-                token = jwt_encode_handler(payload)
-                response = jwt_response_payload_handler(token, user=user_obj, request=request)
-                return Response(response)
+        user_obj = User.objects.filter(username__exact=username).first()
+        if user_obj is None:
+            User().set_password(password)
+        elif user_obj.check_password(password):
+            payload = jwt_payload_handler(user_obj)
+            token = jwt_encode_handler(payload)
+            response = jwt_response_payload_handler(token, user=user_obj, request=request)
+            return Response(response)
         return Response({
             "error": "Invalid Credentials"
         }, status=status.HTTP_400_BAD_REQUEST)
 
 
+class RefreshTokenView(APIView):
+    """
+    POST auth/refresh/
+
+    Exchanges an unexpired token for a new one, without checking a
+    password, until JWT_REFRESH_EXPIRATION_DELTA after the original login.
+    """
+    authentication_classes = ()
+    permission_classes = (AllowAny,)
+
+    def post(self, request, *args, **kwargs):
+        serializer = RefreshTokenSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        user = serializer.validated_data['user']
+        token = serializer.validated_data['token']
+        response = jwt_response_payload_handler(token, user=user, request=request)
+        return Response(response)
+
+
+class LogoutView(APIView):
+    """
+    POST auth/logout/
+
+    Revokes the login session of the current token, including every
+    token refreshed from it.
+    """
+    permission_classes = (IsAuthenticated,)
+
+    def post(self, request, *args, **kwargs):
+        if request.auth is not None:
+            token_denylist.revoke(jwt_decode_handler(request.auth))
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
 # Flight Related Views
-class FlightListView(generics.ListCreateAPIView):
+class FlightListView(CachedListMixin, FastListMixin, generics.ListCreateAPIView):
     permission_classes = (IsAuthenticated, IsAdminOrReadOnly)
+    read_from_replica = True
     serializer_class = FLightSerializer
+    fast_serializer = fast_flight_serializer
+    pagination_class = FlightCursorPagination
+    renderer_classes = LIST_RENDERER_CLASSES
     queryset = Flight.objects.all()
 
 
-class FlightDetailView(generics.RetrieveUpdateDestroyAPIView):
+class FlightSearchView(FastListMixin, generics.ListAPIView):
+    """
+    GET flight/search/?origin=&destination=&departure_from=&departure_to=
+    &flight_status=&type_of_flight=&airline=&max_price=
+
+    Route and date filters are served by the (origin, destination, departure)
+    index, airline and date filters by the (airline, departure) index.
+    """
+    permission_classes = (IsAuthenticated,)
+    serializer_class = FLightSerializer
+    fast_serializer = fast_flight_serializer
+    pagination_class = FlightCursorPagination
+    read_from_replica = True
+
+    def get_queryset(self):
+        search = FlightSearchSerializer(data=self.request.query_params)
+        search.is_valid(raise_exception=True)
+        return Flight.objects.filter(**search.get_filters())
+
+
+class FareCalendarView(generics.ListAPIView):
+    """
+    GET flight/fares/?origin=&destination=&month=YYYY-MM
+
+    The cheapest, dearest and average fares and the number of flights of
+    each departure date of a route in one month, read from the fare
+    summaries with a single range scan of their unique index.
+    """
+    permission_classes = (IsAuthenticated,)
+    serializer_class = FareSummarySerializer
+    read_from_replica = True
+
+    def get_queryset(self):
+        calendar = FareCalendarSerializer(data=self.request.query_params)
+        calendar.is_valid(raise_exception=True)
+        return FareSummary.objects.filter(**calendar.get_filters()).order_by('departure')
+
+
+class FlightImportView(APIView):
+    """
+    POST flight/import/
+
+    Multipart upload of a CSV or NDJSON schedule in the `file` field. The
+    format comes from the `format` field or the file extension.
+    """
+    permission_classes = (IsAuthenticated, IsAdminUser)
+    parser_classes = (MultiPartParser,)
+
+    def post(self, request):
+        upload = request.data.get('file')
+        if upload is None or not hasattr(upload, 'file'):
+            raise ValidationError({
+                'file': 'A CSV or NDJSON file is required'
+            })
+        file_format = request.data.get('format') or os.path.splitext(upload.name)[1].lstrip('.').lower()
+        if file_format not in FORMATS:
+            raise ValidationError({
+                'format': 'The format must be one of: {}'.format(', '.join(FORMATS))
+            })
+        report = import_flights(read_rows(upload.file, file_format))
+        return Response(report.as_dict(), status=status.HTTP_200_OK)
+
+
+class FlightStatusView(APIView):
+    """
+    POST flight/status/
+
+    Ingests a batch of {flight_number, flight_status} changes from an
+    operational feed. Unlike a PUT on flight/<pk>, only the status is
+    validated, so flights that already departed can be updated.
+    """
+    permission_classes = (IsAuthenticated, IsAdminUser)
+    max_updates = 5000
+
+    def post(self, request):
+        if not isinstance(request.data, list):
+            raise ValidationError({
+                'message': 'Expected a list of status updates'
+            })
+        if not 0 < len(request.data) <= self.max_updates:
+            raise ValidationError({
+                'message': 'Expected between 1 and {} status updates'.format(self.max_updates)
+            })
+        return Response(apply_status_updates(request.data), status=status.HTTP_200_OK)
+
+
+class FlightDetailView(CachedRetrieveMixin, FastRetrieveMixin, generics.RetrieveUpdateDestroyAPIView):
+    """
+    GET flight/<pk>[?include=bookings]
+
+    The bookings of a flight are paged through flight/<pk>/bookings.
+    ?include=bookings adds the oldest `max_included_bookings` of them to
+    the flight; booking_count tells whether there are more.
+    """
     permission_classes = (IsAuthenticated, IsAdminOrReadOnly)
+    read_from_replica = True
     serializer_class = FlightDetailSerializer
+    fast_serializer = fast_flight_detail_serializer
     queryset = Flight.objects.all()
+    max_included_bookings = 100
+
+    def retrieve(self, request, *args, **kwargs):
+        include = request.query_params.get('include')
+        if include is not None and include != 'bookings':
+            raise ValidationError({
+                'include': 'Only bookings can be included'
+            })
+        return super().retrieve(request, *args, **kwargs)
+
+    def get_fast_data(self, queryset, **lookups):
+        data = super().get_fast_data(queryset, **lookups)
+        if 'include' in self.request.query_params:
+            bookings = Booking.objects.filter(flight_id=self.kwargs['pk']).order_by('pk')
+            data['bookings'] = fast_booking_serializer.serialize(
+                fast_booking_serializer.values(bookings)[:self.max_included_bookings]
+            )
+        return data
+
+
+class FlightEventStreamView(APIView):
+    """
+    Base view for Server-Sent Events streams of flight status changes.
+
+    The stream opens with the current status of the matching flights, then
+    sends a `status` event for every change and a comment line every
+    FLIGHT_EVENT_HEARTBEAT seconds. It holds no database connection while
+    it waits.
+    """
+    permission_classes = (IsAuthenticated,)
+    renderer_classes = (EventStreamRenderer, JSONRenderer)
+
+    def get_channels(self):
+        raise NotImplementedError
+
+    def get_flights(self):
+        raise NotImplementedError
+
+    def get(self, request, *args, **kwargs):
+        channels = self.get_channels()
+        snapshot = [flight_event(flight) for flight in self.get_flights()]
+        subscription = get_flight_event_broker().subscribe(channels)
+        response = StreamingHttpResponse(
+            self.stream(subscription, snapshot),
+            content_type=EventStreamRenderer.media_type
+        )
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    def stream(self, subscription, snapshot):
+        try:
+            for connection in connections.all():
+                if not connection.in_atomic_block:
+                    connection.close()
+            yield 'retry: {}\n\n'.format(settings.FLIGHT_EVENT_HEARTBEAT * 1000)
+            for event in snapshot:
+                yield format_event(event, event='status')
+            while True:
+                event = subscription.get(timeout=settings.FLIGHT_EVENT_HEARTBEAT)
+                yield format_event(event, event='status') if event is not None else ': keepalive\n\n'
+        finally:
+            subscription.close()
+
+
+class FlightEventsView(FlightEventStreamView):
+    """
+    GET flight/<pk>/events
+    """
+    def get_channels(self):
+        return [flight_channel(self.kwargs['pk'])]
+
+    def get_flights(self):
+        return [get_object_or_404(Flight, pk=self.kwargs['pk'])]
+
 
+class RouteEventsView(FlightEventStreamView):
+    """
+    GET flight/events/?origin=&destination=
+
+    Status changes of every flight on a route.
+    """
+    def get_channels(self):
+        return [route_channel(*self.get_route())]
+
+    def get_flights(self):
+        origin, destination = self.get_route()
+        return Flight.objects.filter(origin__iexact=origin, destination__iexact=destination)
+
+    def get_route(self):
+        origin = self.request.query_params.get('origin')
+        destination = self.request.query_params.get('destination')
+        if not origin or not destination:
+            raise ValidationError({
+                'message': 'Both origin and destination are required'
+            })
+        return origin, destination
+
+
+class ExportView(APIView):
+    """
+    Base view for full or incremental dumps of a table, streamed as
+    NDJSON or CSV (?format=ndjson|csv or the Accept header) from a
+    server-side cursor. ?modified_since= and ?modified_until= limit the
+    rows to a window of modified_at.
+    """
+    permission_classes = (IsAuthenticated, IsAdminUser)
+    renderer_classes = (NDJSONRenderer, CSVRenderer)
+    read_from_replica = True
+    export = None
+
+    def get(self, request, *args, **kwargs):
+        filters = ExportFilterSerializer(data=request.query_params)
+        filters.is_valid(raise_exception=True)
+        renderer = request.accepted_renderer
+        # the rows are read after the view returns, bind them to this request's database now
+        response = StreamingHttpResponse(
+            stream_export(self.export, renderer, using=get_read_alias(), **filters.validated_data),
+            content_type='{}; charset={}'.format(renderer.media_type, renderer.charset)
+        )
+        response['Content-Disposition'] = 'attachment; filename="{}.{}"'.format(self.export, renderer.format)
+        return response
+
+
+class FlightExportView(ExportView):
+    """
+    GET flight/export/
+    """
+    export = 'flights'
+
+
+class BookingExportView(ExportView):
+    """
+    GET booking/export/
+    """
+    export = 'bookings'
 
-class BookFlightView(generics.ListCreateAPIView):
+
+class CatalogCacheStatsView(APIView):
+    """
+    GET flight/cache/
+    """
+    permission_classes = (IsAuthenticated, IsAdminUser)
+
+    def get(self, request):
+        return Response(catalog_cache.stats())
+
+
+class FlightBookingListView(FastListMixin, generics.ListAPIView):
+    """
+    GET flight/<pk>/bookings
+    """
+    permission_classes = (IsAuthenticated,)
+    serializer_class = BookingSerializer
+    fast_serializer = fast_booking_serializer
+    pagination_class = BookingCursorPagination
+
+    def get_queryset(self):
+        flight = get_object_or_404(Flight, pk=self.kwargs['pk'])
+        return Booking.objects.filter(flight=flight).select_related('flight', 'passenger')
+
+
+class BookFlightView(FastListMixin, generics.ListCreateAPIView):
+    """
+    GET booking/ lists the bookings of the current user only
+    POST booking/
+    """
     permission_classes = (IsAuthenticated,)
     serializer_class = BookingSerializer
-    queryset = Booking.objects.all()
+    fast_serializer = fast_booking_serializer
+    pagination_class = BookingCursorPagination
+    renderer_classes = LIST_RENDERER_CLASSES
+
+    def get_queryset(self):
+        return Booking.objects.filter(passenger=self.request.user).select_related('flight', 'passenger')
 
     def perform_create(self, serializer):
+        flight = serializer.validated_data['flight']
+        tickets = serializer.validated_data.get('number_of_tickets', 1)
         try:
-            serializer.save(passenger=self.request.user)
+            with transaction.atomic():
+                if not reserve_seats(flight.pk, tickets, bookings=1):
+                    raise ValidationError(NOT_ENOUGH_SEATS)
+                serializer.save(passenger=self.request.user)
         except IntegrityError:
+            raise ValidationError(NOT_UNIQUE_BOOKING)
+
+
+class BulkBookFlightView(generics.CreateAPIView):
+    """
+    POST booking/bulk/
+
+    Books a list of {flight, number_of_tickets} items for the current user
+    in one transaction. Either every booking is created or none is, and
+    errors are returned per item in request order.
+    """
+    permission_classes = (IsAuthenticated,)
+    serializer_class = BookingSerializer
+    max_bookings = 50
+
+    def get_serializer(self, *args, **kwargs):
+        data = kwargs.get('data', None)
+        if not isinstance(data, list):
+            raise ValidationError({
+                'message': 'Expected a list of bookings'
+            })
+        if not 0 < len(data) <= self.max_bookings:
             raise ValidationError({
-                'message': 'The flight and the passenger fields should be unique together'
+                'message': 'Expected between 1 and {} bookings'.format(self.max_bookings)
             })
+        # only strings can be flight numbers, other values fail per item in FlightNumberField
+        flight_numbers = {
+            item['flight'] for item in data if isinstance(item, dict) and isinstance(item.get('flight'), str)
+        }
+        context = self.get_serializer_context()
+        context['flights'] = Flight.objects.in_bulk(list(flight_numbers), field_name='flight_number')
+        return self.serializer_class(*args, many=True, context=context, **kwargs)
+
+    def perform_create(self, serializer):
+        items = serializer.validated_data
+        booked_flights = set(Booking.objects.filter(
+            passenger=self.request.user,
+            flight__in=[item['flight'] for item in items]
+        ).values_list('flight_id', flat=True))
+        errors = []
+        tickets = {}
+        bookings = {}
+        for item in items:
+            flight_id = item['flight'].pk
+            errors.append(NOT_UNIQUE_BOOKING if flight_id in booked_flights else {})
+            booked_flights.add(flight_id)
+            tickets[flight_id] = tickets.get(flight_id, 0) + item.get('number_of_tickets', 1)
+            bookings[flight_id] = bookings.get(flight_id, 0) + 1
+        if any(errors):
+            raise ValidationError(errors)
+        try:
+            with transaction.atomic():
+                full_flights = [
+                    flight_id for flight_id in sorted(tickets)
+                    if not reserve_seats(flight_id, tickets[flight_id], bookings=bookings[flight_id])
+                ]
+                if full_flights:
+                    raise ValidationError([
+                        NOT_ENOUGH_SEATS if item['flight'].pk in full_flights else {}
+                        for item in items
+                    ])
+                serializer.save(passenger=self.request.user)
+        except IntegrityError:
+            raise ValidationError([NOT_UNIQUE_BOOKING for item in items])
 
 
-class BookFlightDetailView(generics.RetrieveUpdateDestroyAPIView):
+class BookFlightDetailView(FastRetrieveMixin, generics.RetrieveUpdateDestroyAPIView):
     permission_classes = (IsAuthenticated, IsCurrentUserOwnerOrReadOnly)
     serializer_class = BookingSerializer
-    queryset = Booking.objects.all()
+    fast_serializer = fast_booking_serializer
+    queryset = Booking.objects.select_related('flight', 'passenger')
 
     def perform_update(self, serializer):
+        booking = serializer.instance
+        flight = serializer.validated_data.get('flight', booking.flight)
+        tickets = serializer.validated_data.get('number_of_tickets', booking.number_of_tickets)
         try:
-            serializer.save()
+            with transaction.atomic():
+                old_flight_id, old_tickets = Booking.objects.select_for_update().values_list(
+                    'flight_id', 'number_of_tickets').get(pk=booking.pk)
+                if not move_seats(old_flight_id, old_tickets, flight.pk, tickets):
+                    raise ValidationError(NOT_ENOUGH_SEATS)
+                serializer.save()
         except IntegrityError:
-            raise ValidationError({
-                'message': 'The flight and the passenger fields should be unique together'
-            })
+            raise ValidationError(NOT_UNIQUE_BOOKING)
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            reserved = Booking.objects.select_for_update().filter(pk=instance.pk).values_list(
+                'flight_id', 'number_of_tickets').first()
+            if reserved is not None:
+                instance.delete()
+                release_seats(*reserved, bookings=1)
 
 
 class UploadPassportView(APIView):
+    """
+    POST passport/ and PUT passport/ queue the scan for the upload workers
+    and answer 202 with the job, which can be polled at passport/jobs/<pk>.
+
+    Scans are streamed to a temporary file on disk, never into memory, and
+    requests larger than PASSPORT_UPLOAD_MAX_SIZE are refused before their
+    body is read.
+    """
     permission_classes = (IsAuthenticated, IsCurrentUserOwnerOrReadOnly)
     parser_classes = (
         MultiPartParser,
         JSONParser
     )
+    # room for the multipart boundaries and the other form fields
+    form_overhead = 64 * 1024
 
-    def post(self, request):
-        passport = request.data.get('passport')
+    def initialize_request(self, request, *args, **kwargs):
+        request.upload_handlers = [PassportUploadHandler(request)]
+        return super().initialize_request(request, *args, **kwargs)
 
-        upload_passport = cloudinary.uploader.upload(
-            passport,
-            eager=[
-                {"width": 1350, "height": 1200}
-            ]
-        )
-        data = {
-            "user": self.request.user.pk,
-            "passport_url": upload_passport['secure_url'],
-            "cloudinary_public_id": upload_passport['public_id']
-        }
-        serializer = ProfileSerializer(data=data)
-        serializer.is_valid(raise_exception=True)
-        serializer.save()
-        return Response({
-            "data": serializer.data
-        }, status=status.HTTP_201_CREATED)
+    def post(self, request):
+        passport = self.get_passport(request)
+        if Profile.objects.filter(user=request.user).exists():
+            raise ValidationError({
+                'user': ['profile with this user already exists.']
+            })
+        job = enqueue_passport_upload(request.user, passport)
+        return self.accepted(job)
 
     def put(self, request, *args, **kwargs):
+        passport = self.get_passport(request)
         passport_id = request.data.get('id')
         passport_to_update = get_object_or_404(Profile, id=passport_id)
+        job = enqueue_passport_upload(request.user, passport, profile=passport_to_update)
+        return self.accepted(job)
 
+    def get_passport(self, request):
+        try:
+            content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            content_length = 0
+        if content_length > settings.PASSPORT_UPLOAD_MAX_SIZE + self.form_overhead:
+            raise PayloadTooLarge()
         passport = request.data.get('passport')
+        rejected = getattr(request._request, 'passport_rejected', None)
+        if rejected == TOO_LARGE:
+            raise PayloadTooLarge()
+        if rejected == UNSUPPORTED_TYPE:
+            raise ValidationError({
+                'passport': ['The passport scan must be a JPEG, PNG or PDF file.']
+            })
+        if not hasattr(passport, 'chunks'):
+            raise ValidationError({
+                'passport': ['A passport scan file is required.']
+            })
+        return passport
 
-        upload_passport = cloudinary.uploader.upload(
-            passport,
-            public_id=passport_to_update.cloudinary_public_id,
-            eager=[
-                {"width": 1350, "height": 1200}
-            ]
-        )
-        data = {
-            "user": self.request.user.pk,
-            "passport_url": upload_passport['secure_url'],
-            "cloudinary_public_id": upload_passport['public_id']
-        }
-        serializer = ProfileSerializer(passport_to_update, data=data)
-        serializer.is_valid(raise_exception=True)
-        serializer.save()
+    def accepted(self, job):
+        serializer = PassportUploadSerializer(job, context={'request': self.request})
         return Response({
             "data": serializer.data
-        }, status=status.HTTP_200_OK)
+        }, status=status.HTTP_202_ACCEPTED)
+
+
+class PassportUploadStatusView(generics.RetrieveAPIView):
+    """
+    GET passport/jobs/<pk>
+    """
+    permission_classes = (IsAuthenticated,)
+    serializer_class = PassportUploadSerializer
+
+    def get_queryset(self):
+        return PassportUpload.objects.filter(user=self.request.user).select_related('profile')
@@ -0,0 +1,65 @@
+"""
+Requests per second of auth/login/ against auth/refresh/ on one core.
+
+    python benchmarks/auth_throughput.py [--requests 200]
+
+Both endpoints are driven through the Django test client, one request at
+a time, against a throwaway test database. A login checks the password
+with the configured hasher; a refresh only verifies and re-signs the
+token. Needs the usual settings environment (.env) and a database the
+configured user may create a test database in.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'airtech.settings')
+
+
+def measure(client, path, body, requests):
+    started = time.perf_counter()
+    for _ in range(requests):
+        response = client.post(path, data=json.dumps(body), content_type='application/json')
+        assert response.status_code == 200, response.content
+    return requests / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=200)
+    args = parser.parse_args()
+
+    import django
+    django.setup()
+    from django.contrib.auth import get_user_model
+    from django.db import connection
+    from django.test import Client
+    from django.test.utils import setup_test_environment, teardown_test_environment
+    from django.urls import reverse
+
+    setup_test_environment()
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        get_user_model().objects.create_user(username='bench', password='benchpassword')
+        client = Client()
+        credentials = {'username': 'bench', 'password': 'benchpassword'}
+        token = client.post(
+            reverse('auth-login'), data=json.dumps(credentials), content_type='application/json'
+        ).data['token']
+
+        login = measure(client, reverse('auth-login'), credentials, args.requests)
+        refresh = measure(client, reverse('auth-refresh'), {'token': token}, args.requests)
+        print('{} sequential requests'.format(args.requests))
+        print('login   {:8.1f} req/s'.format(login))
+        print('refresh {:8.1f} req/s  ({:.1f}x)'.format(refresh, refresh / login))
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+if __name__ == '__main__':
+    main()
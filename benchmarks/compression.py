@@ -0,0 +1,82 @@
+"""
+Bytes on the wire and CPU per request for a 5000-row flight list.
+
+    python benchmarks/compression.py [--flights 5000] [--requests 20]
+
+flight/ is requested for one page of `--flights` rows (the benchmark
+lifts the 500 row page limit) with no compression, gzip and brotli.
+Each encoding is measured with a cold catalog cache, where every request
+queries, renders and compresses, and with a warm one, where the payload
+and its compressed body are reused. CPU time is this process's, so the
+database server is not counted. Needs the usual settings environment
+(.env) and a database the configured user may create a test database in.
+"""
+import argparse
+import datetime
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'airtech.settings')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--flights', type=int, default=5000)
+    parser.add_argument('--requests', type=int, default=20)
+    args = parser.parse_args()
+
+    import django
+    django.setup()
+    from django.contrib.auth import get_user_model
+    from django.core.cache import caches
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+    from django.urls import reverse
+    from rest_framework.test import APIClient
+    from airtechapi.models import Flight
+    from airtechapi.pagination import FlightCursorPagination
+
+    FlightCursorPagination.max_page_size = args.flights
+    encodings = [('identity', ''), ('gzip', 'gzip'), ('br', 'br')]
+
+    setup_test_environment()
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        user = get_user_model().objects.create_user(username='bench', password='benchpassword')
+        departure = datetime.date(2030, 1, 1)
+        Flight.objects.bulk_create([
+            Flight(
+                origin='Lagos', destination='Abuja', departure=departure, arrival=departure,
+                flight_number='BK{:05d}'.format(number), airline='Arik', price=10000 + number,
+                flight_status='SDLE'[number % 4]
+            ) for number in range(args.flights)
+        ])
+        client = APIClient()
+        client.force_authenticate(user)
+        url = reverse('flight-list') + '?page_size={}'.format(args.flights)
+
+        print('{} rows per response, {} requests each'.format(args.flights, args.requests))
+        print('{:<9} {:>12} {:>14} {:>14}'.format('encoding', 'bytes', 'cold cpu/req', 'warm cpu/req'))
+        for name, accept in encodings:
+            cpu = {}
+            for mode in ('cold', 'warm'):
+                caches['catalog'].clear()
+                size = len(client.get(url, HTTP_ACCEPT_ENCODING=accept).content)
+                started = time.process_time()
+                for _ in range(args.requests):
+                    if mode == 'cold':
+                        caches['catalog'].clear()
+                    response = client.get(url, HTTP_ACCEPT_ENCODING=accept)
+                    assert response.get('Content-Encoding', 'identity') == name
+                cpu[mode] = (time.process_time() - started) / args.requests
+            print('{:<9} {:>12} {:>11.1f} ms {:>11.1f} ms'.format(name, size, cpu['cold'] * 1000, cpu['warm'] * 1000))
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+if __name__ == '__main__':
+    main()
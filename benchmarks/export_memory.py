@@ -0,0 +1,82 @@
+"""
+Peak Python memory of the streaming flight export against rendering the
+same flights as one JSON document.
+
+    python benchmarks/export_memory.py [--flights 20000]
+
+The NDJSON export is consumed chunk by chunk for `--flights` flights and
+for four times as many, and its peak traced allocation is compared with
+serializing every flight through FLightSerializer and JSONRenderer, as
+an unpaginated list view would. Needs the usual settings environment
+(.env) and a database the configured user may create a test database in.
+"""
+import argparse
+import datetime
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'airtech.settings')
+
+
+def peak(run):
+    tracemalloc.start()
+    started = time.perf_counter()
+    size = run()
+    elapsed = time.perf_counter() - started
+    _, highest = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return highest / 1024 / 1024, size / 1024 / 1024, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--flights', type=int, default=20000)
+    args = parser.parse_args()
+
+    import django
+    django.setup()
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+    from rest_framework.renderers import JSONRenderer
+    from airtechapi.models import Flight
+    from airtechapi.renderers import NDJSONRenderer
+    from airtechapi.serializers import FLightSerializer
+    from airtechapi.utils.exports import stream_export
+
+    def add_flights(start, count):
+        departure = datetime.date(2030, 1, 1)
+        Flight.objects.bulk_create([
+            Flight(
+                origin='Lagos', destination='Abuja', departure=departure, arrival=departure,
+                flight_number='BK{:05d}'.format(number), airline='Arik', price=10000 + number
+            ) for number in range(start, start + count)
+        ], batch_size=5000)
+
+    def export():
+        return sum(len(chunk) for chunk in stream_export('flights', NDJSONRenderer()))
+
+    def materialize():
+        return len(JSONRenderer().render(FLightSerializer(Flight.objects.all(), many=True).data))
+
+    setup_test_environment()
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        print('{:<10} {:<12} {:>10} {:>10} {:>8}'.format('flights', '', 'peak MB', 'output MB', 'seconds'))
+        total = 0
+        for count in (args.flights, args.flights * 3):
+            add_flights(total, count)
+            total += count
+            for name, run in (('export', export), ('materialize', materialize)):
+                print('{:<10} {:<12} {:>10.1f} {:>10.1f} {:>8.2f}'.format(total, name, *peak(run)))
+    finally:
+        connection.close()
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+Size and client decode time of the flight list in each list format.
+
+    python benchmarks/list_formats.py [--flights 10000] [--repeat 5]
+
+The `--flights` flights are fetched from flight/ in pages of 500 as
+JSON, columnar JSON and MessagePack. For
+each format the body size, its gzip size and the best of `--repeat`
+parses of every page are reported. Needs the usual settings environment
+(.env) and a database the configured user may create a test database in.
+"""
+import argparse
+import datetime
+import gzip
+import json
+import msgpack
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'airtech.settings')
+
+
+def count_rows(results):
+    if isinstance(results, dict):
+        return len(next(iter(results.values()), []))
+    return len(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--flights', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    import django
+    django.setup()
+    from django.contrib.auth import get_user_model
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+    from django.urls import reverse
+    from rest_framework.test import APIClient
+    from airtechapi.models import Flight
+
+    formats = [
+        ('json', 'application/json', json.loads),
+        ('columnar', 'application/vnd.airtech.columnar+json', json.loads),
+        ('msgpack', 'application/msgpack', msgpack.unpackb),
+    ]
+
+    setup_test_environment()
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        user = get_user_model().objects.create_user(username='bench', password='benchpassword')
+        departure = datetime.date(2030, 1, 1)
+        Flight.objects.bulk_create([
+            Flight(
+                origin='Lagos', destination='Abuja', departure=departure, arrival=departure,
+                flight_number='BK{:05d}'.format(number), airline='Arik', price=10000 + number,
+                flight_status='SDLE'[number % 4]
+            ) for number in range(args.flights)
+        ])
+        client = APIClient()
+        client.force_authenticate(user)
+
+        print('{} flights in pages of 500, decode best of {}'.format(args.flights, args.repeat))
+        pages = []
+        cursor = reverse('flight-list') + '?page_size=500'
+        while cursor:
+            pages.append(cursor)
+            cursor = client.get(cursor).data['next']
+        for name, media_type, decode in formats:
+            bodies = [client.get(page, HTTP_ACCEPT=media_type).content for page in pages]
+            size = sum(len(body) for body in bodies)
+            compressed = sum(len(gzip.compress(body)) for body in bodies)
+            best = min(timed(lambda: [decode(body) for body in bodies]) for _ in range(args.repeat))
+            rows = sum(count_rows(decode(body)['results']) for body in bodies)
+            assert rows == args.flights
+            print('{:<9} {:>9} bytes  gzip {:>8} bytes  decode {:7.1f} ms'.format(name, size, compressed, best * 1000))
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+def timed(run):
+    started = time.perf_counter()
+    run()
+    return time.perf_counter() - started
+
+
+if __name__ == '__main__':
+    main()
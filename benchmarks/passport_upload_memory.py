@@ -0,0 +1,133 @@
+"""
+Peak RSS of a web worker receiving concurrent passport uploads.
+
+    python benchmarks/passport_upload_memory.py [--uploads 20] [--size-mb 10]
+
+Each mode parses `--uploads` multipart requests of `--size-mb` each on as
+many threads and holds them until all are done, in a fresh interpreter:
+
+    legacy   Django's default upload handlers, then the upload read into
+             memory the way cloudinary.uploader.upload() reads a file
+             object, as UploadPassportView did on the request thread.
+    spooled  UploadPassportView's PassportUploadHandler, then
+             spool_passport() moving the temporary file into the spool.
+
+Request bodies are streamed from a file on disk so the client side does
+not count towards the measured RSS. Needs the usual settings environment
+(.env) but no database access.
+"""
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'airtech.settings')
+
+BOUNDARY = 'BenchmarkBoundary'
+MODES = ('legacy', 'spooled')
+
+
+def write_body(path, size):
+    with open(path, 'wb') as body:
+        body.write((
+            '--{0}\r\n'
+            'Content-Disposition: form-data; name="passport"; filename="passport.jpg"\r\n'
+            'Content-Type: image/jpeg\r\n\r\n'
+        ).format(BOUNDARY).encode('ascii'))
+        body.write(b'\xff\xd8\xff\xe0')
+        chunk = os.urandom(1024 * 1024)
+        written = 4
+        while written < size:
+            body.write(chunk[:size - written])
+            written += len(chunk[:size - written])
+        body.write('\r\n--{0}--\r\n'.format(BOUNDARY).encode('ascii'))
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run(mode, body_path, uploads, spool_dir):
+    import django
+    django.setup()
+    from django.conf import settings
+    from django.core.handlers.wsgi import WSGIRequest
+    from rest_framework.parsers import MultiPartParser
+    from rest_framework.request import Request
+    from airtechapi.utils.uploads import spool_passport
+    from airtechapi.views import UploadPassportView
+
+    settings.PASSPORT_SPOOL_DIR = spool_dir
+    settings.PASSPORT_UPLOAD_MAX_SIZE = os.path.getsize(body_path)
+    all_parsed = threading.Barrier(uploads)
+    errors = []
+
+    def upload():
+        with open(body_path, 'rb') as body:
+            request = WSGIRequest({
+                'REQUEST_METHOD': 'POST',
+                'PATH_INFO': '/passport/',
+                'SERVER_NAME': 'testserver',
+                'SERVER_PORT': '80',
+                'wsgi.input': body,
+                'CONTENT_TYPE': 'multipart/form-data; boundary={}'.format(BOUNDARY),
+                'CONTENT_LENGTH': str(os.path.getsize(body_path)),
+            })
+            try:
+                if mode == 'legacy':
+                    passport = Request(request, parsers=[MultiPartParser()]).data['passport']
+                    held = passport.read()
+                else:
+                    passport = UploadPassportView().initialize_request(request).data['passport']
+                    held = spool_passport(passport)
+            except Exception as error:
+                errors.append(error)
+                held = None
+            all_parsed.wait()
+            return held
+
+    baseline = peak_rss_mb()
+    threads = [threading.Thread(target=upload) for _ in range(uploads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+    print('{:<8} baseline {:7.1f} MB  peak {:7.1f} MB  growth {:7.1f} MB'.format(
+        mode, baseline, peak_rss_mb(), peak_rss_mb() - baseline))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--uploads', type=int, default=20)
+    parser.add_argument('--size-mb', type=int, default=10)
+    parser.add_argument('--mode', choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument('--body', help=argparse.SUPPRESS)
+    parser.add_argument('--spool', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        run(args.mode, args.body, args.uploads, args.spool)
+        return
+
+    with tempfile.TemporaryDirectory() as workdir:
+        body_path = os.path.join(workdir, 'body')
+        write_body(body_path, args.size_mb * 1024 * 1024)
+        print('{} concurrent uploads of {} MB'.format(args.uploads, args.size_mb))
+        for mode in MODES:
+            subprocess.run([
+                sys.executable, __file__,
+                '--mode', mode,
+                '--body', body_path,
+                '--spool', os.path.join(workdir, 'spool'),
+                '--uploads', str(args.uploads),
+            ], check=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+Rows per second of FLightSerializer against its compiled fast path.
+
+    python benchmarks/serializer_throughput.py [--flights 10000] [--repeat 5]
+
+Both paths render `--flights` flights to JSON with JSONRenderer, first
+including the query (model instances against `.values()` rows), then
+from rows already fetched to time serialization alone. The best of
+`--repeat` runs is reported. Needs the usual settings environment (.env)
+and a database the configured user may create a test database in.
+"""
+import argparse
+import datetime
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'airtech.settings')
+
+
+def best_rate(run, rows, repeat):
+    best = min(timed(run) for _ in range(repeat))
+    return rows / best
+
+
+def timed(run):
+    started = time.perf_counter()
+    run()
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--flights', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    import django
+    django.setup()
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+    from rest_framework.renderers import JSONRenderer
+    from airtechapi.fast_serializers import fast_flight_serializer
+    from airtechapi.models import Flight
+    from airtechapi.serializers import FLightSerializer
+
+    setup_test_environment()
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        departure = datetime.date(2030, 1, 1)
+        Flight.objects.bulk_create([
+            Flight(
+                origin='Lagos', destination='Abuja', departure=departure, arrival=departure,
+                flight_number='BK{:05d}'.format(number), airline='Arik', price=10000 + number
+            ) for number in range(args.flights)
+        ])
+        renderer = JSONRenderer()
+        queryset = Flight.objects.all()
+        instances = list(queryset)
+        rows = list(fast_flight_serializer.values(queryset))
+        assert renderer.render(FLightSerializer(instances, many=True).data) == \
+            renderer.render(fast_flight_serializer.serialize(rows))
+
+        print('{} flights, best of {}'.format(args.flights, args.repeat))
+        print('{:<24} {:>12} {:>12}'.format('', 'with query', 'serialize'))
+        for name, with_query, serialize_only in (
+            ('FLightSerializer',
+             lambda: renderer.render(FLightSerializer(queryset.all(), many=True).data),
+             lambda: renderer.render(FLightSerializer(instances, many=True).data)),
+            ('fast_flight_serializer',
+             lambda: renderer.render(fast_flight_serializer.serialize(fast_flight_serializer.values(queryset))),
+             lambda: renderer.render(fast_flight_serializer.serialize(rows))),
+        ):
+            print('{:<24} {:>8.0f} r/s {:>8.0f} r/s'.format(
+                name,
+                best_rate(with_query, args.flights, args.repeat),
+                best_rate(serialize_only, args.flights, args.repeat)
+            ))
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+if __name__ == '__main__':
+    main()
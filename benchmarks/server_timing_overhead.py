@@ -0,0 +1,92 @@
+"""
+Cost of ServerTimingMiddleware on flight/search/ requests.
+
+    python benchmarks/server_timing_overhead.py [--requests 500]
+
+The same page of 50 flights is requested through the Django test client
+without the middleware, with it sampling no request and with it timing
+every request, and the best of three rounds is reported. flight/search/
+is used because it is not cached. Needs the usual settings environment
+(.env) and a database the configured user may create a test database in.
+"""
+import argparse
+import datetime
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'airtech.settings')
+
+
+def make_client(token):
+    from rest_framework.test import APIClient
+
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION='JWT ' + token)
+    return client
+
+
+def measure(client, path, requests):
+    started = time.perf_counter()
+    for _ in range(requests):
+        response = client.get(path)
+        assert response.status_code == 200, response.content
+    return requests / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=500)
+    args = parser.parse_args()
+
+    import django
+    django.setup()
+    from django.conf import settings
+    from django.contrib.auth import get_user_model
+    from django.db import connection
+    from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+    from django.urls import reverse
+    from rest_framework.test import APIClient
+    from airtechapi.models import Flight
+
+    logging.getLogger('airtechapi.timing').disabled = True
+    setup_test_environment()
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        departure = datetime.date(2030, 1, 1)
+        Flight.objects.bulk_create([
+            Flight(
+                origin='Lagos', destination='Abuja', departure=departure, arrival=departure,
+                flight_number='BK{:05d}'.format(number), airline='Arik', price=10000 + number
+            ) for number in range(200)
+        ])
+        get_user_model().objects.create_user(username='bench', password='benchpassword')
+        token = APIClient().post(
+            reverse('auth-login'), {'username': 'bench', 'password': 'benchpassword'}, format='json'
+        ).data['token']
+        path = reverse('flight-search') + '?origin=Lagos&page_size=50'
+        without = [name for name in settings.MIDDLEWARE if not name.endswith('ServerTimingMiddleware')]
+
+        print('{} sequential requests of 50 flights'.format(args.requests))
+        for name, overrides in (
+            ('no middleware', {'MIDDLEWARE': without}),
+            ('sample rate 0', {'SERVER_TIMING_SAMPLE_RATE': 0.0}),
+            ('sample rate 1', {'SERVER_TIMING_SAMPLE_RATE': 1.0}),
+        ):
+            with override_settings(**overrides):
+                # a new client loads the middleware of these settings
+                client = make_client(token)
+                measure(client, path, 50)
+                rate = max(measure(client, path, args.requests) for _ in range(3))
+            print('{:<14} {:8.1f} req/s'.format(name, rate))
+    finally:
+        connection.close()
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+"""
+Memory per idle flight/<pk>/events subscriber and the time to fan a
+status change out to all of them.
+
+    python benchmarks/sse_subscribers.py [--subscribers 5000]
+
+The application runs in a separate, thread-per-connection WSGI server
+process against a throwaway test database. The benchmark opens
+`--subscribers` streams, waits until each has received its snapshot
+event, and reads the growth of the server's resident memory. It then
+changes the flight's status through flight/status/ and times until every
+stream has received the change. Needs the usual settings environment
+(.env), a database the configured user may create a test database in,
+and a file descriptor limit above the subscriber count.
+"""
+import argparse
+import json
+import os
+import selectors
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'airtech.settings')
+
+
+def serve():
+    from socketserver import ThreadingMixIn
+    from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+    from django.conf import settings
+    from airtech.wsgi import application
+
+    settings.ALLOWED_HOSTS = ['127.0.0.1']
+
+    class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+        daemon_threads = True
+        request_queue_size = 1024
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_message(self, *args):
+            pass
+
+    server = make_server('127.0.0.1', 0, application, ThreadingWSGIServer, QuietHandler)
+    print(server.server_port, flush=True)
+    server.serve_forever()
+
+
+def server_status(pid):
+    status = {}
+    with open('/proc/{}/status'.format(pid)) as lines:
+        for line in lines:
+            key, _, value = line.partition(':')
+            status[key] = value.strip()
+    return int(status['VmRSS'].split()[0]) / 1024, int(status['Threads'])
+
+
+def subscribe(port, path, token, count):
+    """
+    Open `count` streams and return their sockets once every one has
+    received its first status event.
+    """
+    request = (
+        'GET {} HTTP/1.1\r\nHost: 127.0.0.1\r\nAccept: text/event-stream\r\n'
+        'Authorization: JWT {}\r\n\r\n'
+    ).format(path, token).encode('ascii')
+    selector = selectors.DefaultSelector()
+    sockets = []
+    for _ in range(count):
+        sock = socket.create_connection(('127.0.0.1', port))
+        sock.sendall(request)
+        sock.setblocking(False)
+        selector.register(sock, selectors.EVENT_READ, [b''])
+        sockets.append(sock)
+    wait_for_event(selector, sockets, b'event: status')
+    return selector, sockets
+
+
+def wait_for_event(selector, sockets, marker, timeout=120):
+    pending = set(sockets)
+    deadline = time.monotonic() + timeout
+    while pending and time.monotonic() < deadline:
+        for key, _ in selector.select(timeout=1):
+            if key.fileobj not in pending:
+                key.fileobj.recv(65536)
+                continue
+            buffered = key.data[0] + key.fileobj.recv(65536)
+            if marker in buffered:
+                pending.discard(key.fileobj)
+                buffered = b''
+            key.data[0] = buffered
+    if pending:
+        raise RuntimeError('{} streams did not receive {!r}'.format(len(pending), marker))
+
+
+def close(selector, sockets):
+    for sock in sockets:
+        selector.unregister(sock)
+        sock.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--subscribers', type=int, default=5000)
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve()
+        return
+
+    import django
+    django.setup()
+    from django.contrib.auth import get_user_model
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+    from django.urls import reverse
+    from rest_framework.test import APIClient
+    from airtechapi.models import Flight
+
+    setup_test_environment()
+    old_name = connection.settings_dict['NAME']
+    test_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    server = None
+    try:
+        get_user_model().objects.create_superuser(username='bench', email='bench@mail.com', password='benchpassword')
+        flight = Flight.objects.create(
+            origin='Lagos', destination='Abuja', departure='2030-01-01', arrival='2030-01-01',
+            flight_number='BK 0001', airline='Arik', price=10000
+        )
+        token = APIClient().post(
+            reverse('auth-login'), {'username': 'bench', 'password': 'benchpassword'}, format='json'
+        ).data['token']
+        connection.close()
+
+        server = subprocess.Popen(
+            [sys.executable, __file__, '--serve'],
+            env=dict(os.environ, NAME=test_name), stdout=subprocess.PIPE
+        )
+        port = int(server.stdout.readline())
+        path = reverse('flight-events', kwargs={'pk': flight.pk})
+
+        # warm up imports, caches and the thread machinery
+        close(*subscribe(port, path, token, 20))
+        time.sleep(1)
+        baseline, threads = server_status(server.pid)
+
+        started = time.perf_counter()
+        selector, sockets = subscribe(port, path, token, args.subscribers)
+        connected = time.perf_counter() - started
+        time.sleep(1)
+        loaded, loaded_threads = server_status(server.pid)
+
+        started = time.perf_counter()
+        urllib.request.urlopen(urllib.request.Request(
+            'http://127.0.0.1:{}{}'.format(port, reverse('flight-status')),
+            data=json.dumps([{'flight_number': 'BK 0001', 'flight_status': 'D'}]).encode('utf-8'),
+            headers={'Authorization': 'JWT ' + token, 'Content-Type': 'application/json'}
+        )).read()
+        wait_for_event(selector, sockets, b'"flight_status":"D"')
+        fanned_out = time.perf_counter() - started
+        close(selector, sockets)
+
+        print('{} idle subscribers, connected in {:.1f} s'.format(args.subscribers, connected))
+        print('server RSS {:.1f} MB -> {:.1f} MB, threads {} -> {}'.format(
+            baseline, loaded, threads, loaded_threads))
+        print('per subscriber {:.1f} KB'.format((loaded - baseline) * 1024 / args.subscribers))
+        print('status change reached every subscriber in {:.3f} s'.format(fanned_out))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+        connection.close()
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+if __name__ == '__main__':
+    main()
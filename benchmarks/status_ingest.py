@@ -0,0 +1,82 @@
+"""
+Flight status updates per second through flight/status/ on one worker.
+
+    python benchmarks/status_ingest.py [--flights 10000] [--batch-size 1000]
+
+Every flight gets a new status in each round, sent in batches of
+`--batch-size` through the Django test client against a throwaway test
+database. A second pass resends the same statuses to time the no-op
+path. Needs the usual settings environment (.env) and a database the
+configured user may create a test database in.
+"""
+import argparse
+import datetime
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'airtech.settings')
+
+
+def send(client, path, updates, batch_size):
+    started = time.perf_counter()
+    for start in range(0, len(updates), batch_size):
+        response = client.post(
+            path, data=json.dumps(updates[start:start + batch_size]), content_type='application/json'
+        )
+        assert response.status_code == 200, response.content
+    return len(updates) / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--flights', type=int, default=10000)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    import django
+    django.setup()
+    from django.contrib.auth import get_user_model
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+    from django.urls import reverse
+    from rest_framework.test import APIClient
+    from airtechapi.models import Flight
+
+    setup_test_environment()
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        get_user_model().objects.create_superuser(username='bench', email='bench@mail.com', password='benchpassword')
+        departure = datetime.date.today()
+        Flight.objects.bulk_create([
+            Flight(
+                origin='Lagos', destination='Abuja', departure=departure, arrival=departure,
+                flight_number='BK{:05d}'.format(number), airline='Arik', price=10000
+            ) for number in range(args.flights)
+        ])
+        client = APIClient()
+        token = client.post(
+            reverse('auth-login'),
+            data=json.dumps({'username': 'bench', 'password': 'benchpassword'}),
+            content_type='application/json'
+        ).data['token']
+        client.credentials(HTTP_AUTHORIZATION='JWT ' + token)
+
+        path = reverse('flight-status')
+        updates = [
+            {'flight_number': 'BK{:05d}'.format(number), 'flight_status': ('D', 'E', 'L')[number % 3]}
+            for number in range(args.flights)
+        ]
+        print('{} flights in batches of {}'.format(args.flights, args.batch_size))
+        print('changed {:9.0f} updates/s'.format(send(client, path, updates, args.batch_size)))
+        print('no-op   {:9.0f} updates/s'.format(send(client, path, updates, args.batch_size)))
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+if __name__ == '__main__':
+    main()